@@ -0,0 +1,66 @@
+from collections import deque
+from copy import deepcopy
+
+import pytest
+
+from lumapps.testing import MockLumApps
+from lumapps.utils import DiscoveryCache
+
+from .conftest import DISCOVERY
+
+CONTENT = {
+    "uid": "1234",
+    "title": {"en": "A content"},
+    "lastRevision": {"uid": "5678"},
+    "authorDetails": {"email": "author@lumapps.com"},
+    "properties": {"duplicateContent": True, "layout": "default"},
+}
+
+
+@pytest.mark.parametrize("cache", ["cold", "persistent", "warm"])
+def test_client_construction(benchmark, server, cache):
+    """Build a client and its service, with the discovery document fetched
+    from the server (cold), read from the configuration file (persistent) or
+    already parsed (warm).
+    """
+    server.client(http=None).service  # fill the caches
+
+    def setup():
+        if cache != "warm":
+            DiscoveryCache.invalidate(persistent=cache == "cold")
+
+    benchmark.pedantic(lambda: server.client(http=None).service, setup=setup, rounds=20)
+
+
+def test_walk_api_methods(benchmark, api):
+    resource = api.service._resourceDesc
+    benchmark(lambda: deque(api.walk_api_methods(resource), maxlen=0))
+
+
+@pytest.mark.parametrize("count", [10000, 100000])
+@pytest.mark.parametrize("method", ["get_call", "iter_call"])
+def test_pagination(benchmark, method, count):
+    api = MockLumApps(DISCOVERY, users=count, page_size=100).client()
+    if method == "get_call":
+        benchmark.pedantic(api.get_call, args=("user", "list"), rounds=3)
+    else:
+        benchmark.pedantic(
+            lambda: deque(api.iter_call("user", "list"), maxlen=0), rounds=3
+        )
+
+
+@pytest.mark.parametrize("method", ["content/list", "template/get", "user/list"])
+def test_prune(benchmark, mock, method):
+    """Prune 1000 items, as iter_call does."""
+    api = mock.client(prune=True)
+    method_parts = tuple(method.split("/"))
+
+    def prune_all(items):
+        for item in items:
+            api._prune(method_parts, item)
+
+    benchmark.pedantic(
+        prune_all,
+        setup=lambda: (([deepcopy(CONTENT) for _ in range(1000)],), {}),
+        rounds=50,
+    )
@@ -0,0 +1,76 @@
+import csv
+from collections import deque
+
+import pytest
+
+from lumapps.helpers import community, group, user
+from lumapps.helpers.utils import nested_findall, read_csv_data
+from lumapps.testing import make_community, make_feed, make_user
+
+
+def make_writable_community(i):
+    """The fields a Community accepts from a representation (not forced)."""
+    fields = ("title", "status", "instance", "adminKeys")
+    return {k: v for k, v in make_community(i).items() if k in fields}
+
+
+def make_tree(depth, width=3):
+    """A content template like tree of ``width ** depth`` widgets."""
+    node = {
+        "uuid": "widget-{}".format(depth),
+        "properties": {"style": {"main": {"margin": {"top": 0}}}},
+        "title": {"en": "Widget"},
+    }
+    if depth:
+        node["cells"] = [
+            {"uuid": "cell", "components": [make_tree(depth - 1, width)]}
+            for _ in range(width)
+        ]
+    return node
+
+
+def test_nested_findall(benchmark):
+    tree = make_tree(7)
+    benchmark(lambda: deque(nested_findall("uuid", tree), maxlen=0))
+
+
+def test_user_to_lumapps_dict(benchmark, api):
+    users = [user.User(api, representation=make_user(i)) for i in range(1000)]
+    benchmark(lambda: [u.to_lumapps_dict() for u in users])
+
+
+@pytest.mark.parametrize(
+    "module,factory",
+    [(user, make_user), (group, make_feed), (community, make_writable_community)],
+    ids=["users", "groups", "communities"],
+)
+def test_build_batch(benchmark, api, module, factory):
+    representations = [factory(i) for i in range(1000)]
+    benchmark(lambda: deque(module.build_batch(api, representations), maxlen=0))
+
+
+@pytest.fixture(scope="module")
+def csv_path(tmpdir_factory):
+    path = str(tmpdir_factory.mktemp("csv").join("users.csv"))
+    with open(path, "w") as fh:
+        writer = csv.writer(fh)
+        writer.writerow(["email", "firstName", "lastName", "group"])
+        for i in range(100000):
+            writer.writerow(
+                [
+                    "user{}@example.com".format(i),
+                    "First{}".format(i),
+                    "Last{}".format(i),
+                    "group{}".format(i // 100),
+                ]
+            )
+    return path
+
+
+@pytest.mark.parametrize("group_by", [None, "group"])
+def test_read_csv_data(benchmark, csv_path, group_by):
+    def read():
+        for rows in read_csv_data(csv_path, group_by=group_by):
+            deque(rows, maxlen=0)
+
+    benchmark.pedantic(read, rounds=5)
@@ -0,0 +1,29 @@
+import os
+import subprocess
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+@pytest.mark.parametrize(
+    "statement",
+    [
+        "pass",
+        "import lumapps.cli",
+        "import lumapps.client",
+        "from lumapps.client import ApiClient; ApiClient(token='t')",
+    ],
+)
+def test_import_time(benchmark, statement):
+    """Startup time of a new interpreter running ``statement``, e.g. what lac
+    pays on every invocation ("pass" is the interpreter alone).
+    """
+    env = dict(os.environ, PYTHONPATH=ROOT)
+    benchmark.pedantic(
+        subprocess.check_call,
+        args=([sys.executable, "-c", statement],),
+        kwargs={"env": env},
+        rounds=10,
+    )
@@ -0,0 +1,40 @@
+import os
+
+import pytest
+
+from lumapps.testing import MockLumApps, MockLumAppsServer
+
+DISCOVERY = os.path.join(
+    os.path.dirname(__file__), os.pardir, "tests", "test_data", "lumapps_discovery.json"
+)
+
+
+@pytest.fixture(scope="session")
+def conf_dir(tmpdir_factory):
+    """Keep the DiscoveryCache of the benchmarks out of the user configuration."""
+    previous = os.environ.get("XDG_CONFIG_HOME")
+    os.environ["XDG_CONFIG_HOME"] = str(tmpdir_factory.mktemp("config"))
+    yield os.environ["XDG_CONFIG_HOME"]
+    if previous is None:
+        del os.environ["XDG_CONFIG_HOME"]
+    else:
+        os.environ["XDG_CONFIG_HOME"] = previous
+
+
+@pytest.fixture(scope="session")
+def server(conf_dir):
+    with MockLumAppsServer(MockLumApps(DISCOVERY)) as server:
+        yield server
+
+
+@pytest.fixture
+def mock():
+    return MockLumApps(DISCOVERY)
+
+
+@pytest.fixture
+def api(mock):
+    api = mock.client()
+    # the helpers read the customer of the objects from the client
+    api.customer = api.customerId = "customer"
+    return api
@@ -0,0 +1,257 @@
+"""The AsyncApiClient, imported from lumapps.async_client.
+
+This module is python 3 only: it is not parsed under python 2.
+"""
+import asyncio
+import json
+import random
+
+import httplib2
+from googleapiclient.errors import HttpError
+
+from lumapps.client import ApiClient
+from lumapps.instrumentation import CallEvent
+from lumapps.retry import parse_retry_after
+from lumapps.utils import ApiCallError, SpooledList
+
+try:
+    import aiohttp
+except ImportError:  # pragma: no cover
+    aiohttp = None
+
+
+class AsyncApiClient(ApiClient):
+    """
+        An ApiClient whose API calls are coroutines. It accepts the same
+        arguments as the ApiClient, plus:
+
+        Args:
+            max_connections (int): Maximum number of simultaneous connections
+                to the API. Defaults to 100.
+            session (aiohttp.ClientSession): An existing session to send the
+                requests with. By default the client creates its own session,
+                closed by ``close()``.
+
+        Example:
+            Fetch many users concurrently from a single event loop:
+
+                >>> async with AsyncApiClient(token=token) as api:
+                ...     users = await asyncio.gather(
+                ...         *(api.get_call("user", "get", email=e) for e in emails)
+                ...     )
+    """
+
+    def __init__(self, *args, **kwargs):
+        if aiohttp is None:
+            raise ImportError("AsyncApiClient requires aiohttp (pip install aiohttp)")
+        self.max_connections = kwargs.pop("max_connections", 100)
+        self._session = kwargs.pop("session", None)
+        self._own_session = self._session is None
+        super(AsyncApiClient, self).__init__(*args, **kwargs)
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.close()
+
+    async def close(self):
+        if self._own_session and self._session is not None:
+            await self._session.close()
+            self._session = None
+
+    @property
+    def session(self):
+        if self._session is None:
+            self._session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=self.max_connections)
+            )
+        return self._session
+
+    async def _auth_headers(self):
+        self._check_access_token()
+        headers = {}
+        if self.creds is None:
+            return headers
+        if not self.creds.valid:
+            from google.auth.transport.requests import Request
+
+            loop = asyncio.get_event_loop()
+            await loop.run_in_executor(None, self.creds.refresh, Request())
+        self.creds.apply(headers)
+        return headers
+
+    async def _execute(self, request, page=None, cursor=None):
+        """Send a googleapiclient HttpRequest through the aiohttp session and
+        post-process its response the same way ``request.execute()`` does.
+        """
+        if self.instrumentation is None:
+            return await self._send_async(request)
+        event = CallEvent(request.methodId.split(".")[1:], page, cursor)
+        self.instrumentation.before_call(event)
+        try:
+            response = await self._send_async(request, event)
+        except Exception as err:
+            event.finish(err)
+            raise
+        else:
+            event.finish()
+        finally:
+            self.instrumentation.after_call(event)
+        return response
+
+    async def _send_async(self, request, event=None):
+        headers = dict(request.headers)
+        headers.update(await self._auth_headers())
+        attempt = 0
+        while True:
+            if self.rate_limiter is not None:
+                # the buckets block while waiting, keep them off the event loop
+                loop = asyncio.get_event_loop()
+                method_parts = tuple(request.methodId.split(".")[1:])
+                await loop.run_in_executor(
+                    None, self.rate_limiter.acquire, method_parts
+                )
+            async with self.session.request(
+                request.method, request.uri, data=request.body, headers=headers
+            ) as http_response:
+                content = await http_response.read()
+                info = dict(http_response.headers)
+                info["status"] = http_response.status
+            resp = httplib2.Response(info)
+            if event is not None:
+                event.attempts += 1
+                event.status = resp.status
+                event.bytes += len(content)
+            if self.retry_policy is not None:
+                if not self.retry_policy.should_retry(resp.status, attempt):
+                    break
+                retry_after = parse_retry_after(resp.get("retry-after"))
+                delay = self.retry_policy.get_delay(attempt, retry_after)
+            elif (resp.status == 429 or resp.status >= 500) and (
+                attempt < self.num_retries
+            ):
+                delay = random.random() * 2 ** (attempt + 1)
+            else:
+                break
+            attempt += 1
+            await asyncio.sleep(delay)
+        if resp.status >= 300:
+            raise HttpError(resp, content, uri=request.uri)
+        return request.postproc(resp, content)
+
+    async def _aiter_pages(self, method_parts, params, cursor=None):
+        if self._service is None:
+            # building the service may fetch the discovery document
+            loop = asyncio.get_event_loop()
+            await loop.run_in_executor(None, getattr, self, "service")
+        page = 0
+        while True:
+            if cursor:
+                self._set_cursor(params, cursor)
+            request = self._get_api_call(method_parts, params)
+            response = await self._execute(request, page, cursor)
+            yield response
+            cursor = self._next_cursor(response)
+            if not cursor:
+                return
+            page += 1
+
+    async def get_call(self, *method_parts, **params):
+        """
+        Args:
+            *method_parts (str): API method.
+            **params: Parameters. Besides the API method parameters, the
+                ``start_cursor`` and ``spill_threshold`` options of
+                ``ApiClient.get_call``.
+
+        Returns:
+            dict: An object, or list of objects returned by API method.
+
+        Example:
+                >>> feedtypes = await api.get_call("feedtype", "list")
+        """
+        start_cursor = params.pop("start_cursor", None)
+        spill_threshold = params.pop("spill_threshold", None)
+        items = SpooledList(spill_threshold) if spill_threshold else []
+        if "body" in params and isinstance(params["body"], str):
+            params["body"] = json.loads(params["body"])
+        pages = self._aiter_pages(method_parts, params, start_cursor)
+        async for response in pages:
+            if not isinstance(response, dict):  # methods without a response body
+                self.last_cursor = None
+                return response
+            if "more" not in response:
+                self.last_cursor = None
+                return self._prune(method_parts, response)
+            items.extend(self._prune(method_parts, response.get("items", [])))
+            if response.get("more", False):
+                self.last_cursor = response["cursor"]
+        return self._list_result(items)
+
+    async def iter_call(self, *method_parts, **params):
+        """
+        Args:
+            *method_parts (str): API method.
+            **params: Parameters. Besides the API method parameters, the
+                ``start_cursor``, ``checkpoint`` and ``job_id`` options of
+                ``ApiClient.iter_call``. ``prefetch`` and ``stream`` are not
+                supported: the pages of concurrent calls are already fetched
+                while the others are consumed.
+
+        Yields:
+            dict: Objects returned by API method.
+
+        Example:
+                >>> async for feedtype in api.iter_call("feedtype", "list"):
+                ...     print(feedtype)
+        """
+        for option in ("prefetch", "stream"):
+            if params.pop(option, None):
+                raise ApiCallError(
+                    "{} is not supported by the AsyncApiClient".format(option)
+                )
+        start_cursor = params.pop("start_cursor", None)
+        checkpoint = params.pop("checkpoint", None)
+        job_id = params.pop("job_id", None)
+        if "body" in params and isinstance(params["body"], str):
+            params["body"] = json.loads(params["body"])
+        if checkpoint is not None and not callable(checkpoint):
+            checkpoint = checkpoint.checkpoint(
+                job_id, method_parts, params, start_cursor
+            )
+        pages = self._aiter_pages(method_parts, params, start_cursor)
+        async for response in pages:
+            if "more" in response:
+                for item in response.get("items", []):
+                    yield self._prune(method_parts, item)
+            else:
+                yield self._prune(method_parts, response)
+            if checkpoint is not None:
+                checkpoint(self._next_cursor(response))
+
+    async def resume(self, job_id, store):
+        """Resume an ``iter_call`` checkpointed in a CursorStore.
+
+        Args:
+            job_id (str): The job_id given to iter_call.
+            store (CursorStore): The store given to iter_call.
+
+        Yields:
+            dict: The objects of the pages the job had not completed.
+        """
+        job = store.get(job_id)
+        if job is None:
+            raise ApiCallError("No checkpointed job {}".format(job_id))
+        if job["done"]:
+            return
+        params = dict(job["params"])
+        params.update(start_cursor=job["cursor"], checkpoint=store, job_id=job_id)
+        async for item in self.iter_call(*job["method"], **params):
+            yield item
+
+    def batch_call(self, calls, batch_size=None):
+        """Not supported: gather ``get_call`` coroutines instead, their
+        requests share the connections of the session.
+        """
+        raise NotImplementedError("batch_call is not supported by the AsyncApiClient")
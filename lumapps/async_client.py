@@ -0,0 +1,11 @@
+"""asyncio flavour of the ApiClient.
+
+Requires python 3.6+ and aiohttp (``pip install lumapps-sdk[async]``).
+"""
+
+import sys
+
+if sys.version_info < (3, 6):
+    raise ImportError("The AsyncApiClient requires python 3.6 or later")
+
+from lumapps._async_client import AsyncApiClient  # noqa: F401,E402
@@ -0,0 +1,90 @@
+import json
+import os
+import threading
+from copy import deepcopy
+
+from lumapps.utils import get_conf_file
+
+
+def get_cursors_file():
+    return os.path.join(os.path.dirname(get_conf_file()), "lumapps_cursors.json")
+
+
+class CursorStore(object):
+    """Stores the progress of paginated calls in a json file, so that an
+    interrupted ``iter_call`` can be resumed with ``ApiClient.resume``.
+
+    Args:
+        path (str): The json file path. Defaults to ``lumapps_cursors.json``
+            next to the configuration file.
+
+    Example:
+            >>> store = CursorStore()
+            >>> for user in api.iter_call(
+            ...     "user", "list", checkpoint=store, job_id="users-export"
+            ... ):
+            ...     export(user)
+
+        If the export dies, continue it from the last completed page with:
+
+            >>> for user in api.resume("users-export", store):
+            ...     export(user)
+    """
+
+    def __init__(self, path=None):
+        self.path = path or get_cursors_file()
+        self._lock = threading.Lock()
+
+    def _load(self):
+        try:
+            with open(self.path) as fh:
+                return json.load(fh)
+        except (IOError, ValueError):
+            return {}
+
+    def _dump(self, jobs):
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "wt") as fh:
+            json.dump(jobs, fh, indent=4)
+        if hasattr(os, "replace"):
+            os.replace(tmp_path, self.path)
+        else:  # python 2
+            os.rename(tmp_path, self.path)
+
+    def get(self, job_id):
+        """Return the job saved as ``job_id``: a dict with its ``method``,
+        ``params``, next ``cursor`` and whether it is ``done``, or None.
+        """
+        with self._lock:
+            return self._load().get(job_id)
+
+    def save(self, job_id, job):
+        with self._lock:
+            jobs = self._load()
+            jobs[job_id] = job
+            self._dump(jobs)
+
+    def delete(self, job_id):
+        with self._lock:
+            jobs = self._load()
+            if jobs.pop(job_id, None) is not None:
+                self._dump(jobs)
+
+    def checkpoint(self, job_id, method_parts, params, cursor=None):
+        """Record a job and return the callback saving its progress, called
+        with the cursor of the next page (None once the job is done).
+        """
+        if not job_id:
+            raise ValueError("a job_id is required to checkpoint a call")
+        params = deepcopy(params)
+        body = params.get("body")
+        (body if isinstance(body, dict) else params).pop("cursor", None)
+        job = {"method": list(method_parts), "params": params}
+
+        def save_cursor(next_cursor):
+            job.update(cursor=next_cursor, done=next_cursor is None)
+            self.save(job_id, job)
+
+        job.update(cursor=cursor, done=False)
+        self.save(job_id, job)
+        return save_cursor
@@ -3,25 +3,37 @@ from __future__ import print_function, unicode_literals
 import sys
 import argparse
 import json
+import shlex
 
-from lumapps.utils import ApiCallError, get_conf, set_conf, FILTERS
-from lumapps.client import ApiClient
+from lumapps.utils import (
+    ApiCallError,
+    SpooledList,
+    get_conf,
+    set_conf,
+    parallel_imap,
+    FILTERS,
+)
 import logging
 
 LIST_CONFIGS = "***LIST_CONFIGS***"
 
 
-def parse_args():
-    s = ""
-    for f in FILTERS:
-        s += "\nMethods " + f + "\n"
-        for pth in sorted(FILTERS[f]):
-            s += "    " + pth + "\n"
+class ArgumentParser(argparse.ArgumentParser):
+    """Builds the FILTERS epilog only when the help is printed."""
 
-    parser = argparse.ArgumentParser(
-        formatter_class=argparse.RawDescriptionHelpFormatter,
-        add_help=False,
-        epilog="FILTERS:\n" + s,
+    def format_help(self):
+        s = ""
+        for f in FILTERS:
+            s += "\nMethods " + f + "\n"
+            for pth in sorted(FILTERS[f]):
+                s += "    " + pth + "\n"
+        self.epilog = "FILTERS:\n" + s
+        return super(ArgumentParser, self).format_help()
+
+
+def build_parser():
+    parser = ArgumentParser(
+        formatter_class=argparse.RawDescriptionHelpFormatter, add_help=False
     )
     add_arg = parser.add_argument
     add_arg(
@@ -47,6 +59,33 @@ def parse_args():
         help="Prune extraneous content based on methods being invoked. "
         "See below for filters used.",
     )
+    add_arg(
+        "--spill",
+        type=int,
+        metavar="N",
+        help="Keep at most N listed objects in memory, spill the others to a "
+        "temporary file",
+    )
+    add_arg(
+        "--batch",
+        metavar="FILE",
+        help='Run the API calls of a NDJSON file ("-" for stdin), one '
+        '{"method": ["user", "get"], "params": {"email": "..."}} object per line, '
+        "and print a NDJSON result line per call",
+    )
+    add_arg(
+        "--concurrency",
+        type=int,
+        default=1,
+        metavar="N",
+        help="Number of batch calls run in parallel. Defaults to 1",
+    )
+    add_arg(
+        "--unordered",
+        action="store_true",
+        help="Print the batch results as soon as they are done, instead of in "
+        "the order of the calls",
+    )
     add_arg(
         "--config",
         "-c",
@@ -65,17 +104,34 @@ def parse_args():
         default=sys.stdin,
         help=argparse.SUPPRESS,
     )
-    return parser, parser.parse_args()
+    add_arg(
+        "--socket",
+        metavar="FILE",
+        help='UNIX socket of the lac daemon started by "lac serve". Defaults '
+        "to lac.sock next to the configuration file",
+    )
+    add_arg(
+        "--no-daemon",
+        action="store_true",
+        help="Do not forward the call to a running lac daemon",
+    )
+    return parser
+
+
+def parse_args(argv=None):
+    parser = build_parser()
+    return parser, parser.parse_args(argv)
 
 
-def list_configs():
+def list_configs(out=None):
+    out = out or sys.stdout
     conf = get_conf()["configs"]
     if not conf:
-        print("There are no saved configs")
+        print("There are no saved configs", file=out)
         return
-    print("Saved configs:")
+    print("Saved configs:", file=out)
     for conf_name in conf:
-        print("  " + conf_name)
+        print("  " + conf_name, file=out)
 
 
 def load_config(api_file, auth_file, user, conf_name):
@@ -116,6 +172,85 @@ def cast_params(method_parts, params, api):
             params[param] = params[param] in truths
 
 
+def print_response(response, out=None):
+    out = out or sys.stdout
+    if not isinstance(response, SpooledList):
+        print(json.dumps(response, indent=4, sort_keys=True), file=out)
+        return
+    # stream the spilled objects, formatted as json.dumps would do
+    out.write("[")
+    for idx, item in enumerate(response):
+        out.write(",\n" if idx else "\n")
+        item_lines = json.dumps(item, indent=4, sort_keys=True).split("\n")
+        out.write("\n".join("    " + line for line in item_lines))
+    out.write("\n]\n" if len(response) else "]\n")
+    response.close()
+
+
+def get_client(
+    api_info, auth_info, user, token, prune, clients=None, thread_safe=False
+):
+    """Return an ApiClient, reused from ``clients`` (a dict) when given."""
+    from lumapps.client import ApiClient  # only imported when an API is called
+
+    if clients is None:
+        return ApiClient(
+            auth_info,
+            api_info,
+            user=user,
+            token=token,
+            prune=prune,
+            thread_safe=thread_safe,
+        )
+    key = json.dumps([api_info, auth_info, user, token, prune], sort_keys=True)
+    api = clients.get(key)
+    if api is None:
+        api = clients[key] = ApiClient(
+            auth_info, api_info, user=user, token=token, prune=prune, thread_safe=True
+        )
+    return api
+
+
+_BLANK = object()
+
+
+def run_batch(api, lines, concurrency=1, ordered=True, out=None):
+    """Run the API calls of NDJSON lines, each a {"method": [...], "params":
+    {...}} object, and write a {"line": n, "result": ...} or {"line": n,
+    "error": "..."} NDJSON line per call.
+
+    Returns:
+        int: the number of failed calls.
+    """
+    out = out or sys.stdout
+
+    def call(line):
+        if not line.strip():
+            return _BLANK
+        command = json.loads(line)
+        method_parts = command["method"]
+        if not isinstance(method_parts, list):
+            method_parts = method_parts.split()
+        return api.get_call(*method_parts, **command.get("params", {}))
+
+    errors = 0
+    for idx, result, error in parallel_imap(
+        call, lines, workers=max(1, concurrency), ordered=ordered
+    ):
+        if result is _BLANK:
+            continue
+        if error is None:
+            record = {"line": idx + 1, "result": result}
+        else:
+            errors += 1
+            record = {
+                "line": idx + 1,
+                "error": "{}: {}".format(type(error).__name__, error),
+            }
+        out.write(json.dumps(record, sort_keys=True) + "\n")
+    return errors
+
+
 def setup_logger():
     level = logging.DEBUG
     logger = logging.getLogger()
@@ -127,22 +262,47 @@ def setup_logger():
     logger.addHandler(ch)
 
 
-def main():
-    arg_parser, args = parse_args()
-    if args.debug:
-        setup_logger()
+def run(args, out=None, clients=None):
+    """Run the command described by the parsed ``args``.
+
+    Args:
+        args (argparse.Namespace): The parsed command line.
+        out (file): Where to write the output. Defaults to sys.stdout.
+        clients (dict): A cache of the ApiClients, to reuse them from one
+            command to the next.
+    """
+    out = out or sys.stdout
     if not (args.auth or args.api or args.config or args.token):
-        arg_parser.print_help()
+        build_parser().print_help(out)
         return
     if args.config == LIST_CONFIGS:
-        list_configs()
+        list_configs(out)
         return
     api_info, auth_info, user = load_config(args.api, args.auth, args.user, args.config)
-    api = ApiClient(auth_info, api_info, user=user, token=args.token, prune=args.prune)
+    api = get_client(
+        api_info,
+        auth_info,
+        user,
+        args.token,
+        args.prune,
+        clients,
+        thread_safe=args.concurrency > 1,
+    )
     if args.config and (args.auth or args.api):
         store_config(api_info, auth_info, args.config, args.user)
+    if args.batch:
+        if args.batch == "-":
+            errors = run_batch(
+                api, sys.stdin, args.concurrency, not args.unordered, out
+            )
+        else:
+            with open(args.batch) as fh:
+                errors = run_batch(api, fh, args.concurrency, not args.unordered, out)
+        if errors:
+            sys.exit("{} batch calls failed".format(errors))
+        return
     if not args.api_method:
-        arg_parser.print_help()
+        build_parser().print_help(out)
         sys.exit(
             "\nNo API method specified. Found these:\n"
             + api.get_method_descriptions(sorted(api.methods))
@@ -151,7 +311,7 @@ def main():
     if method_parts not in api.methods:
         sys.exit(api.get_matching_methods(method_parts))
     if args.help:
-        print(api.get_help(method_parts, args.debug))
+        print(api.get_help(method_parts, args.debug), file=out)
         return
     params = {
         p[0]: p[2] for p in (a.partition("=") for a in args.api_method if "=" in a)
@@ -166,11 +326,70 @@ def main():
     #     print('will loads this: {}'.format(s))
     #     params['body'] = json.loads(s)
     cast_params(method_parts, params, api)
+    if args.spill:
+        params["spill_threshold"] = args.spill
     try:
         response = api.get_call(*method_parts, **params)
     except ApiCallError as err:
         sys.exit(err)
-    print(json.dumps(response, indent=4, sort_keys=True))
+    print_response(response, out)
+
+
+def shell(argv):
+    """Read and run commands in a loop, keeping the clients warm. The options
+    of ``argv`` (e.g. ``--config``) apply to every command.
+    """
+    try:
+        import readline  # noqa: F401 (line edition and history in input())
+    except ImportError:
+        pass
+    try:
+        read_line = raw_input  # python 2
+    except NameError:
+        read_line = input
+    base_argv = list(argv)
+    base_argv.remove("shell")
+    clients = {}
+    while True:
+        try:
+            line = read_line("lac> ").strip()
+        except EOFError:
+            print()
+            return
+        except KeyboardInterrupt:
+            print()
+            continue
+        if line in ("exit", "quit"):
+            return
+        if not line:
+            continue
+        try:
+            run(parse_args(base_argv + shlex.split(line))[1], clients=clients)
+        except SystemExit as err:
+            if err.code:
+                print(err.code, file=sys.stderr)
+        except KeyboardInterrupt:
+            print()
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    _, args = parse_args(argv)
+    if args.debug:
+        setup_logger()
+    if args.api_method[:1] == ["shell"]:
+        return shell(argv)
+    if args.api_method[:1] == ["serve"]:
+        from lumapps.daemon import serve
+
+        return serve(args.socket)
+    if not args.no_daemon and args.batch != "-":
+        from lumapps.daemon import connect, forward
+
+        sock = connect(args.socket)
+        if sock is not None:
+            sys.exit(forward(sock, args))
+    run(args)
 
 
 if __name__ == "__main__":
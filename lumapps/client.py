@@ -1,19 +1,64 @@
 from __future__ import print_function, unicode_literals
 import json
+import threading
+from calendar import timegm
+from collections import OrderedDict
 from time import time
 from textwrap import TextWrapper
 
-from google.oauth2 import service_account
-from google.oauth2.credentials import Credentials
-from googleapiclient.discovery import build
 
 from lumapps.utils import (
     DiscoveryCache,
-    pop_matches,
+    HttpPool,
+    SpooledList,
+    prefetch_iter,
     ApiCallError,
     GOOGLE_APIS,
-    FILTERS,
+    PRUNE_FILTERS,
+    build_exclusion_mask,
+    build_fields_mask,
 )
+from lumapps.utils import pop_matches  # noqa: F401
+from lumapps.instrumentation import CallEvent, MultiInstrumentation, ObservedHttp
+from lumapps.ratelimit import RateLimitedHttp
+from lumapps.streaming import iter_items
+
+# The google libraries are imported where they are used, so that importing
+# the client (e.g. to run the lac command) stays fast, and only the auth
+# backend in use is loaded.
+
+_DOCUMENTS_LOCK = threading.Lock()
+
+
+def get_discovery_document(api_name, version, url, http=None):
+    """Return the parsed discovery document of an api.
+
+    The document is fetched (or read from the DiscoveryCache) and parsed once
+    per process until it expires or is invalidated, and shared meanwhile by
+    every ApiClient of that api. When an ``http`` transport is given the
+    document is fetched with it and the persistent cache is left untouched.
+    """
+    document = DiscoveryCache.get_document(url)
+    if document is not None:
+        return document
+    with _DOCUMENTS_LOCK:
+        document = DiscoveryCache.get_document(url)
+        if document is None:
+            content = None if http else DiscoveryCache.get(url)
+            if not content:
+                import httplib2
+                from googleapiclient.errors import HttpError
+
+                resp, content = (http or httplib2.Http()).request(url)
+                if resp.status >= 400:
+                    raise HttpError(resp, content, uri=url)
+                if isinstance(content, bytes):
+                    content = content.decode("utf-8")
+                if not http:
+                    DiscoveryCache.set(url, content)
+            document = json.loads(content)
+            DiscoveryCache.set_document(url, document)
+        return document
 
 
 class ApiClient(object):
@@ -28,8 +73,39 @@ class ApiClient(object):
             token_getter (object): a token getter function
             prune (bool): Whether or not to use FILTERS to prune the LumApps
                 API responses. Defaults to False.
+            project_fields (bool): When pruning, whether to also ask the API
+                for the non pruned fields only, through a ``fields`` partial
+                response mask derived from FILTERS and the discovery schemas.
+                Not used when a call is given its own ``fields``.
+                Defaults to False.
             num_retries (int): Number of times that a request will be retried.
                 Default to 1.
+            thread_safe (bool): Whether the client is shared between threads.
+                Requests are then sent through a pool of keep-alive http
+                transports instead of the single transport of the service.
+                Defaults to False.
+            pool_size (int): Maximum number of http transports of the pool
+                used in thread safe mode. Defaults to 10.
+            retry_policy (RetryPolicy): When set, failed requests are retried
+                according to this policy instead of using num_retries. Each
+                page of a paginated call is retried on its own.
+            rate_limiter (RateLimiter): When set, every request waits for
+                the rate limiter before being sent.
+            impersonation_pool_size (int): When set, get_new_client_as keeps
+                up to that many clients (and their tokens) in an
+                ImpersonationPool instead of creating a new client per call.
+            http (httplib2.Http): The http transport the requests are sent
+                with, authorized with the client credentials. Defaults to a
+                new httplib2.Http. See lumapps.testing for offline transports.
+                In thread safe mode it is not shared between threads: the
+                pool creates its own transports with ``http_factory``.
+            http_factory (callable): Returns a new http transport for each
+                connection of the pool used in thread safe mode. Defaults to
+                httplib2.Http.
+            instrumentation (Instrumentation): Hooks called around every
+                request and prune, e.g. a PrometheusMetrics or an
+                OpenTelemetryTracer from lumapps.instrumentation. A list of
+                instrumentations is also accepted.
 
         Note:
             At least one type of authentication info is required (auth_info,
@@ -46,16 +122,38 @@ class ApiClient(object):
         token_getter=None,
         prune=False,
         num_retries=1,
+        project_fields=False,
+        thread_safe=False,
+        pool_size=10,
+        impersonation_pool_size=0,
+        retry_policy=None,
+        rate_limiter=None,
+        http=None,
+        instrumentation=None,
+        http_factory=None,
     ):
         self._get_token_user = None
         self._token_expiry = 0
         self.num_retries = num_retries
+        self.retry_policy = retry_policy
+        self.rate_limiter = rate_limiter
+        self._http = http
+        self._http_factory = http_factory
+        if isinstance(instrumentation, (list, tuple)):
+            instrumentation = MultiInstrumentation(instrumentation)
+        self.instrumentation = instrumentation
         self.prune = prune
+        self.project_fields = project_fields
+        self._fields_masks = {}
         self._auth_info = auth_info
         self._user = {}
         self.email = ""
         self.last_cursor = None
         self.token_expiration = None
+        # a lumapps.mirror.Mirror the helpers lookups read through
+        self.mirror = None
+        # a lumapps.helpers.group.GroupIndex the group lookups are cached in
+        self.group_index = None
 
         # Api infos setup : construct the api url.
         if not api_info:
@@ -78,6 +176,19 @@ class ApiClient(object):
         )
         self._methods = None
         self._service = None
+        # the service the cached resources were built from, and the resources
+        self._resources = None, {}
+        self._service_lock = threading.Lock()
+        self.thread_safe = thread_safe
+        self.pool_size = pool_size
+        self._http_pool = None
+        self._authed_session = None
+        self._sessions = threading.local()  # the thread safe mode sessions
+        self.impersonation_pool = None
+        if impersonation_pool_size:
+            self.impersonation_pool = ImpersonationPool(
+                self, max_size=impersonation_pool_size
+            )
         self.token_getter = token_getter
         if token_getter:
             self.creds = None
@@ -85,13 +196,19 @@ class ApiClient(object):
         elif credentials:
             self.creds = credentials
         elif auth_info and "refresh_token" in auth_info:
+            from google.oauth2.credentials import Credentials
+
             self.creds = Credentials(None, **auth_info)
         elif auth_info and "bearer" in auth_info:
+            from google.oauth2.credentials import Credentials
+
             self.creds = Credentials(auth_info["bearer"].replace("Bearer ", ""))
         elif token:
             self.creds = None
             self.token = token
         elif auth_info:  # service account
+            from google.oauth2 import service_account
+
             self.creds = service_account.Credentials.from_service_account_info(
                 auth_info
             )
@@ -120,24 +237,42 @@ class ApiClient(object):
         """
         if not self.prune:
             return content
-        for filter_method in FILTERS:
-            filter_method_parts = filter_method.split("/")
-            if len(method_parts) != len(filter_method_parts):
-                continue
-            for filter_part, part in zip(filter_method_parts, method_parts):
-                if filter_part not in ("*", part):
-                    break
-            else:
-                for pth in FILTERS[filter_method]:
-                    if isinstance(content, list):
-                        for o in content:
-                            pop_matches(pth, o)
-                    else:
-                        pop_matches(pth, content)
+        if self.instrumentation is None:
+            return PRUNE_FILTERS.prune(method_parts, content)
+        start = time()
+        content = PRUNE_FILTERS.prune(method_parts, content)
+        self.instrumentation.on_prune(method_parts, time() - start)
         return content
 
     def get_new_client_as(self, user):
-        return ApiClient(self._auth_info, self.api_info, user=user)
+        if self.impersonation_pool is not None:
+            return self.impersonation_pool.get(user)
+        return self._new_client_as(user)
+
+    def _new_client_as(self, user):
+        # the impersonated clients share the settings and the rate limiter
+        options = dict(
+            user=user,
+            prune=self.prune,
+            num_retries=self.num_retries,
+            project_fields=self.project_fields,
+            thread_safe=self.thread_safe,
+            pool_size=self.pool_size,
+            retry_policy=self.retry_policy,
+            rate_limiter=self.rate_limiter,
+            http=self._http,
+            instrumentation=self.instrumentation,
+            http_factory=self._http_factory,
+        )
+        if hasattr(self.creds, "with_subject"):
+            # reuse the already loaded service account key
+            return ApiClient(
+                self._auth_info,
+                self.api_info,
+                credentials=self.creds.with_subject(user),
+                **options
+            )
+        return ApiClient(self._auth_info, self.api_info, **options)
 
     @property
     def token(self):
@@ -147,26 +282,123 @@ class ApiClient(object):
 
     @token.setter
     def token(self, v):
-        if self.creds and self.creds.token == v:
-            return
-        self._service = None
-        self.creds = Credentials(v)
+        from google.oauth2.credentials import Credentials
+
+        # the calls in flight keep the service they got, the next ones build
+        # a new service with the new credentials
+        with self._service_lock:
+            if self.creds and self.creds.token == v:
+                return
+            self.creds = Credentials(v)
+            self._service = None
+            self._http_pool = None
 
     @property
     def service(self):
         """Setup the service object.
         """
         self._check_access_token()
-        if self._service is None:
-            self._service = build(
-                self._api_name,
-                self._api_version,
-                discoveryServiceUrl=self._url,
-                credentials=self.creds,
-                cache_discovery=True,
-                cache=DiscoveryCache(),
-            )
-        return self._service
+        service = self._service
+        if service is None:
+            with self._service_lock:
+                if self._service is None:
+                    from googleapiclient.discovery import build_from_document
+
+                    document = get_discovery_document(
+                        self._api_name, self._api_version, self._url, self._http
+                    )
+                    if self._http is None:
+                        self._service = build_from_document(
+                            document, base=self._url, credentials=self.creds
+                        )
+                    else:
+                        self._service = build_from_document(
+                            document, base=self._url, http=self._authorize(self._http)
+                        )
+                service = self._service
+        return service
+
+    @property
+    def http_pool(self):
+        """The pool of http transports used in thread safe mode."""
+        pool = self._http_pool
+        if pool is None:
+            with self._service_lock:
+                if self._http_pool is None:
+                    import httplib2
+
+                    factory = self._http_factory or httplib2.Http
+                    self._http_pool = HttpPool(
+                        lambda: self._authorize(factory()), self.pool_size
+                    )
+                pool = self._http_pool
+        return pool
+
+    def _refresh_http(self):
+        """Return a transport of the client, not authorized, to refresh its
+        credentials with.
+        """
+        if self._http is not None and not self.thread_safe:
+            return self._http
+        if self._http_factory is not None:
+            return self._http_factory()
+        import httplib2
+
+        return httplib2.Http()
+
+    def _authorize(self, http):
+        if self.creds is None:
+            return http
+        from google_auth_httplib2 import AuthorizedHttp
+
+        return AuthorizedHttp(self.creds, http=http)
+
+    def get_authed_session(self):
+        """Return a requests session authenticated with the client credentials,
+        one per thread in thread safe mode.
+        """
+        self._check_access_token()
+        holder = self._sessions if self.thread_safe else self
+        session = getattr(holder, "_authed_session", None)
+        if session is None or session.credentials is not self.creds:
+            from google.auth.transport.requests import AuthorizedSession
+
+            session = holder._authed_session = AuthorizedSession(self.creds)
+        return session
+
+    def _can_stream(self):
+        """Whether the responses can be streamed: only the default httplib2
+        transports are replaced by a requests session to stream from.
+        """
+        if self._http_factory is not None:
+            return False
+        if self._http is None:
+            return True
+        import httplib2
+
+        return isinstance(self._http, httplib2.Http)
+
+    def _stream_options(self):
+        """Return the requests options matching the timeout, certificates and
+        proxy settings of the client httplib2 transport.
+        """
+        http = self._http
+        if http is None:
+            return {}
+        options = {"timeout": http.timeout}
+        if http.disable_ssl_certificate_validation:
+            options["verify"] = False
+        elif http.ca_certs:
+            options["verify"] = http.ca_certs
+        proxy = http.proxy_info
+        # a callable proxy_info reads the environment, as requests does
+        if proxy is not None and not callable(proxy) and proxy.proxy_host:
+            auth = ""
+            if proxy.proxy_user:
+                auth = "{}:{}@".format(proxy.proxy_user, proxy.proxy_pass or "")
+            url = "http://{}{}:{}".format(auth, proxy.proxy_host, proxy.proxy_port)
+            options["proxies"] = {"http": url, "https": url}
+        return options
 
     @property
     def methods(self):
@@ -235,22 +467,156 @@ class ApiClient(object):
             ):
                 yield method_name, method
 
+    def _get_resource(self, resource_parts):
+        """Return the service resource of the given parts, building the
+        nested resources only once per service.
+        """
+        service = self.service
+        resources_service, resources = self._resources
+        if resources_service is not service:
+            resources = {}
+            self._resources = service, resources
+        resource = resources.get(resource_parts)
+        if resource is None:
+            resource = service
+            for idx, part in enumerate(resource_parts):
+                parent_parts = resource_parts[: idx + 1]
+                cached = resources.get(parent_parts)
+                if cached is None:
+                    cached = resources[parent_parts] = getattr(resource, part)()
+                resource = cached
+        return resource
+
+    def get_fields_mask(self, method_parts):
+        """Return the partial response mask excluding the pruned fields of a
+        method, None if nothing is pruned or the mask cannot be built.
+        """
+        method_parts = tuple(method_parts)
+        if method_parts in self._fields_masks:
+            return self._fields_masks[method_parts]
+        mask = None
+        paths = PRUNE_FILTERS.resolve(method_parts)
+        method = self.methods.get(method_parts, {})
+        root_desc = self.service._rootDesc
+        supports_fields = "fields" in method.get("parameters", {}) or (
+            "fields" in root_desc.get("parameters", {})
+        )
+        if paths and supports_fields and "response" in method:
+            schemas = root_desc.get("schemas", {})
+            response = schemas.get(method["response"].get("$ref"), {})
+            properties = response.get("properties", {})
+            items = properties.get("items", {})
+            if "more" in properties and items.get("type") == "array":
+                item_mask = build_exclusion_mask(items["items"], paths, schemas)
+                if item_mask:
+                    others = sorted(p for p in properties if p != "items")
+                    mask = ",".join(others + ["items({})".format(item_mask)])
+            else:
+                mask = build_exclusion_mask(response, paths, schemas)
+        self._fields_masks[method_parts] = mask
+        return mask
+
     def _get_api_call(self, method_parts, params):
         """Construct the method to call by using the service.
         """
-        api_call = self.service
-        for part in method_parts[:-1]:
-            api_call = getattr(api_call, part)()
+        fields = params.get("fields")
+        if isinstance(fields, (list, tuple)):
+            params = dict(params, fields=build_fields_mask(fields))
+        elif fields is None and self.prune and self.project_fields:
+            mask = self.get_fields_mask(method_parts)
+            if mask:
+                params = dict(params, fields=mask)
+        api_call = self._get_resource(method_parts[:-1])
         try:
             return getattr(api_call, method_parts[-1])(**params)
         except TypeError as err:
             raise ApiCallError(err)
 
+    def _iter_pages(self, method_parts, params, cursor=None):
+        """Yield the raw responses of an API method, following the cursor
+        from one page to the next, starting from ``cursor`` if given.
+        """
+        page = 0
+        while True:
+            if cursor:
+                self._set_cursor(params, cursor)
+            request = self._get_api_call(method_parts, params)
+            response = self._execute(request, page, cursor)
+            yield response
+            cursor = self._next_cursor(response)
+            if not cursor:
+                return
+            page += 1
+
+    @staticmethod
+    def _set_cursor(params, cursor):
+        if "body" in params:
+            params["body"]["cursor"] = cursor
+        else:
+            params["cursor"] = cursor
+
+    @staticmethod
+    def _next_cursor(response):
+        """Return the cursor of the page following ``response``, None if
+        ``response`` is the last page.
+        """
+        if "items" in response and response.get("more", False):
+            return response["cursor"]
+        return None
+
+    def _execute(self, request, page=None, cursor=None):
+        """Execute an HttpRequest, retried according to the retry policy, and
+        report it to the instrumentation as the ``page`` of a paginated call.
+        """
+        if self.instrumentation is None:
+            return self._retry(request)
+        # methodId is of the form "lumsites.user.list"
+        event = CallEvent(request.methodId.split(".")[1:], page, cursor)
+        self.instrumentation.before_call(event)
+        try:
+            response = self._retry(request, event)
+        except Exception as err:
+            event.finish(err)
+            raise
+        else:
+            event.finish()
+        finally:
+            self.instrumentation.after_call(event)
+        return response
+
+    def _retry(self, request, event=None):
+        if self.retry_policy is None:
+            return self._send(request, self.num_retries, event)
+        return self.retry_policy.call(self._send, request, 0, event)
+
+    def _send(self, request, num_retries, event=None):
+        """Send an HttpRequest, with a pooled transport in thread safe mode.
+        """
+        if not self.thread_safe:
+            return self._send_with(request, request.http, num_retries, event)
+        with self.http_pool.connection() as http:
+            return self._send_with(request, http, num_retries, event)
+
+    def _send_with(self, request, http, num_retries, event):
+        if self.rate_limiter is not None:
+            # every attempt waits, the retries of request.execute included
+            method_parts = tuple(request.methodId.split(".")[1:])
+            http = RateLimitedHttp(http, self.rate_limiter, method_parts)
+        if event is not None:
+            http = ObservedHttp(http, event)
+        return request.execute(http=http, num_retries=num_retries)
+
     def get_call(self, *method_parts, **params):
         """
         Args:
             *method_parts (str): API method.
-            **params: Parameters.
+            **params: Parameters. Besides the API method parameters:
+
+                - ``start_cursor`` (str): the cursor of the first page.
+                - ``spill_threshold`` (int): the maximum number of objects
+                  kept in memory. Past that number, the objects are spilled
+                  to a temporary file and a SpooledList is returned instead
+                  of a list.
 
         Returns:
             dict: An object, or list of objects returned by API method.
@@ -266,37 +632,146 @@ class ApiClient(object):
         """
         if params is None:
             params = {}
-        items = []
-        cursor = None
+        start_cursor = params.pop("start_cursor", None)
+        spill_threshold = params.pop("spill_threshold", None)
+        items = SpooledList(spill_threshold) if spill_threshold else []
         if "body" in params and isinstance(params["body"], str):
             params["body"] = json.loads(params["body"])
-        while True:
-            if cursor:
-                if "body" in params:
-                    params["body"]["cursor"] = cursor
-                else:
-                    params["cursor"] = cursor
-            response = self._get_api_call(method_parts, params).execute(
-                num_retries=self.num_retries
-            )
+        for response in self._iter_pages(method_parts, params, start_cursor):
+            if not isinstance(response, dict):  # methods without a response body
+                self.last_cursor = None
+                return response
             if "more" in response and "items" not in response:
                 self.last_cursor = None
-                return items  # empty list
+                return self._list_result(items)
             if "more" in response and "items" in response:
-                items.extend(response["items"])
+                items.extend(self._prune(method_parts, response["items"]))
                 if response.get("more", False):
-                    self.last_cursor = cursor = response["cursor"]
+                    self.last_cursor = response["cursor"]
                 else:
-                    return self._prune(method_parts, items)
+                    return self._list_result(items)
             else:
                 self.last_cursor = None
                 return self._prune(method_parts, response)
 
+    @staticmethod
+    def _list_result(items):
+        if isinstance(items, SpooledList) and not items.spilled:
+            return list(items)
+        return items
+
+    def batch_call(self, calls, batch_size=None):
+        """Execute many API calls in a few multipart batch requests.
+
+        Each call is reported to the instrumentation on its own, with the
+        status and size of its part of the batch response.
+
+        Args:
+            calls (list[tuple]): (method_parts, params) pairs, method_parts
+                being a tuple of str and params a dict.
+            batch_size (int): Maximum number of calls sent in a single batch
+                request. Defaults to the googleapiclient batch limit.
+
+        Returns:
+            list[tuple]: A (result, error) pair per call, in the order of
+            ``calls``. error is the HttpError of a failed call, None otherwise.
+
+        Example:
+            Fetch many users with a single HTTP request:
+
+                >>> results = batch_call(
+                ...     [(("user", "get"), {"email": e}) for e in emails]
+                ... )
+        """
+        calls = [(tuple(method_parts), params) for method_parts, params in calls]
+        results = [None] * len(calls)
+        if batch_size is None:
+            from googleapiclient.http import MAX_BATCH_LIMIT
+
+            batch_size = MAX_BATCH_LIMIT
+
+        # the CallEvent of each call, reported once its batch is executed
+        events = {}
+
+        def callback(request_id, response, exception):
+            idx = int(request_id)
+            event = events.pop(request_id, None)
+            if event is not None:
+                if exception is not None:
+                    _observe_part(event, exception.resp, exception.content)
+                event.finish(exception)
+                self.instrumentation.after_call(event)
+            if exception is None:
+                response = self._prune(calls[idx][0], response)
+            results[idx] = (response, exception)
+
+        for start in range(0, len(calls), batch_size):
+            batch = self.service.new_batch_http_request(callback=callback)
+            for idx in range(start, min(start + batch_size, len(calls))):
+                method_parts, params = calls[idx]
+                params = dict(params)
+                if "body" in params and isinstance(params["body"], str):
+                    params["body"] = json.loads(params["body"])
+                request = self._get_api_call(method_parts, params)
+                if self.instrumentation is not None:
+                    events[str(idx)] = self._observe_batched(request, method_parts)
+                batch.add(request, request_id=str(idx))
+            if self.rate_limiter is not None:
+                for method_parts, _ in calls[start : start + batch_size]:
+                    self.rate_limiter.acquire(method_parts)
+            try:
+                if self.thread_safe:
+                    with self.http_pool.connection() as http:
+                        batch.execute(http=http)
+                else:
+                    batch.execute()
+            except Exception as err:
+                # the calls of a batch that failed as a whole
+                for request_id in list(events):
+                    event = events.pop(request_id)
+                    event.finish(err)
+                    self.instrumentation.after_call(event)
+                raise
+        return results
+
+    def _observe_batched(self, request, method_parts):
+        """Report a call of a batch to the instrumentation: its response is
+        recorded when the batch response is split, in the postproc of the
+        request.
+        """
+        event = CallEvent(method_parts)
+        self.instrumentation.before_call(event)
+        postproc = request.postproc
+
+        def observed_postproc(resp, content):
+            _observe_part(event, resp, content)
+            return postproc(resp, content)
+
+        request.postproc = observed_postproc
+        return event
+
     def iter_call(self, *method_parts, **params):
         """
         Args:
             *method_parts (str): API method.
-            **params: Parameters.
+            **params: Parameters. Besides the API method parameters:
+
+                - ``prefetch`` (int): fetch up to that many pages in a
+                  background thread while the current page is consumed.
+                  Requires a ``thread_safe`` client.
+                - ``start_cursor`` (str): the cursor of the first page.
+                - ``checkpoint``: a callable called with the cursor of the
+                  next page once the items of a page have been consumed (None
+                  after the last page), or a CursorStore to save this progress
+                  in under ``job_id``.
+                - ``job_id`` (str): the name of the job in the CursorStore.
+                - ``stream`` (bool): parse each page while it is downloaded
+                  and yield its objects as soon as they are read, instead of
+                  waiting for the whole page. Cannot be combined with
+                  ``prefetch``. Only the httplib2.Http transports are
+                  streamed from, the pages of other transports (e.g. of
+                  lumapps.testing) are read at once. A streamed page is
+                  reported to the instrumentation once it has been read.
         
         Yields:
             dict: Objects returned by API method.
@@ -309,32 +784,162 @@ class ApiClient(object):
 
                 >>> feedtypes = iter_call("feedtype", "list")
                 >>> for feedtype in feedtypes: print(feedtype)
+
+            Fetch the next page while the current one is processed:
+
+                >>> api = ApiClient(..., thread_safe=True)
+                >>> users = api.iter_call("user", "list", prefetch=2)
         """
         if params is None:
             params = {}
-        cursor = None
+        prefetch = params.pop("prefetch", 0)
+        start_cursor = params.pop("start_cursor", None)
+        checkpoint = params.pop("checkpoint", None)
+        job_id = params.pop("job_id", None)
         if "body" in params and isinstance(params["body"], str):
             params["body"] = json.loads(params["body"])
-        while True:
-            if cursor:
-                if "body" in params:
-                    params["body"]["cursor"] = cursor
-                else:
-                    params["cursor"] = cursor
-            response = self._get_api_call(method_parts, params).execute(
-                num_retries=self.num_retries
+        stream = params.pop("stream", False)
+        if prefetch and not self.thread_safe:
+            raise ApiCallError("prefetch requires a thread_safe client")
+        if stream and prefetch:
+            raise ApiCallError("stream and prefetch cannot be combined")
+        if checkpoint is not None and not callable(checkpoint):
+            checkpoint = checkpoint.checkpoint(
+                job_id, method_parts, params, start_cursor
             )
-            if "more" in response and "items" not in response:
-                return  # empty list
-            if "more" in response and "items" in response:
-                for item in response["items"]:
+        if stream and self._can_stream():
+            for item in self._iter_streamed(
+                method_parts, params, start_cursor, checkpoint
+            ):
+                yield item
+            return
+        pages = self._iter_pages(method_parts, params, start_cursor)
+        if prefetch:
+            pages = prefetch_iter(pages, prefetch)
+        for response in pages:
+            if "more" in response:
+                for item in response.get("items", []):
                     yield self._prune(method_parts, item)
-                if response.get("more", False):
-                    cursor = response["cursor"]
-                else:
-                    return
             else:
                 yield self._prune(method_parts, response)
+            if checkpoint is not None:
+                checkpoint(self._next_cursor(response))
+
+    def _open_stream(self, request, event=None):
+        """Send an HttpRequest through the authed session, without reading the
+        response body.
+        """
+        if self.rate_limiter is not None:
+            self.rate_limiter.acquire(tuple(request.methodId.split(".")[1:]))
+        if event is not None:
+            event.attempts += 1
+        response = self.get_authed_session().request(
+            request.method,
+            request.uri,
+            data=request.body,
+            headers=request.headers,
+            stream=True,
+            **self._stream_options()
+        )
+        if event is not None:
+            event.status = response.status_code
+        if response.status_code >= 300:
+            content = response.content
+            response.close()
+            if event is not None:
+                event.bytes += len(content)
+            info = dict(response.headers, status=response.status_code)
+            import httplib2
+            from googleapiclient.errors import HttpError
+
+            raise HttpError(httplib2.Response(info), content, uri=request.uri)
+        return response
+
+    def _retry_stream(self, request, event=None):
+        """Open a stream, retried according to the retry policy, or
+        ``num_retries`` times like the other requests.
+        """
+        policy = self.retry_policy
+        if policy is None:
+            from lumapps.retry import RetryPolicy
+
+            # the statuses and backoff googleapiclient retries requests with
+            statuses = dict.fromkeys((429, 500, 502, 503, 504), self.num_retries)
+            policy = RetryPolicy(self.num_retries, base_delay=1, statuses=statuses)
+        return policy.call(self._open_stream, request, event)
+
+    def _stream_page(self, request, page, page_number=None, cursor=None):
+        """Yield the objects of a page as soon as they are read, filling
+        ``page`` with its other members. The page is reported to the
+        instrumentation once its body has been read.
+        """
+        event = None
+        if self.instrumentation is not None:
+            event = CallEvent(request.methodId.split(".")[1:], page_number, cursor)
+            self.instrumentation.before_call(event)
+        error = None
+        try:
+            response = self._retry_stream(request, event)
+            try:
+                chunks = response.iter_content(chunk_size=65536)
+                if event is not None:
+                    chunks = _observed_chunks(chunks, event)
+                for item in iter_items(chunks, page):
+                    yield item
+            finally:
+                response.close()
+        except Exception as err:
+            error = err
+            raise
+        finally:
+            if event is not None:
+                event.finish(error)
+                self.instrumentation.after_call(event)
+
+    def _iter_streamed(self, method_parts, params, cursor=None, checkpoint=None):
+        """Yield the objects of each page as soon as they are read from the
+        network, following the cursor from one page to the next.
+        """
+        page_number = 0
+        while True:
+            if cursor:
+                self._set_cursor(params, cursor)
+            request = self._get_api_call(method_parts, params)
+            page = {}
+            listed = False
+            for item in self._stream_page(request, page, page_number, cursor):
+                listed = True
+                yield self._prune(method_parts, item)
+            if "more" not in page:
+                # a single object, or the only page of a listing
+                if not listed:
+                    yield self._prune(method_parts, page)
+                return
+            cursor = page["cursor"] if page["more"] else None
+            if checkpoint is not None:
+                checkpoint(cursor)
+            if not cursor:
+                return
+            page_number += 1
+
+    def resume(self, job_id, store):
+        """Resume an ``iter_call`` checkpointed in a CursorStore.
+
+        Args:
+            job_id (str): The job_id given to iter_call.
+            store (CursorStore): The store given to iter_call.
+
+        Yields:
+            dict: The objects of the pages the job had not completed.
+        """
+        job = store.get(job_id)
+        if job is None:
+            raise ApiCallError("No checkpointed job {}".format(job_id))
+        if job["done"]:
+            return iter(())
+        params = dict(job["params"])
+        params.update(start_cursor=job["cursor"], checkpoint=store, job_id=job_id)
+        return self.iter_call(*job["method"], **params)
 
     def get_matching_methods(self, method_parts):
         # find exact matches of all parts up to but excluding last
@@ -351,3 +956,99 @@ class ApiClient(object):
             "API method not found. Did you mean any of these?\n"
             + self.get_method_descriptions(sorted(matches))
         )
+
+
+def _observed_chunks(chunks, event):
+    for chunk in chunks:
+        event.bytes += len(chunk)
+        yield chunk
+
+
+def _observe_part(event, resp, content):
+    """Record the part of a batch response answering the call of event."""
+    event.attempts += 1
+    event.status = resp.status
+    event.bytes += len(content or b"")
+
+
+class ImpersonationPool(object):
+    """A bounded LRU of clients acting on behalf of other users, keyed by
+    user email.
+
+    The access token of a pooled client is fetched again ahead of its expiry,
+    so a client taken from the pool always holds a usable token.
+
+    Args:
+        api (ApiClient): The client used to create the impersonated clients,
+            usually authenticated with a service account.
+        max_size (int): Maximum number of clients kept. Defaults to 1000.
+        refresh_margin (int): Number of seconds before the expiry of a token
+            from which it is fetched again. Defaults to 300.
+
+    Attributes:
+        metrics (dict): hits, misses, evictions and refreshes counters.
+    """
+
+    def __init__(self, api, max_size=1000, refresh_margin=300):
+        self._api = api
+        self.max_size = max_size
+        self.refresh_margin = refresh_margin
+        self._clients = OrderedDict()
+        self._lock = threading.Lock()
+        self.metrics = {"hits": 0, "misses": 0, "evictions": 0, "refreshes": 0}
+
+    def __len__(self):
+        return len(self._clients)
+
+    def get(self, user):
+        """Return a client acting on behalf of ``user``."""
+        with self._lock:
+            client = self._clients.pop(user, None)
+            if client is None:
+                self.metrics["misses"] += 1
+                client = self._api._new_client_as(user)
+            else:
+                self.metrics["hits"] += 1
+            self._clients[user] = client
+            while len(self._clients) > self.max_size:
+                self._clients.popitem(last=False)
+                self.metrics["evictions"] += 1
+        self._ensure_token(client)
+        return client
+
+    def prefetch(self, users):
+        """Create the clients of ``users`` and fetch their tokens."""
+        for user in users:
+            self.get(user)
+
+    def refresh_expiring(self):
+        """Fetch again the tokens expiring within ``refresh_margin`` seconds.
+        Meant to be called periodically by long running jobs.
+        """
+        with self._lock:
+            clients = list(self._clients.values())
+        for client in clients:
+            self._ensure_token(client)
+
+    def invalidate(self, user=None):
+        """Drop the client of ``user``, or all the clients."""
+        with self._lock:
+            if user is None:
+                self._clients.clear()
+            else:
+                self._clients.pop(user, None)
+
+    def _ensure_token(self, client):
+        creds = client.creds
+        if creds is None or not hasattr(creds, "refresh"):
+            return
+        if creds.token and creds.expiry is None:
+            return  # token without expiry
+        if creds.token and creds.expiry:
+            expiry = timegm(creds.expiry.utctimetuple())
+            if expiry - time() > self.refresh_margin:
+                return
+        from google_auth_httplib2 import Request
+
+        creds.refresh(Request(client._refresh_http()))
+        self.metrics["refreshes"] += 1
@@ -0,0 +1,158 @@
+"""The lac daemon: ``lac serve`` keeps the authenticated ApiClients (their
+discovery document, method table and token) warm, and the ``lac`` commands
+forward their calls to it through a UNIX socket.
+
+The protocol is one json line per message. The command sends its parsed
+arguments, the daemon answers with ``{"out": text}`` lines and a final
+``{"exit": code}`` line.
+"""
+from __future__ import print_function, unicode_literals
+import argparse
+import json
+import os
+import socket
+import sys
+import traceback
+
+from lumapps.utils import get_conf_file
+
+try:
+    from socketserver import StreamRequestHandler, ThreadingMixIn, UnixStreamServer
+except ImportError:  # python 2
+    from SocketServer import StreamRequestHandler, ThreadingMixIn, UnixStreamServer
+
+# the arguments holding file paths, made absolute before being forwarded
+PATH_ARGS = ("api", "auth", "body_file", "batch")
+
+
+def get_socket_file():
+    return os.path.join(os.path.dirname(get_conf_file()), "lac.sock")
+
+
+class _Output(object):
+    """A text file sending what is written to it as ``{"out": text}`` lines."""
+
+    def __init__(self, wfile, buffer_size=65536):
+        self._wfile = wfile
+        self._buffer = []
+        self._size = 0
+        self._buffer_size = buffer_size
+
+    def write(self, text):
+        self._buffer.append(text)
+        self._size += len(text)
+        if self._size >= self._buffer_size:
+            self.flush()
+
+    def flush(self):
+        if self._buffer:
+            send(self._wfile, {"out": "".join(self._buffer)})
+            self._buffer, self._size = [], 0
+
+
+def send(wfile, message):
+    wfile.write((json.dumps(message) + "\n").encode("utf-8"))
+    wfile.flush()
+
+
+class _Handler(StreamRequestHandler):
+    def handle(self):
+        from lumapps.cli import run
+
+        request = json.loads(self.rfile.readline().decode("utf-8"))
+        out = _Output(self.wfile)
+        try:
+            run(argparse.Namespace(**request["args"]), out, self.server.clients)
+            code = 0
+        except SystemExit as err:
+            code = err.code
+        except Exception:
+            code = traceback.format_exc()
+        if code is not None and not isinstance(code, int):
+            code = str(code)
+        out.flush()
+        send(self.wfile, {"exit": code})
+
+
+class LacDaemon(ThreadingMixIn, UnixStreamServer):
+    """Serve the lac commands on a UNIX socket, with a shared cache of the
+    ApiClients per configuration.
+    """
+
+    daemon_threads = True
+
+    def __init__(self, socket_path):
+        self.socket_path = socket_path
+        self.clients = {}
+        # the socket gives access to the saved credentials: owner only
+        umask = os.umask(0o177)
+        try:
+            UnixStreamServer.__init__(self, socket_path, _Handler)
+        finally:
+            os.umask(umask)
+
+    def server_close(self):
+        UnixStreamServer.server_close(self)
+        if os.path.exists(self.socket_path):
+            os.remove(self.socket_path)
+
+
+def connect(socket_path=None):
+    """Return a socket connected to the lac daemon, None if it is not running."""
+    socket_path = socket_path or get_socket_file()
+    if not hasattr(socket, "AF_UNIX") or not os.path.exists(socket_path):
+        return None
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        sock.connect(socket_path)
+    except socket.error:  # a stale socket file
+        sock.close()
+        return None
+    return sock
+
+
+def forward(sock, args, out=None):
+    """Run a parsed lac command in the daemon connected to ``sock``.
+
+    Returns:
+        the exit code (or message) of the command.
+    """
+    out = out or sys.stdout
+    args = {k: v for k, v in vars(args).items() if k != "body"}
+    for name in PATH_ARGS:
+        if args.get(name):
+            args[name] = os.path.abspath(args[name])
+    try:
+        rfile = sock.makefile("rb")
+        wfile = sock.makefile("wb")
+        send(wfile, {"args": args})
+        for line in rfile:
+            message = json.loads(line.decode("utf-8"))
+            if "out" in message:
+                out.write(message["out"])
+            else:
+                return message["exit"]
+    finally:
+        sock.close()
+    return "The lac daemon closed the connection"
+
+
+def serve(socket_path=None):
+    """Run the lac daemon until interrupted."""
+    if not hasattr(socket, "AF_UNIX"):
+        sys.exit("lac serve requires UNIX sockets")
+    socket_path = socket_path or get_socket_file()
+    sock = connect(socket_path)
+    if sock is not None:
+        sock.close()
+        sys.exit("A lac daemon already listens on " + socket_path)
+    if os.path.exists(socket_path):
+        os.remove(socket_path)
+    server = LacDaemon(socket_path)
+    print("lac daemon listening on " + socket_path, file=sys.stderr)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
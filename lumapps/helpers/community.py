@@ -3,6 +3,25 @@ import logging
 from lumapps.helpers.exceptions import BadRequestException
 
 from lumapps.helpers.user import User
+from lumapps.utils import build_fields_mask
+
+COMMUNITY_LIST_FIELDS = build_fields_mask(
+    ["cursor"]
+    + [
+        "items/" + field
+        for field in (
+            "adminKeys",
+            "instance",
+            "status",
+            "title",
+            "type",
+            "uid",
+            "userKeys",
+            "authorId",
+            "description",
+        )
+    ]
+)
 
 
 class Community(object):
@@ -191,9 +210,7 @@ def list_communities(api, **params):
     """
 
     if not params.get("fields", None):
-        params[
-            "fields"
-        ] = "cursor,items(adminKeys,instance,status,title,type,uid,userKeys,authorId, description)"
+        params["fields"] = COMMUNITY_LIST_FIELDS
 
     if not params.get("body", None):
         params["body"] = {}
@@ -242,9 +259,7 @@ def list_sync(api, instance="", **params):
         params = dict()
 
     if not params.get("fields", None):
-        params[
-            "fields"
-        ] = "cursor,items(adminKeys,instance,status,title,type,uid,userKeys,authorId, description)"
+        params["fields"] = COMMUNITY_LIST_FIELDS
 
     if not params.get("body", None):
         params["body"] = {"lang": "en"}
@@ -16,6 +16,7 @@ class CustomException(Exception):
     """
 
     http_status = httplib.INTERNAL_SERVER_ERROR
+    message = ""
     info = None
 
     def __init__(self, message="", info=None):
@@ -24,8 +25,9 @@ class CustomException(Exception):
         @param message: the exception message
         @param info: an additional info to log
         """
+        self.message = message or self.message
         super(CustomException, self).__init__(
-            message or self.message, httplib.responses[self.http_status]
+            self.message, httplib.responses[self.http_status]
         )
         self.info = info
         logging.warning(
@@ -1,10 +1,15 @@
 import logging
+import threading
+from collections import OrderedDict
+from time import time
 
 from lumapps.helpers.exceptions import (
     NotAuthorizedException,
     BadRequestException,
     NotFoundException,
 )
+from lumapps.helpers.utils import Change, ReconcilePlan, diff_fields
+from lumapps.utils import api_workers, parallel_imap
 from googleapiclient.errors import HttpError
 
 
@@ -130,8 +135,10 @@ class Group(object):
             for k, v in iter(vars(self).items())
             if k[0] == "_" and k[1:] not in ignore_fields
         )
-        if self._type:
+        if isinstance(self._type, dict):
             group["type"] = self._type.get("uid")
+        elif self._type:  # the type uid, from a Lumapps Feed resource
+            group["type"] = self._type
         return group
 
     def set_type_by_label(self, label):
@@ -202,20 +209,22 @@ class Group(object):
         fetch_by_id=False,
     ):
         if fetch_by_name:
+            grp = None
             if name.isdigit():
-                grp = get_by_uid(api, uid)
+                grp = get_by_uid(api, uid or name)
                 logging.info("fetching groups by uid %s: %s", name, grp)
             if not grp:
                 grps = get_by_name(api, name, instance)
                 logging.info("fetching groups by name %s: %s", name, grps)
-                if len(grps) == 1:
-                    grp = grps[0]
-                else:
+                if len(grps) > 1:
                     raise BadRequestException("MULTIPLE_GRP_SAME_NAME")
+                if grps:
+                    grp = grps[0]
 
-            if grp:
-                logging.info("group representation %s", grp)
-                return Group(api=api, representation=grp)
+            if not grp:
+                raise NotFoundException("No group found with that name or id")
+            logging.info("group representation %s", grp)
+            return Group(api=api, representation=grp)
 
         elif fetch_by_id:
             grp = get_by_uid(api, uid)
@@ -232,6 +241,124 @@ class Group(object):
         )
 
 
+class GroupIndex(object):
+    """A cache of the groups of a client, by (instance, name) and by uid, so
+    that resolving the same group names again does not search them again.
+
+    The index is opt-in: attach it to the client to have the helpers use it.
+    The groups saved or deleted with the helpers are updated in the index.
+    ``warm_up`` indexes all the groups of an instance with a single listing.
+
+        >>> api.group_index = GroupIndex(api, ttl=300)
+
+    Args:
+        api: the ApiClient instance to use for requests
+        ttl (float): the seconds the entries are kept, None to keep them until
+            they are invalidated
+    """
+
+    TTL = 600
+
+    def __init__(self, api, ttl=TTL):
+        self.api = api
+        self.ttl = ttl
+        self._groups = {}  # uid -> (expiry, representation)
+        self._names = {}  # (instance, name) -> (expiry, [uids])
+        self._warm = {}  # instance -> expiry of its complete listing
+        self._lock = threading.Lock()
+        self._time = time
+
+    def _expiry(self):
+        return float("inf") if self.ttl is None else self._time() + self.ttl
+
+    def _alive(self, entry):
+        return entry is not None and entry[0] > self._time()
+
+    def get(self, uid):
+        # type: (str) -> dict
+        """Return the indexed group with this uid, None if it is not indexed"""
+        with self._lock:
+            entry = self._groups.get(uid)
+            return entry[1] if self._alive(entry) else None
+
+    def find(self, name, instance=""):
+        # type: (str, str) -> list[dict]
+        """Return the indexed groups with this name, None if the name is not
+        indexed
+        """
+        with self._lock:
+            entry = self._names.get((instance, name))
+            if not self._alive(entry):
+                if self._warm.get(instance, 0) > self._time():
+                    return []  # not in the complete listing of the instance
+                return None
+            groups = [self._groups.get(uid) for uid in entry[1]]
+            if not all(self._alive(group) for group in groups):
+                return None
+            return [group[1] for group in groups]
+
+    def add(self, group):
+        # type: (dict) -> None
+        """Index a Lumapps Feed resource, or its new version"""
+        uid = group.get("uid")
+        key = group.get("instance", ""), group.get("name")
+        with self._lock:
+            self._forget(uid)
+            self._groups[uid] = self._expiry(), group
+            if key in self._names:
+                self._names[key][1].append(uid)
+            elif self._warm.get(key[0], 0) > self._time():
+                self._names[key] = self._expiry(), [uid]
+
+    def set_name(self, name, instance, groups):
+        # type: (str, str, list[dict]) -> None
+        """Index the groups a name resolves to"""
+        expiry = self._expiry()
+        with self._lock:
+            for group in groups:
+                self._groups[group.get("uid")] = expiry, group
+            self._names[(instance, name)] = expiry, [g.get("uid") for g in groups]
+
+    def invalidate(self, uid=None):
+        # type: (str) -> None
+        """Forget a group, or all the groups if ``uid`` is None"""
+        with self._lock:
+            if uid is None:
+                self._groups.clear()
+                self._names.clear()
+                self._warm.clear()
+            else:
+                self._forget(uid)
+
+    def _forget(self, uid):
+        self._groups.pop(uid, None)
+        for _, uids in self._names.values():
+            if uid in uids:
+                uids.remove(uid)
+
+    def warm_up(self, instance="", **params):
+        # type: (str, dict) -> int
+        """Index all the groups of an instance, listed with ``list_groups``
+
+        Returns:
+            the number of groups indexed
+        """
+        names = {}
+        for group in list_groups(self.api, instance=instance, **params):
+            names.setdefault(group.get("name"), []).append(group)
+        for name, groups in names.items():
+            self.set_name(name, instance, groups)
+        with self._lock:
+            self._warm[instance] = self._expiry()
+        return sum(len(groups) for groups in names.values())
+
+
+def get_index(api):
+    # type: (ApiClient) -> GroupIndex
+    """Return the GroupIndex attached to a client, None if there is none"""
+    return getattr(api, "group_index", None)
+
+
 @authorization_decorator
 def save(api, group):
     # type (ApiClient, Group) -> Dict
@@ -255,6 +382,12 @@ def save(api, group):
         print(grp)
         logging.info("saving group to remote %s ", grp)
         saved_grp = api.get_call("feed", "save", body=grp)
+        index = get_index(api)
+        mirror = getattr(api, "mirror", None)
+        if saved_grp and index is not None:
+            index.add(saved_grp)
+        if saved_grp and mirror is not None:
+            mirror.put_feed(saved_grp)
 
         return saved_grp
 
@@ -280,10 +413,23 @@ def delete(api, group):
     if group.uid is None or group.uid == "":
         raise BadRequestException("Group requires a field uid to delete")
 
-    return api.get_call("feed", "delete", uid=group.uid) == ""
+    index = get_index(api)
+    if index is not None:
+        index.invalidate(group.uid)
+    deleted = api.get_call("feed", "delete", uid=group.uid) in ("", b"")
+    mirror = getattr(api, "mirror", None)
+    if deleted and mirror is not None:
+        mirror.delete_feed(group.uid)
+    return deleted
 
 
 def get_types_by_label(api, group, label):
+    mirror = getattr(api, "mirror", None)
+    if mirror is not None:
+        types = mirror.find_feedtypes(label, group.get_attribute("instance"))
+        if types:
+            return types
+
     types = api.get_call(
         "feedtype",
         "list",
@@ -310,17 +456,24 @@ def get_types_by_label(api, group, label):
     return None
 
 
-def get_multi(api, uids):
-    # type (ApiClient, list[str]) -> list[dict(str)]
+def get_multi(api, uids, refresh=False):
+    # type (ApiClient, list[str], bool) -> list[dict(str)]
     """A group by uid
 
     Args:
         api: the ApiClient instance to use for requests
         uids: list of uids to fetch
+        refresh: whether to read them from the API, not from the mirror
 
     Returns:
         list of Group elements
     """
+    mirror = getattr(api, "mirror", None)
+    if mirror is not None and not refresh:
+        groups = mirror.get_feeds(uids)
+        if len(groups) == len(uids):
+            return groups
+
     groups = api.get_call("feed", "getMulti", uid=uids)
     return groups
 
@@ -338,7 +491,19 @@ def get_by_name(api, name, instance=""):
         a Lumapps Feed instance
     """
     logging.info("getting group by name %s", name)
-    groups = list_sync(api, instance, query=name)
+    index = get_index(api)
+    groups = index.find(name, instance) if index is not None else None
+    if groups is not None:
+        return groups
+
+    mirror = getattr(api, "mirror", None)
+    if mirror is not None:
+        groups = mirror.find_feeds(name, instance)
+    if not groups:
+        groups = list_sync(api, instance, body={"query": name})
+        groups = [group for group in groups if group.get("name") == name]
+    if index is not None:
+        index.set_name(name, instance, groups)
     return groups
 
 
@@ -354,7 +519,18 @@ def get_by_uid(api, uid):
         a Lumapps Feed instance
     """
     logging.info("getting group by uid %s", uid)
-    result = api.get_call("feed", "get", uid=uid)
+    index = get_index(api)
+    result = index.get(uid) if index is not None else None
+    if result is not None:
+        return result
+
+    mirror = getattr(api, "mirror", None)
+    if mirror is not None:
+        result = mirror.get_feed(uid)
+    if result is None:
+        result = api.get_call("feed", "get", uid=uid)
+    if result and index is not None:
+        index.add(result)
     return result
 
 
@@ -371,16 +547,12 @@ def list_sync(api, instance="", fields="", **params):
     Returns:
         list of Lumapps Feed resource
     """
-    if not params:
-        params = dict()
+    params["body"] = dict(params.get("body") or {})
     if instance != "":
-        params["instance"] = instance
+        params["body"]["instance"] = instance
     if fields != "":
         params["fields"] = fields
 
-    if not params.get("body", None):
-        params["body"] = {}
-
     result = api.get_call("feed", "search", **params)
     return result
 
@@ -398,19 +570,71 @@ def list_groups(api, instance="", fields="", **params):
     Yields:
         a Lumapps Feed resource
     """
-    if not params:
-        params = dict()
+    params["body"] = dict(params.get("body") or {})
     if instance != "":
-        params["instance"] = instance
+        params["body"]["instance"] = instance
     if fields != "":
         params["fields"] = fields
 
-    if not params.get("body", None):
-        params["body"] = {}
-
     return api.iter_call("feed", "search", **params)
 
 
+# the fields not compared by plan_groups
+GROUP_IGNORED_FIELDS = ("uid", "id", "customer")
+
+
+def plan_groups(api, groups, instance="", **params):
+    # type: (ApiClient, Iterable[Group], str, dict) -> ReconcilePlan
+    """Compare the desired groups with the remote ones and plan the changes
+
+    The remote groups are listed once, then matched by instance and name with
+    the desired groups. Only the groups that do not exist or whose fields
+    differ are saved when the plan is applied. The remote groups missing from
+    ``groups`` are left untouched.
+
+    Args:
+        api: the ApiClient instance to use for requests
+        groups: the desired Group instances
+        instance: the instance id, if not defined the customer groups
+        ``**params``: optional dictionary of search parameters of the remote
+            groups, as in https://api.lumapps.com/docs/feed/list
+
+    Returns:
+        a ReconcilePlan of the creations and updates
+    """
+    remote = {}
+    for representation in list_groups(api, instance=instance, **params):
+        key = representation.get("instance", ""), representation.get("name")
+        remote[key] = representation
+
+    changes = []
+    unchanged = 0
+    for group in groups:
+        key = group.get_attribute("instance") or instance, group.name
+        representation = remote.get(key)
+        desired = group.to_lumapps()
+        if representation is None:
+            diff = diff_fields({}, desired, GROUP_IGNORED_FIELDS)
+            changes.append(Change("create", key, group, diff))
+            continue
+        diff = diff_fields(representation, desired, GROUP_IGNORED_FIELDS)
+        if not diff:
+            unchanged += 1
+            continue
+        remote_group = Group(api, representation=representation)
+        for field, (_, value) in diff.items():
+            remote_group.set_attribute(field, value, force=True)
+        changes.append(Change("update", key, remote_group, diff))
+
+    plan = ReconcilePlan(api, _send_group_change, changes, unchanged)
+    logging.info("planned groups changes: %s", plan)
+    return plan
+
+
+def _send_group_change(api, change):
+    return save(api, change.obj)
+
+
 def update_users(group, users_to_add=list, users_to_remove=list):
     # TODO: Iterables and not lists
     # type (Group, list[User], list[User]) -> bool
@@ -445,7 +669,124 @@ def update_users(group, users_to_add=list, users_to_remove=list):
             "Error {} Group {} has not been saved correctly.".format(str(e), group)
         )
 
-    return result == ""
+    saved = result in ("", b"")
+    mirror = getattr(api, "mirror", None)
+    if saved and mirror is not None:
+        mirror.save_subscribers(group.uid, body["addedUsers"], body["removedUsers"])
+    return saved
+
+
+class MembershipUpdate(object):
+    """A ``feed/subscribers/save`` call planned by a MembershipPlanner
+
+    Attributes:
+        group (Group): the group to update
+        users_to_add (list[User]): the users to add to the group
+        users_to_remove (list[User]): the users to remove from the group
+        error (Exception): the error raised by the call, None if it succeeded
+    """
+
+    def __init__(self, group, users_to_add, users_to_remove):
+        self.group = group
+        self.users_to_add = users_to_add
+        self.users_to_remove = users_to_remove
+        self.error = None
+
+    @property
+    def success(self):
+        return self.error is None
+
+
+class MembershipPlanner(object):
+    """Gather the membership changes of many users to update each group in as
+    few calls as possible
+
+    Args:
+        batch_size (int): the maximum number of users added or removed by a
+            single call
+
+    Example:
+            >>> planner = MembershipPlanner()
+            >>> for user in users:
+            ...     planner.collect(user)
+            >>> updates = planner.flush(concurrency=8)
+    """
+
+    BATCH_SIZE = 500
+
+    def __init__(self, batch_size=None):
+        self.batch_size = batch_size or self.BATCH_SIZE
+        # group uid -> [group, users to add, users to remove]
+        self._changes = OrderedDict()
+
+    def __len__(self):
+        return len(self._changes)
+
+    def _change(self, group):
+        return self._changes.setdefault(group.uid, [group, [], []])
+
+    def add(self, group, user):
+        self._change(group)[1].append(user)
+
+    def remove(self, group, user):
+        self._change(group)[2].append(user)
+
+    def collect(self, user):
+        """Plan the pending ``to_add`` and ``to_remove`` groups of a User"""
+        groups = user.get_groups(with_status=True)
+        for group in groups.get("to_add", []):
+            self.add(group, user)
+        for group in groups.get("to_remove", []):
+            self.remove(group, user)
+
+    def batches(self):
+        # type: () -> Iterator[MembershipUpdate]
+        """Yield the planned calls, ``batch_size`` users at most each"""
+        for group, to_add, to_remove in self._changes.values():
+            changes = [(user, True) for user in to_add]
+            changes += [(user, False) for user in to_remove]
+            for i in range(0, len(changes), self.batch_size):
+                chunk = changes[i : i + self.batch_size]
+                yield MembershipUpdate(
+                    group,
+                    [user for user, added in chunk if added],
+                    [user for user, added in chunk if not added],
+                )
+
+    def flush(self, concurrency=1):
+        # type: (int) -> list[MembershipUpdate]
+        """Send the planned calls, ``concurrency`` at a time, and forget them
+
+        The calls are sent one at a time unless the groups client is
+        ``thread_safe``.
+
+        Returns:
+            the list of the MembershipUpdate sent, with their error if any
+        """
+        updates = list(self.batches())
+        self._changes.clear()
+        if updates:
+            concurrency = api_workers(updates[0].group.api, concurrency)
+
+        def send(update):
+            if not update_users(
+                update.group,
+                users_to_add=update.users_to_add,
+                users_to_remove=update.users_to_remove,
+            ):
+                raise BadRequestException(
+                    "Group {} has not been updated".format(update.group)
+                )
+
+        for idx, _, error in parallel_imap(send, updates, workers=concurrency):
+            updates[idx].error = error
+
+        logging.info(
+            "updated groups with %s calls, %s failed",
+            len(updates),
+            len([u for u in updates if not u.success]),
+        )
+        return updates
 
 
 def build_batch(api, groups):
@@ -57,6 +57,20 @@ def save_media(api, media):
     return api.get_call("media", "save", body=media)
 
 
+def save_medias(api, medias):
+    # type: (ApiClient, list[dict]) -> list[tuple]
+    """Save many medias, with batched requests.
+
+        Args:
+            api (object): The ApiClient instance used to request.
+            medias (list[dict]): the medias to save.
+
+        Returns:
+            list[tuple]: A (saved media, error) pair per media.
+    """
+    return api.batch_call([(("media", "save"), {"body": m}) for m in medias])
+
+
 def uploaded_to_media(uploaded_file, instance, lang, name=None, **params):
     # type: (dict, str, str, str) -> dict
     """Transform an uploaded file (post reponse) into a minimal media.
@@ -4,6 +4,9 @@ from lumapps.helpers.exceptions import (
     BadRequestException,
     MissingFieldException,
 )
+from lumapps.helpers.group import Group, MembershipPlanner, get_multi
+from lumapps.helpers.utils import Change, ReconcilePlan, diff_fields
+from lumapps.utils import api_workers, parallel_imap
 from googleapiclient.errors import HttpError
 
 
@@ -228,16 +231,18 @@ class User(object):
             subscriptions = self.get_attribute("subscriptions")
             subscriptions = [sub.get("feed") for sub in subscriptions]
 
-        if refresh or subscriptions == []:
+        mirror = getattr(self._api, "mirror", None)
+        if subscriptions == [] and not refresh and mirror is not None:
+            subscriptions = mirror.get_subscriptions(self._uid)
+
+        if subscriptions == [] or refresh:
             subscriptions = self._api.get_call(
                 "user", "subscription", "list", userId=self._uid
             )
             if subscriptions:
                 subscriptions = [sub.get("id") for sub in subscriptions]
 
-        from group import get_multi
-
-        groups = get_multi(self._api, subscriptions)
+        groups = get_multi(self._api, subscriptions, refresh=refresh)
         self._groups = {"synced": groups}
 
         if with_status:
@@ -246,8 +251,6 @@ class User(object):
             return groups
 
     def set_groups(self, groups, sync=False):
-        from lumapps_api_helpers.group import Group
-
         if not groups:
             return
 
@@ -288,20 +291,20 @@ class User(object):
             )
 
     def update_remote_groups(self, groups_to_add, groups_to_remove):
-        from group import update_users
+        planner = MembershipPlanner()
+        for grp in groups_to_add:
+            planner.add(grp, self)
+        for grp in groups_to_remove:
+            planner.remove(grp, self)
+        del groups_to_add[:]
 
         added = []
         removed = []
-        while len(groups_to_add):
-            grp = groups_to_add.pop()
-            success = update_users(grp, users_to_add=[self])
-            if success:
-                added.append(grp)
-
-        for grp in groups_to_remove:
-            success = update_users(grp, users_to_remove=[self])
-            if success:
-                removed.append(grp)
+        for update in planner.flush(concurrency=1):
+            if update.success and update.users_to_add:
+                added.append(update.group)
+            if update.success and update.users_to_remove:
+                removed.append(update.group)
 
         return added, removed
 
@@ -386,6 +389,9 @@ def save_or_update(api, user):
         usr = user.to_lumapps_dict()
         logging.info("saving user to remote %s ", usr)
         saved_user = api.get_call("user", "save", body=usr)
+        mirror = getattr(api, "mirror", None)
+        if saved_user and mirror is not None:
+            mirror.put_user(saved_user)
         return saved_user
 
     except HttpError as e:
@@ -409,6 +415,187 @@ def deactivate(api, user):
     return save_or_update(api, user)
 
 
+class SyncResult(object):
+    """The outcome of the synchronization of a user by ``sync_users``
+
+    Attributes:
+        user (User): the synchronized user
+        saved (bool): whether the user was saved
+        groups_added (list[Group]): the groups the user was added to
+        groups_removed (list[Group]): the groups the user was removed from
+        error (Exception): the first error met saving the user or updating
+            its groups, None if the synchronization succeeded
+    """
+
+    def __init__(self, user):
+        self.user = user
+        self.saved = False
+        self.groups_added = []
+        self.groups_removed = []
+        self.error = None
+
+    @property
+    def success(self):
+        return self.error is None
+
+    def __repr__(self):
+        return "<SyncResult {} saved={} error={!r}>".format(
+            self.user.email, self.saved, self.error
+        )
+
+
+def sync_users(api, users, concurrency=1, batch_size=None):
+    # type: (ApiClient, Iterable[User], int, int) -> list[SyncResult]
+    """Save many users and update their groups, with concurrent requests
+
+    The users are saved in parallel, then their pending group changes
+    (``to_add`` and ``to_remove``) are gathered per group by a
+    MembershipPlanner so that each group is updated once for all the users.
+    The errors are reported in the results, not raised.
+
+    Args:
+        api: the ApiClient instance to use for requests
+        users: the User instances to save
+        concurrency: the number of requests sent at the same time. Only a
+            ``thread_safe`` client is shared between threads: the requests
+            of the other clients are sent one at a time
+        batch_size: the maximum number of users added or removed by a group
+            update call
+
+    Returns:
+        a list of SyncResult, in the order of ``users``
+    """
+    users = list(users)
+    results = [SyncResult(user) for user in users]
+    concurrency = api_workers(api, concurrency)
+
+    saves = parallel_imap(
+        lambda user: save_or_update(api, user), users, workers=concurrency
+    )
+    for idx, saved_user, error in saves:
+        if error is None and saved_user is None:
+            error = BadRequestException("User has not been saved correctly")
+        if error is not None:
+            results[idx].error = error
+            continue
+        results[idx].saved = True
+        users[idx]._set_representation(saved_user)
+
+    planner = MembershipPlanner(batch_size)
+    by_user = {}
+    for result in results:
+        if result.saved:
+            planner.collect(result.user)
+            by_user[id(result.user)] = result
+
+    for update in planner.flush(concurrency):
+        grp = update.group
+        if not update.success:
+            for user in update.users_to_add + update.users_to_remove:
+                result = by_user[id(user)]
+                result.error = result.error or update.error
+            continue
+        for user in update.users_to_add:
+            user._groups["to_add"].remove(grp)
+            user._groups.setdefault("synced", []).append(grp)
+            by_user[id(user)].groups_added.append(grp)
+        for user in update.users_to_remove:
+            user._groups["to_remove"].remove(grp)
+            by_user[id(user)].groups_removed.append(grp)
+
+    logging.info(
+        "synced %s users, %s failed",
+        len(results),
+        len([r for r in results if not r.success]),
+    )
+    return results
+
+
+# the fields not compared by plan_users: ids, and the defaults of new Users
+USER_IGNORED_FIELDS = (
+    "uid",
+    "id",
+    "customer",
+    "accountType",
+    "isHidden",
+    "isSuperAdmin",
+)
+
+
+def plan_users(api, users, deactivate_missing=False, **params):
+    # type: (ApiClient, Iterable[User], bool, dict) -> ReconcilePlan
+    """Compare the desired users with the remote ones and plan the changes
+
+    The remote users are listed once, then matched by email with the desired
+    users. Only the users that do not exist or whose fields differ are saved
+    when the plan is applied.
+
+    Args:
+        api: the ApiClient instance to use for requests
+        users: the desired User instances
+        deactivate_missing: whether to deactivate the remote users missing
+            from ``users``
+        ``**params``: optional dictionary of search parameters of the remote
+            users, as in https://api.lumapps.com/docs/user/list
+
+    Returns:
+        a ReconcilePlan of the creations, updates and deactivations
+
+    Example:
+            >>> plan = plan_users(api, users, deactivate_missing=True)
+            >>> print(plan)  # 2 create, 1 update, 0 deactivate, 97 unchanged
+            >>> plan.apply()
+    """
+    remote = {}
+    for representation, remote_user in list_users(api, **params):
+        remote[representation.get("email", "").lower()] = representation, remote_user
+
+    changes = []
+    unchanged = 0
+    for user in users:
+        key = user.email.lower()
+        representation, remote_user = remote.pop(key, (None, None))
+        desired = _normalize_status(user.to_lumapps_dict())
+        if representation is None:
+            diff = diff_fields({}, desired, USER_IGNORED_FIELDS)
+            changes.append(Change("create", key, user, diff))
+            continue
+        diff = diff_fields(
+            _normalize_status(representation), desired, USER_IGNORED_FIELDS
+        )
+        if not diff:
+            unchanged += 1
+            continue
+        for field, (_, value) in diff.items():
+            remote_user.set_attribute(field, value, force=True)
+        changes.append(Change("update", key, remote_user, diff))
+
+    disabled = User.STATUS["DISABLE"]
+    for key, (representation, remote_user) in remote.items():
+        status = _normalize_status(representation).get("status")
+        if deactivate_missing and status != disabled:
+            diff = {"status": (status, disabled)}
+            changes.append(Change("deactivate", key, remote_user, diff))
+
+    plan = ReconcilePlan(api, _send_user_change, changes, unchanged)
+    logging.info("planned users changes: %s", plan)
+    return plan
+
+
+def _normalize_status(user):
+    # the status is "LIVE" or "enabled", "DISABLE" or "disabled"
+    user = dict(user)
+    if "status" in user:
+        user["status"] = User.STATUS.get(user["status"], user["status"])
+    return user
+
+
+def _send_user_change(api, change):
+    if change.action == "deactivate":
+        return deactivate(api, change.obj)
+    return save_or_update(api, change.obj)
+
+
 def list_sync(api, **params):
     # type: (ApiClient, dict) -> List[User]
     """Fetch users
@@ -472,6 +659,12 @@ def get_by_email(api, email):
         a Lumapps Feed instance
     """
     logging.info("getting user by email %s", email)
+    mirror = getattr(api, "mirror", None)
+    if mirror is not None:
+        result = mirror.get_user(email=email)
+        if result is not None:
+            return result
+
     result = api.get_call("user", "get", email=email)
     return result
 
@@ -488,5 +681,27 @@ def get_by_uid(api, uid):
         a Lumapps Feed instance
     """
     logging.info("getting user by uid %s", uid)
+    mirror = getattr(api, "mirror", None)
+    if mirror is not None:
+        result = mirror.get_user(uid=uid)
+        if result is not None:
+            return result
+
     result = api.get_call("user", "get", uid=uid)
     return result
+
+
+def get_by_emails(api, emails):
+    # type (ApiClient, list[str]) -> list[dict(str)]
+    """Get many users by email, with batched requests
+
+    Args:
+        api: the ApiClient instance to use for requests
+        emails: list of emails to fetch
+
+    Returns:
+        a list of Lumapps User resources, None for the users not found
+    """
+    logging.info("getting %s users by email", len(emails))
+    results = api.batch_call([(("user", "get"), {"email": e}) for e in emails])
+    return [result for result, _ in results]
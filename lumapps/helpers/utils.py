@@ -2,6 +2,7 @@ import uuid
 import json
 import os
 
+from collections import OrderedDict
 from functools import partial
 from operator import itemgetter
 from itertools import groupby
@@ -16,6 +17,7 @@ try:
 except ImportError:
     import csv
 
+from lumapps.utils import api_workers, parallel_imap
 to_json = partial(json.dumps, indent=4, sort_keys=True)
 
 
@@ -147,3 +149,110 @@ def read_csv_data(path, group_by=None, filter_by=None):
 
         else:
             yield (n for n in data)
+
+
+def diff_fields(remote, desired, ignore=()):
+    # type: (Dict[str], Dict[str], Tuple[str]) -> Dict[str, Tuple]
+    """Compare the fields of a desired resource with its remote version. The
+    fields left empty in the desired resource are not compared.
+
+    Args:
+        remote (Dict[str]): the remote resource
+        desired (Dict[str]): the desired resource
+        ignore (Tuple[str]): the fields not to compare
+
+    Returns:
+        a dictionary field: (remote value, desired value) of the differences
+    """
+    return dict(
+        (k, (remote.get(k), v))
+        for k, v in desired.items()
+        if k not in ignore and v not in (None, "", [], {}) and remote.get(k) != v
+    )
+
+
+class Change(object):
+    """A resource to save to reach the desired state, in a ReconcilePlan
+
+    Attributes:
+        action (str): "create", "update" or "deactivate"
+        key: the key matching the desired and remote resources
+        obj: the object to save (a User, a Group)
+        diff (Dict[str, Tuple]): the changed fields, as (remote, desired) values
+        result (Dict[str]): the saved resource, once applied
+        error (Exception): the error met applying the change, if any
+    """
+
+    def __init__(self, action, key, obj, diff=None):
+        self.action = action
+        self.key = key
+        self.obj = obj
+        self.diff = diff or {}
+        self.result = None
+        self.error = None
+
+    @property
+    def success(self):
+        return self.error is None
+
+    def __repr__(self):
+        return "<Change {} {} {}>".format(self.action, self.key, sorted(self.diff))
+
+
+class ReconcilePlan(object):
+    """The changes needed to bring remote resources to a desired state. Review
+    it (a dry run) before calling ``apply``.
+
+    Args:
+        api: the ApiClient instance to use for requests
+        send: the function sending a Change, ``send(api, change)``
+        changes (list[Change]): the resources to save
+        unchanged (int): the number of resources already up to date
+    """
+
+    ACTIONS = ("create", "update", "deactivate")
+
+    def __init__(self, api, send, changes, unchanged=0):
+        self.api = api
+        self.changes = changes
+        self.unchanged = unchanged
+        self._send = send
+
+    def __iter__(self):
+        return iter(self.changes)
+
+    def __len__(self):
+        return len(self.changes)
+
+    def counts(self):
+        # type: () -> Dict[str, int]
+        """Return the number of resources per action, and unchanged"""
+        counts = OrderedDict((action, 0) for action in self.ACTIONS)
+        for change in self.changes:
+            counts[change.action] += 1
+        counts["unchanged"] = self.unchanged
+        return counts
+
+    def __str__(self):
+        return ", ".join(
+            "{} {}".format(count, action) for action, count in self.counts().items()
+        )
+
+    def apply(self, concurrency=1):
+        # type: (int) -> list[Change]
+        """Send the changes, ``concurrency`` at a time. The errors are kept in
+        the changes, not raised. The changes are sent one at a time unless the
+        client is ``thread_safe``.
+
+        Returns:
+            the changes, with their result or error
+        """
+        sent = parallel_imap(
+            lambda change: self._send(self.api, change),
+            self.changes,
+            workers=api_workers(self.api, concurrency),
+        )
+        for idx, result, error in sent:
+            self.changes[idx].result = result
+            self.changes[idx].error = error
+        return self.changes
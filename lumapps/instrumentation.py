@@ -0,0 +1,251 @@
+"""Hooks reporting what happens inside the ApiClient API calls.
+
+Give an ``Instrumentation`` (or a list of them) to
+``ApiClient(instrumentation=...)``: its ``before_call`` and ``after_call`` are
+called around every request with a ``CallEvent``, and ``on_prune`` with the
+time spent pruning each response.
+"""
+import threading
+from collections import OrderedDict
+from time import time
+
+
+class CallEvent(object):
+    """An API call, as reported to the instrumentations.
+
+    Attributes:
+        method_parts (tuple): The API method, e.g. ("user", "list").
+        page (int): The page number, from 0. Calls that are not paginated
+            have a single page.
+        cursor (str): The cursor the page was requested with, if any.
+        status (int): The HTTP status of the last response, None if no
+            response was received.
+        latency (float): Seconds spent in the call, retries included.
+        bytes (int): Size of the response bodies received.
+        attempts (int): Number of requests sent.
+        error (Exception): The exception raised by the call, if any.
+        context (dict): Where instrumentations keep their own state between
+            ``before_call`` and ``after_call``.
+    """
+
+    def __init__(self, method_parts, page=None, cursor=None):
+        self.method_parts = tuple(method_parts)
+        self.page = page
+        self.cursor = cursor
+        self.status = None
+        self.latency = None
+        self.bytes = 0
+        self.attempts = 0
+        self.error = None
+        self.context = {}
+        self._start = time()
+
+    @property
+    def retries(self):
+        return max(0, self.attempts - 1)
+
+    @property
+    def method(self):
+        return "/".join(self.method_parts)
+
+    def finish(self, error=None):
+        self.latency = time() - self._start
+        self.error = error
+
+
+class ObservedHttp(object):
+    """Wrap an http transport to report its responses in a CallEvent."""
+
+    def __init__(self, http, event):
+        self.http = http
+        self.event = event
+
+    def __getattr__(self, name):
+        return getattr(self.http, name)
+
+    def request(self, *args, **kwargs):
+        self.event.attempts += 1
+        resp, content = self.http.request(*args, **kwargs)
+        self.event.status = resp.status
+        self.event.bytes += len(content or b"")
+        return resp, content
+
+
+class Instrumentation(object):
+    """Base class of the instrumentations. Its hooks do nothing."""
+
+    def before_call(self, event):
+        pass
+
+    def after_call(self, event):
+        pass
+
+    def on_prune(self, method_parts, seconds):
+        pass
+
+
+class MultiInstrumentation(Instrumentation):
+    """Forward the hooks to several instrumentations."""
+
+    def __init__(self, instrumentations):
+        self.instrumentations = list(instrumentations)
+
+    def before_call(self, event):
+        for instrumentation in self.instrumentations:
+            instrumentation.before_call(event)
+
+    def after_call(self, event):
+        for instrumentation in reversed(self.instrumentations):
+            instrumentation.after_call(event)
+
+    def on_prune(self, method_parts, seconds):
+        for instrumentation in self.instrumentations:
+            instrumentation.on_prune(method_parts, seconds)
+
+
+class Histogram(object):
+    """A Prometheus-style histogram: cumulative bucket counts, sum and count
+    of the observed values, per set of labels.
+
+    Args:
+        buckets (tuple): The upper bounds of the buckets.
+    """
+
+    BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+    def __init__(self, buckets=BUCKETS):
+        self.buckets = tuple(sorted(buckets)) + (float("inf"),)
+        self._series = OrderedDict()
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [[0] * len(self.buckets), 0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[0][i] += 1
+            series[1] += value
+            series[2] += 1
+
+    def get(self, **labels):
+        """Return the {"buckets": {bound: count}, "sum", "count"} of a labels
+        set, or None if nothing was observed with it.
+        """
+        with self._lock:
+            series = self._series.get(tuple(sorted(labels.items())))
+            if series is None:
+                return None
+            counts, total, count = list(series[0]), series[1], series[2]
+        return {
+            "buckets": OrderedDict(zip(self.buckets, counts)),
+            "sum": total,
+            "count": count,
+        }
+
+    def render(self, name):
+        """Return the histogram in the Prometheus text exposition format."""
+        lines = ["# TYPE {} histogram".format(name)]
+        with self._lock:
+            series = [(key, list(s[0]), s[1], s[2]) for key, s in self._series.items()]
+        for key, counts, total, count in series:
+            for bound, bucket_count in zip(self.buckets, counts):
+                le = "+Inf" if bound == float("inf") else repr(float(bound))
+                labels = _format_labels(key + (("le", le),))
+                lines.append("{}_bucket{} {}".format(name, labels, bucket_count))
+            lines.append("{}_sum{} {!r}".format(name, _format_labels(key), total))
+            lines.append("{}_count{} {}".format(name, _format_labels(key), count))
+        return "\n".join(lines)
+
+
+def _format_labels(key):
+    return "{" + ",".join('{}="{}"'.format(k, v) for k, v in key) + "}"
+
+
+class PrometheusMetrics(Instrumentation):
+    """Keep in memory histograms of the API calls latency, response size and
+    retries per method and status, and of the prune time per method.
+
+    Example:
+            >>> metrics = PrometheusMetrics()
+            >>> api = ApiClient(token=token, instrumentation=metrics)
+            >>> users = api.get_call("user", "list")
+            >>> print(metrics.render())
+    """
+
+    SIZE_BUCKETS = (1e3, 1e4, 1e5, 1e6, 1e7)
+    RETRY_BUCKETS = (0, 1, 2, 3, 5, 10)
+    PRUNE_BUCKETS = (1e-5, 1e-4, 1e-3, 1e-2, 1e-1)
+
+    def __init__(self, prefix="lumapps"):
+        self.prefix = prefix
+        self.latency = Histogram()
+        self.size = Histogram(self.SIZE_BUCKETS)
+        self.retries = Histogram(self.RETRY_BUCKETS)
+        self.prune = Histogram(self.PRUNE_BUCKETS)
+
+    def after_call(self, event):
+        labels = {"method": event.method, "status": event.status or "error"}
+        self.latency.observe(event.latency, **labels)
+        self.size.observe(event.bytes, **labels)
+        self.retries.observe(event.retries, **labels)
+
+    def on_prune(self, method_parts, seconds):
+        self.prune.observe(seconds, method="/".join(method_parts))
+
+    def render(self):
+        return "\n".join(
+            histogram.render("{}_{}".format(self.prefix, name))
+            for name, histogram in (
+                ("call_seconds", self.latency),
+                ("response_bytes", self.size),
+                ("call_retries", self.retries),
+                ("prune_seconds", self.prune),
+            )
+        )
+
+
+class OpenTelemetryTracer(Instrumentation):
+    """Emit an OpenTelemetry span per API call.
+
+    Args:
+        tracer: An opentelemetry Tracer. Defaults to the "lumapps" tracer of
+            the global tracer provider, which does nothing until an
+            opentelemetry SDK is configured.
+    """
+
+    def __init__(self, tracer=None):
+        if tracer is None:
+            try:
+                from opentelemetry import trace
+            except ImportError:  # pragma: no cover
+                raise ImportError(
+                    "OpenTelemetryTracer requires opentelemetry-api "
+                    "(pip install opentelemetry-api)"
+                )
+            tracer = trace.get_tracer("lumapps")
+        self.tracer = tracer
+
+    def before_call(self, event):
+        attributes = {"lumapps.method": event.method}
+        if event.page is not None:
+            attributes["lumapps.page"] = event.page
+        if event.cursor:
+            attributes["lumapps.cursor"] = event.cursor
+        event.context["span"] = self.tracer.start_span(
+            "lumapps " + event.method, attributes=attributes
+        )
+
+    def after_call(self, event):
+        span = event.context.pop("span", None)
+        if span is None:
+            return
+        if event.status is not None:
+            span.set_attribute("http.status_code", event.status)
+        span.set_attribute("lumapps.response_bytes", event.bytes)
+        span.set_attribute("lumapps.retries", event.retries)
+        if event.error is not None:
+            span.record_exception(event.error)
+        span.end()
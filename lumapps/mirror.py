@@ -0,0 +1,291 @@
+"""A local SQLite mirror of the LumApps users, feeds (groups), feed types and
+subscriptions, so that the helpers lookups are index queries instead of API
+calls.
+
+Attach it to the ApiClient: the helpers (``group.get_by_name``,
+``group.get_by_uid``, ``user.get_by_email``, ``User.get_groups``...) then read
+through it, and call the API only for what the mirror does not hold. The users
+and groups saved or deleted by the helpers are written through to it.
+
+    >>> api.mirror = Mirror(api, "lumapps.db")
+    >>> api.mirror.refresh()  # the first time lists everything
+    >>> api.mirror.refresh()  # then only the pages added since
+
+The listings are resumed from cursor checkpoints kept in the database: an
+incremental refresh fetches again the last page listed, then the pages added
+after it. The changes of the records listed before are only seen by a
+``refresh(full=True)``.
+"""
+import json
+import sqlite3
+import threading
+from collections import OrderedDict
+from copy import deepcopy
+from time import time
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS users (
+    uid TEXT PRIMARY KEY, email TEXT, data TEXT
+);
+CREATE INDEX IF NOT EXISTS users_email ON users (email);
+CREATE TABLE IF NOT EXISTS feeds (
+    uid TEXT PRIMARY KEY, instance TEXT, name TEXT, data TEXT
+);
+CREATE INDEX IF NOT EXISTS feeds_name ON feeds (instance, name);
+CREATE TABLE IF NOT EXISTS feedtypes (
+    uid TEXT PRIMARY KEY, instance TEXT, name TEXT, data TEXT
+);
+CREATE INDEX IF NOT EXISTS feedtypes_name ON feedtypes (name);
+CREATE TABLE IF NOT EXISTS subscriptions (
+    user TEXT, feed TEXT, PRIMARY KEY (user, feed)
+);
+CREATE INDEX IF NOT EXISTS subscriptions_feed ON subscriptions (feed);
+CREATE TABLE IF NOT EXISTS checkpoints (
+    kind TEXT PRIMARY KEY, cursor TEXT, refreshed_at REAL
+);
+"""
+
+
+def _user_row(user):
+    return user["uid"], (user.get("email") or "").lower(), json.dumps(user)
+
+
+def _named_row(obj):
+    name = obj.get("name")
+    if isinstance(name, dict):  # translated names are not indexed
+        name = None
+    return obj["uid"], obj.get("instance", ""), name, json.dumps(obj)
+
+
+class Mirror(object):
+    """A local SQLite copy of the users, feeds, feed types and subscriptions.
+
+    Args:
+        api (ApiClient): The client the records are listed with.
+        path (str): The SQLite database file. Defaults to an in-memory
+            database.
+    """
+
+    # kind: the method listing it, its parameters, and whether it is paginated
+    KINDS = OrderedDict(
+        [
+            ("users", (("user", "list"), {}, True)),
+            ("feeds", (("feed", "search"), {"body": {}}, True)),
+            ("feedtypes", (("feedtype", "list"), {}, False)),
+        ]
+    )
+
+    def __init__(self, api, path=":memory:"):
+        self.api = api
+        self.path = path
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._lock = threading.Lock()
+        with self._lock:
+            self._db.executescript(SCHEMA)
+
+    def close(self):
+        self._db.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def refresh(self, kinds=None, full=False):
+        """List the records from the API and store them.
+
+        Args:
+            kinds (list): The kinds to refresh, among ``KINDS``. Defaults to
+                all of them.
+            full (bool): Whether to list everything again, instead of resuming
+                from the last checkpoint. Only a full refresh forgets the
+                deleted records.
+
+        Returns:
+            dict: The number of records received per kind.
+        """
+        counts = OrderedDict()
+        for kind in kinds or self.KINDS:
+            counts[kind] = self._refresh(kind, full)
+        return counts
+
+    def _refresh(self, kind, full):
+        method_parts, params, paginated = self.KINDS[kind]
+        params = deepcopy(params)
+        if kind == "feedtypes" and getattr(self.api, "customer", None):
+            params["customer"] = self.api.customer
+        full = full or not paginated
+        cursor = None if full else self.checkpoint(kind)
+        rows = []
+        # page: the cursor of the page being listed, stored as the checkpoint
+        # of the last page so that the next refresh lists it again.
+        # clear: a full refresh replaces the records with the first page.
+        state = {"page": cursor, "clear": full}
+
+        def checkpoint(next_cursor):
+            page_cursor = next_cursor or state["page"]
+            self._store(kind, rows, page_cursor, state["clear"])
+            state.update(page=page_cursor, clear=False)
+            del rows[:]
+
+        count = 0
+        items = self.api.iter_call(
+            *method_parts, start_cursor=cursor, checkpoint=checkpoint, **params
+        )
+        for item in items:
+            rows.append(item)
+            count += 1
+        return count
+
+    def _store(self, kind, items, cursor, clear=False):
+        with self._lock, self._db:
+            if clear:
+                self._db.execute("DELETE FROM {}".format(kind))
+                if kind == "users":
+                    self._db.execute("DELETE FROM subscriptions")
+            if kind == "users":
+                self._store_users(items)
+            else:
+                self._db.executemany(
+                    "INSERT OR REPLACE INTO {} VALUES (?, ?, ?, ?)".format(kind),
+                    [_named_row(item) for item in items],
+                )
+            self._db.execute(
+                "INSERT OR REPLACE INTO checkpoints VALUES (?, ?, ?)",
+                (kind, cursor, time()),
+            )
+
+    def _store_users(self, users):
+        self._db.executemany(
+            "INSERT OR REPLACE INTO users VALUES (?, ?, ?)",
+            [_user_row(user) for user in users],
+        )
+        self._db.executemany(
+            "DELETE FROM subscriptions WHERE user = ?", [(u["uid"],) for u in users]
+        )
+        self._db.executemany(
+            "INSERT OR IGNORE INTO subscriptions VALUES (?, ?)",
+            [(user["uid"], feed) for user in users for feed in _user_feeds(user)],
+        )
+
+    def put_user(self, user):
+        """Store a user saved through the API. Its subscriptions are only
+        replaced when the resource lists them.
+        """
+        with self._lock, self._db:
+            if "subscriptions" in user or "feeds" in user:
+                self._store_users([user])
+            else:
+                self._db.execute(
+                    "INSERT OR REPLACE INTO users VALUES (?, ?, ?)", _user_row(user)
+                )
+
+    def put_feed(self, feed):
+        """Store a feed saved through the API."""
+        with self._lock, self._db:
+            self._db.execute(
+                "INSERT OR REPLACE INTO feeds VALUES (?, ?, ?, ?)", _named_row(feed)
+            )
+
+    def delete_feed(self, uid):
+        """Forget a feed deleted through the API, and its subscriptions."""
+        with self._lock, self._db:
+            self._db.execute("DELETE FROM feeds WHERE uid = ?", (uid,))
+            self._db.execute("DELETE FROM subscriptions WHERE feed = ?", (uid,))
+
+    def save_subscribers(self, feed_uid, added_emails=(), removed_uids=()):
+        """Store the subscribers of a feed saved through the API: the users
+        added by email, as in ``feed/subscribers/save``, are only subscribed
+        if they are mirrored.
+        """
+        with self._lock, self._db:
+            self._db.executemany(
+                "INSERT OR IGNORE INTO subscriptions "
+                "SELECT uid, ? FROM users WHERE email = ?",
+                [(feed_uid, email.lower()) for email in added_emails if email],
+            )
+            self._db.executemany(
+                "DELETE FROM subscriptions WHERE user = ? AND feed = ?",
+                [(uid, feed_uid) for uid in removed_uids if uid],
+            )
+
+    def checkpoint(self, kind):
+        """Return the cursor an incremental refresh of ``kind`` resumes from."""
+        row = self._query_one("SELECT cursor FROM checkpoints WHERE kind = ?", kind)
+        return row[0] if row else None
+
+    def refreshed_at(self, kind):
+        """Return the timestamp of the last stored page of ``kind``, or None."""
+        row = self._query_one(
+            "SELECT refreshed_at FROM checkpoints WHERE kind = ?", kind
+        )
+        return row[0] if row else None
+
+    def _query(self, sql, *args):
+        with self._lock:
+            return self._db.execute(sql, args).fetchall()
+
+    def _query_one(self, sql, *args):
+        rows = self._query(sql, *args)
+        return rows[0] if rows else None
+
+    def count(self, kind):
+        return self._query_one("SELECT COUNT(*) FROM {}".format(kind))[0]
+
+    def get_user(self, email="", uid=""):
+        """Return a user by uid or email, None if it is not mirrored."""
+        if uid:
+            row = self._query_one("SELECT data FROM users WHERE uid = ?", uid)
+        else:
+            row = self._query_one(
+                "SELECT data FROM users WHERE email = ?", email.lower()
+            )
+        return json.loads(row[0]) if row else None
+
+    def get_feed(self, uid):
+        """Return a feed by uid, None if it is not mirrored."""
+        row = self._query_one("SELECT data FROM feeds WHERE uid = ?", uid)
+        return json.loads(row[0]) if row else None
+
+    def get_feeds(self, uids):
+        """Return the mirrored feeds among ``uids``."""
+        feeds = (self.get_feed(uid) for uid in uids)
+        return [feed for feed in feeds if feed is not None]
+
+    def find_feeds(self, name, instance=""):
+        """Return the feeds of an instance with this exact name."""
+        rows = self._query(
+            "SELECT data FROM feeds WHERE instance = ? AND name = ?", instance, name
+        )
+        return [json.loads(row[0]) for row in rows]
+
+    def find_feedtypes(self, label, instance=""):
+        """Return the feed types with this uid or name, of the instance or of
+        the platform.
+        """
+        rows = self._query(
+            "SELECT data FROM feedtypes WHERE (uid = ? OR name = ?) "
+            "AND instance IN (?, '')",
+            str(label),
+            str(label),
+            instance or "",
+        )
+        return [json.loads(row[0]) for row in rows]
+
+    def get_subscriptions(self, user_uid):
+        """Return the uids of the feeds a user is subscribed to."""
+        rows = self._query("SELECT feed FROM subscriptions WHERE user = ?", user_uid)
+        return [row[0] for row in rows]
+
+    def get_subscribers(self, feed_uid):
+        """Return the uids of the users subscribed to a feed."""
+        rows = self._query("SELECT user FROM subscriptions WHERE feed = ?", feed_uid)
+        return [row[0] for row in rows]
+
+
+def _user_feeds(user):
+    # the user resources list their feeds uids, and their subscriptions
+    feeds = [sub.get("feed") for sub in user.get("subscriptions") or []]
+    feeds.extend(user.get("feeds") or [])
+    return [feed for feed in feeds if feed]
@@ -0,0 +1,189 @@
+import sqlite3
+import threading
+from time import sleep, time
+
+
+class TokenBucket(object):
+    """A thread-safe token bucket.
+
+    Args:
+        rate (float): Number of tokens added per second.
+        capacity (float): Maximum number of tokens, i.e. the allowed burst.
+            Defaults to ``rate``, and to 1 for a rate below 1.
+    """
+
+    def __init__(self, rate, capacity=None):
+        self.rate = float(rate)
+        self.capacity = float(capacity or max(rate, 1))
+        self._tokens = self.capacity
+        self._last = None
+        self._lock = threading.Lock()
+        self._time = time
+        self._sleep = sleep
+
+    def _take(self, tokens):
+        """Take ``tokens`` tokens if available.
+
+        Returns:
+            float: 0 if the tokens were taken, otherwise the number of seconds
+            to wait for them.
+        """
+        with self._lock:
+            now = self._time()
+            if self._last is not None:
+                elapsed = max(0.0, now - self._last)
+                self._tokens = min(self.capacity, self._tokens + elapsed * self.rate)
+            self._last = now
+            if self._tokens >= tokens:
+                self._tokens -= tokens
+                return 0
+            return (tokens - self._tokens) / self.rate
+
+    def acquire(self, tokens=1):
+        """Block until ``tokens`` tokens are available and take them.
+
+        Returns:
+            float: the number of seconds spent waiting.
+
+        Raises:
+            ValueError: if ``tokens`` exceeds the capacity, as they would
+                never be available.
+        """
+        if tokens > self.capacity:
+            raise ValueError(
+                "{} tokens exceed the bucket capacity {}".format(tokens, self.capacity)
+            )
+        waited = 0
+        while True:
+            delay = self._take(tokens)
+            if not delay:
+                return waited
+            self._sleep(delay)
+            waited += delay
+
+
+class SqliteTokenBucket(TokenBucket):
+    """A token bucket shared by several processes, stored in a sqlite database.
+
+    Args:
+        path (str): Path of the sqlite database file.
+        key (str): Name of the bucket in the database.
+        rate (float): Number of tokens added per second.
+        capacity (float): Maximum number of tokens. Defaults to ``rate``,
+            and to 1 for a rate below 1.
+    """
+
+    def __init__(self, path, key, rate, capacity=None):
+        super(SqliteTokenBucket, self).__init__(rate, capacity)
+        self.path = path
+        self.key = key
+        self._local = threading.local()
+        self._connection().execute(
+            "CREATE TABLE IF NOT EXISTS buckets "
+            "(key TEXT PRIMARY KEY, tokens REAL, last REAL)"
+        )
+
+    def _connection(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            self._local.conn = conn
+        return conn
+
+    def _take(self, tokens):
+        conn = self._connection()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            now = self._time()
+            row = conn.execute(
+                "SELECT tokens, last FROM buckets WHERE key = ?", (self.key,)
+            ).fetchone()
+            available = self.capacity
+            if row is not None:
+                elapsed = max(0.0, now - row[1])
+                available = min(self.capacity, row[0] + elapsed * self.rate)
+            delay = 0
+            if available >= tokens:
+                available -= tokens
+            else:
+                delay = (tokens - available) / self.rate
+            conn.execute(
+                "INSERT OR REPLACE INTO buckets (key, tokens, last) VALUES (?, ?, ?)",
+                (self.key, available, now),
+            )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return delay
+
+
+class RateLimitedHttp(object):
+    """Wrap an http transport to wait for the rate limiter before each
+    request it sends, the retries included.
+    """
+
+    def __init__(self, http, rate_limiter, method_parts):
+        self.http = http
+        self.rate_limiter = rate_limiter
+        self.method_parts = method_parts
+
+    def __getattr__(self, name):
+        return getattr(self.http, name)
+
+    def request(self, *args, **kwargs):
+        self.rate_limiter.acquire(self.method_parts)
+        return self.http.request(*args, **kwargs)
+
+
+class RateLimiter(object):
+    """Client side rate limiting of the API calls, with a token bucket per
+    customer and method family (the first part of the method, e.g. "user").
+
+    Args:
+        rate (float): Allowed number of calls per second of a method family.
+        capacity (float): Allowed burst of calls. Defaults to ``rate``, and
+            to 1 for a rate below 1.
+        customer (str): The customer the calls are made for, used to share
+            the buckets between clients of the same customer. Defaults to
+            "default".
+        rates (dict): Method family -> rate, overriding ``rate``.
+        path (str): A sqlite database path to share the buckets between
+            processes. By default the buckets are only shared in-process.
+
+    Example:
+            >>> limiter = RateLimiter(10, customer="1234", path="/tmp/lumapps.db")
+            >>> api = ApiClient(token=token, rate_limiter=limiter)
+    """
+
+    def __init__(self, rate, capacity=None, customer="default", rates=None, path=None):
+        self.rate = rate
+        self.capacity = capacity
+        self.customer = customer
+        self.rates = rates or {}
+        self.path = path
+        self._buckets = {}
+        self._lock = threading.Lock()
+
+    def get_bucket(self, family):
+        key = "{}:{}".format(self.customer, family)
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            with self._lock:
+                if key not in self._buckets:
+                    rate = self.rates.get(family, self.rate)
+                    if self.path:
+                        bucket = SqliteTokenBucket(self.path, key, rate, self.capacity)
+                    else:
+                        bucket = TokenBucket(rate, self.capacity)
+                    self._buckets[key] = bucket
+                bucket = self._buckets[key]
+        return bucket
+
+    def acquire(self, method_parts, tokens=1):
+        """Wait until a call to the method is allowed.
+
+        Returns:
+            float: the number of seconds spent waiting.
+        """
+        return self.get_bucket(method_parts[0]).acquire(tokens)
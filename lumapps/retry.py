@@ -0,0 +1,132 @@
+import logging
+import random
+import socket
+import threading
+from collections import deque
+from email.utils import mktime_tz, parsedate_tz
+from time import sleep, time
+
+import httplib2
+from googleapiclient.errors import HttpError
+
+
+def parse_retry_after(value):
+    """Parse a Retry-After header value, either a number of seconds or an
+    HTTP date.
+
+    Returns:
+        float: the number of seconds to wait, None if the value is invalid.
+    """
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    date = parsedate_tz(value)
+    if date is None:
+        return None
+    return max(0.0, mktime_tz(date) - time())
+
+
+class RetryPolicy(object):
+    """Retry policy of the API calls: exponential backoff with full jitter.
+
+    A request is retried when it fails with one of the ``statuses`` or with a
+    transport error. The ``Retry-After`` header of the response, if any, is
+    used instead of the computed backoff.
+
+    Args:
+        max_retries (int): Maximum number of retries of a request.
+            Defaults to 5.
+        base_delay (float): Backoff of the first retry, in seconds. Defaults
+            to 0.5.
+        max_delay (float): Maximum backoff, in seconds. Defaults to 60.
+        statuses (dict): HTTP status -> maximum number of retries of a
+            request failing with that status. Defaults to
+            ``RetryPolicy.STATUSES``.
+        budget (int): Maximum number of retries over ``budget_period``
+            seconds, shared by every request using the policy. Defaults to
+            None (no budget).
+        budget_period (float): The budget window, in seconds. Defaults to 60.
+
+    Example:
+            >>> api = ApiClient(token=token, retry_policy=RetryPolicy(budget=100))
+    """
+
+    STATUSES = {429: 5, 500: 3, 502: 5, 503: 5, 504: 5}
+    TRANSPORT_ERRORS = (socket.error, httplib2.HttpLib2Error)
+
+    def __init__(
+        self,
+        max_retries=5,
+        base_delay=0.5,
+        max_delay=60,
+        statuses=None,
+        budget=None,
+        budget_period=60,
+    ):
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.statuses = dict(self.STATUSES if statuses is None else statuses)
+        self.budget = budget
+        self.budget_period = budget_period
+        self._retries = deque()
+        self._lock = threading.Lock()
+        self._sleep = sleep
+
+    def _consume_budget(self):
+        if self.budget is None:
+            return True
+        with self._lock:
+            now = time()
+            while self._retries and self._retries[0] <= now - self.budget_period:
+                self._retries.popleft()
+            if len(self._retries) >= self.budget:
+                return False
+            self._retries.append(now)
+            return True
+
+    def should_retry(self, status, attempt):
+        """Whether a request failing with ``status`` (None for a transport
+        error) should be retried after ``attempt`` retries.
+        """
+        limit = self.max_retries
+        if status is not None:
+            if status not in self.statuses:
+                return False
+            limit = min(limit, self.statuses[status])
+        return attempt < limit and self._consume_budget()
+
+    def get_delay(self, attempt, retry_after=None):
+        """Number of seconds to wait before the retry number ``attempt``."""
+        if retry_after is not None:
+            return min(retry_after, self.max_delay)
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+
+    def call(self, func, *args, **kwargs):
+        """Call ``func`` and retry it according to the policy."""
+        attempt = 0
+        while True:
+            try:
+                return func(*args, **kwargs)
+            except HttpError as err:
+                status = err.resp.status
+                retry_after = parse_retry_after(err.resp.get("retry-after"))
+                if not self.should_retry(status, attempt):
+                    raise
+            except self.TRANSPORT_ERRORS:
+                status, retry_after = None, None
+                if not self.should_retry(status, attempt):
+                    raise
+            delay = self.get_delay(attempt, retry_after)
+            attempt += 1
+            logging.warning(
+                "retrying request (%s/%s) in %.2fs after status %s",
+                attempt,
+                self.max_retries,
+                delay,
+                status,
+            )
+            self._sleep(delay)
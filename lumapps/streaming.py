@@ -0,0 +1,194 @@
+import codecs
+import json
+import re
+
+_WHITESPACE = re.compile(r"[ \t\n\r]*")
+_DECODER = json.JSONDecoder()
+# the characters changing the nesting of a value, or in or out of a string
+_SPECIAL = re.compile(r'[\\"{}\[\]]')
+_SCALAR_END = re.compile(r"[ \t\n\r,\]}]")
+
+
+class _NeedMoreData(Exception):
+    pass
+
+
+class _Scanner(object):
+    """Find where a JSON value read by pieces ends, looking at each piece
+    once, so that the value is decoded once instead of after every chunk.
+    """
+
+    def __init__(self, first_char):
+        self.scalar = first_char not in '{["'
+        self.depth = 0
+        self.in_string = False
+        self.escaped = False
+
+    def feed(self, text, start=0):
+        """Scan ``text[start:]``.
+
+        Returns:
+            bool: whether the value ends in it.
+        """
+        if self.scalar:
+            return _SCALAR_END.search(text, start) is not None
+        i = start
+        if self.escaped:
+            if i >= len(text):
+                return False
+            i += 1
+            self.escaped = False
+        while True:
+            match = _SPECIAL.search(text, i)
+            if match is None:
+                return False
+            i = match.start()
+            char = text[i]
+            if self.in_string:
+                if char == "\\":
+                    if i + 1 >= len(text):
+                        self.escaped = True
+                        return False
+                    i += 2
+                    continue
+                if char == '"':
+                    self.in_string = False
+                    if self.depth == 0:
+                        return True
+            elif char == '"':
+                self.in_string = True
+            elif char in "{[":
+                self.depth += 1
+            elif char in "}]":
+                self.depth -= 1
+                if self.depth == 0:
+                    return True
+            i += 1
+
+
+class _Buffer(object):
+    """The text read so far, and the position of the parser in it."""
+
+    def __init__(self, chunks):
+        self._chunks = iter(chunks)
+        self._decoder = codecs.getincrementaldecoder("utf-8")()
+        self.text = ""
+        self.pos = 0
+        self.eof = False
+        # the value spanning several chunks being scanned, and its chunks
+        self._scanner = None
+        self._pending = []
+        self._complete = False
+
+    def read_more(self):
+        if self.eof:
+            raise ValueError("Truncated JSON document")
+        if self.pos > 65536:
+            self.text, self.pos = self.text[self.pos :], 0
+        try:
+            chunk = next(self._chunks)
+        except StopIteration:
+            self.eof = True
+            chunk = self._decoder.decode(b"", final=True)
+        if isinstance(chunk, bytes):
+            chunk = self._decoder.decode(chunk)
+        if self._scanner is None:
+            self.text += chunk
+        else:
+            self._pending.append(chunk)
+            self._complete = self._complete or self._scanner.feed(chunk)
+
+    def peek(self):
+        """Skip whitespaces and return the next character."""
+        self.pos = _WHITESPACE.match(self.text, self.pos).end()
+        if self.pos >= len(self.text):
+            raise _NeedMoreData()
+        return self.text[self.pos]
+
+    def expect(self, chars):
+        char = self.peek()
+        if char not in chars:
+            raise ValueError(
+                "Expecting one of {!r} at {}, got {!r}".format(chars, self.pos, char)
+            )
+        self.pos += 1
+        return char
+
+    def value(self):
+        self.peek()
+        if self._scanner is None:
+            try:
+                value, end = _DECODER.raw_decode(self.text, self.pos)
+            except ValueError:
+                if self.eof:
+                    raise
+                # an incomplete value: scan the next chunks as they come
+                self._scanner = _Scanner(self.text[self.pos])
+                self._complete = self._scanner.feed(self.text, self.pos)
+            else:
+                if end >= len(self.text) and not self.eof:
+                    # a number or literal may continue in the next chunk
+                    raise _NeedMoreData()
+                self.pos = end
+                return value
+        if not (self._complete or self.eof):
+            raise _NeedMoreData()
+        self.text += "".join(self._pending)
+        self._scanner, self._pending, self._complete = None, [], False
+        value, self.pos = _DECODER.raw_decode(self.text, self.pos)
+        return value
+
+
+def iter_items(chunks, page, items_key="items"):
+    """Incrementally parse a JSON object read by chunks, yielding the elements
+    of its ``items_key`` array as soon as they are read.
+
+    Args:
+        chunks (iterable): The bytes (or text) chunks of the JSON document.
+        page (dict): Filled with the other members of the object, e.g.
+            ``cursor`` and ``more``, as they are read.
+        items_key (str): The name of the array to stream. Defaults to "items".
+
+    Yields:
+        the elements of the array.
+    """
+    buf = _Buffer(chunks)
+    state = "start"
+    key = None
+    while state != "end":
+        try:
+            if state == "start":
+                buf.expect("{")
+                state = "key"
+            elif state == "key":
+                if buf.peek() == "}":
+                    buf.pos += 1
+                    state = "end"
+                    continue
+                key = buf.value()
+                state = "colon"
+            elif state == "colon":
+                buf.expect(":")
+                state = "value"
+            elif state == "value":
+                if key == items_key and buf.peek() == "[":
+                    buf.pos += 1
+                    state = "first_item"
+                else:
+                    page[key] = buf.value()
+                    state = "member_sep"
+            elif state == "member_sep":
+                state = "key" if buf.expect(",}") == "," else "end"
+            elif state == "first_item":
+                if buf.peek() == "]":
+                    buf.pos += 1
+                    state = "member_sep"
+                else:
+                    state = "item"
+            elif state == "item":
+                yield buf.value()
+                state = "item_sep"
+            elif state == "item_sep":
+                state = "item" if buf.expect(",]") == "," else "member_sep"
+        except _NeedMoreData:
+            buf.read_more()
@@ -0,0 +1,488 @@
+"""Offline stand-ins of the LumApps API, to test and benchmark code using the
+ApiClient without credentials nor network.
+
+- ``MockLumApps`` serves a discovery document and paginated data sets through
+  the httplib2 interface, so it can be given to ``ApiClient(http=...)``.
+- ``MockLumAppsServer`` serves a ``MockLumApps`` on a local port, for the
+  code paths that do not use httplib2 (streaming, the AsyncApiClient).
+- ``RecordingTransport`` records the responses of another transport, e.g. of
+  the real API, and ``ReplayTransport`` serves them back.
+"""
+import json
+import random
+import threading
+from time import sleep
+
+import httplib2
+
+from lumapps.client import ApiClient
+
+try:
+    from urllib.parse import parse_qsl, urlsplit
+except ImportError:  # python 2
+    from urlparse import parse_qsl, urlsplit
+
+try:
+    from http.server import BaseHTTPRequestHandler, HTTPServer
+    from socketserver import ThreadingMixIn
+except ImportError:  # python 2
+    from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+    from SocketServer import ThreadingMixIn
+
+LIST_METHODS = {
+    "user/list": "user",
+    "feed/search": "feed",
+    "feedtype/list": "feedtype",
+    "community/list": "community",
+    "media/list": "media",
+}
+
+
+def make_user(i):
+    return {
+        "uid": "user-{}".format(i),
+        "id": "user-{}".format(i),
+        "email": "user{}@example.com".format(i),
+        "firstName": "First{}".format(i),
+        "lastName": "Last{}".format(i),
+        "fullName": "First{0} Last{0}".format(i),
+        "customer": "customer",
+        "status": "enabled",
+        "isHidden": False,
+        "feeds": [],
+    }
+
+
+def make_feed(i):
+    return {
+        "uid": "feed-{}".format(i),
+        "id": "feed-{}".format(i),
+        "name": "Feed {}".format(i),
+        "customer": "customer",
+        "instance": "",
+        "type": "feedtype-1",
+        "group": "",
+    }
+
+
+def make_feedtype(i):
+    return {
+        "uid": "feedtype-{}".format(i),
+        "id": "feedtype-{}".format(i),
+        "name": "Feed type {}".format(i),
+        "customer": "customer",
+        "instance": "",
+    }
+
+
+def make_community(i):
+    return {
+        "uid": "community-{}".format(i),
+        "id": "community-{}".format(i),
+        "title": {"en": "Community {}".format(i)},
+        "customer": "customer",
+        "instance": "instance-1",
+        "status": "LIVE",
+        "privacy": "open",
+        "authorDetails": {"email": "user0@example.com", "uid": "user-0"},
+        "adminKeys": ["user-0"],
+        "usersDetails": [],
+    }
+
+
+def make_media(i):
+    return {
+        "uid": "media-{}".format(i),
+        "id": "media-{}".format(i),
+        "name": {"en": "media-{}.png".format(i)},
+        "customer": "customer",
+        "instance": "instance-1",
+        "isFolder": False,
+        "content": [{"lang": "en", "mimeType": "image/png", "size": 1024}],
+    }
+
+
+FACTORIES = {
+    "user": make_user,
+    "feed": make_feed,
+    "feedtype": make_feedtype,
+    "community": make_community,
+    "media": make_media,
+}
+
+
+class MockLumApps(object):
+    """An in-process LumApps API, usable as the http transport of an ApiClient.
+
+    It serves the discovery document, the paginated ``user/list``,
+    ``feed/search``, ``feedtype/list``, ``community/list`` and ``media/list``
+    methods, and the ``get`` and ``save`` methods of the same objects. Other
+    methods can be added with ``add_route``.
+
+    Args:
+        discovery (dict or str): The discovery document, or its file path.
+        base_url (str): The url the API is served at. Defaults to
+            "http://lumapps.mock".
+        users, feeds, feedtypes, communities, medias (int or list): The
+            objects served, or the number of objects to generate.
+        page_size (int): Number of items per page when the call does not give
+            a ``maxResults``. Defaults to 30.
+        latency (float): Seconds waited before answering each request.
+        error_rate (float): Probability of answering a request with one of
+            ``error_statuses`` instead of its response.
+        error_statuses (tuple): Defaults to (429, 503).
+        seed: Seed of the random generator used for the errors.
+
+    Example:
+            >>> mock = MockLumApps("tests/test_data/lumapps_discovery.json")
+            >>> api = mock.client()
+            >>> len(api.get_call("user", "list"))
+            100
+            >>> mock.fail(503, count=2)  # the next 2 requests fail
+    """
+
+    def __init__(
+        self,
+        discovery,
+        base_url="http://lumapps.mock",
+        users=100,
+        feeds=10,
+        feedtypes=3,
+        communities=20,
+        medias=20,
+        page_size=30,
+        latency=0,
+        error_rate=0,
+        error_statuses=(429, 503),
+        seed=None,
+    ):
+        if not isinstance(discovery, dict):
+            with open(discovery) as fh:
+                discovery = json.load(fh)
+        self.discovery = discovery
+        self.base_url = base_url.rstrip("/")
+        self.page_size = page_size
+        self.latency = latency
+        self.error_rate = error_rate
+        self.error_statuses = error_statuses
+        self.timeout = None
+        self.data = {}
+        for kind, objects in (
+            ("user", users),
+            ("feed", feeds),
+            ("feedtype", feedtypes),
+            ("community", communities),
+            ("media", medias),
+        ):
+            if isinstance(objects, int):
+                objects = [FACTORIES[kind](i) for i in range(objects)]
+            self.data[kind] = list(objects)
+        self.calls = []
+        self._routes = {}
+        self._failures = []
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def client(self, **kwargs):
+        """Return an ApiClient of this mock API."""
+        api_info = {
+            "name": self.discovery["name"],
+            "version": self.discovery["version"],
+            "base_url": self.base_url,
+        }
+        kwargs.setdefault("token", "mock-token")
+        if "http" not in kwargs:
+            # the mock answers concurrent requests: the pool can share it
+            kwargs["http"] = self
+            kwargs.setdefault("http_factory", lambda: self)
+        return ApiClient(api_info=api_info, **kwargs)
+
+    def add_route(self, method, handler):
+        """Serve an API method, e.g. "user/save", with ``handler(params)``
+        returning the (status, response object) of the call, None for an empty
+        response. ``params`` holds the query parameters, and the decoded
+        ``body`` if any.
+        """
+        self._routes[method] = handler
+
+    def fail(self, status, count=1, retry_after=None):
+        """Answer the next ``count`` requests with an error ``status``."""
+        with self._lock:
+            self._failures.extend([(status, retry_after)] * count)
+
+    def request(
+        self, uri, method="GET", body=None, headers=None, redirections=5, **kwargs
+    ):
+        """The httplib2.Http.request interface."""
+        status, response_headers, content = self.handle(method, uri, body)
+        info = dict(response_headers, status=status)
+        return httplib2.Response(info), content
+
+    def handle(self, method, uri, body=None):
+        """Answer a request.
+
+        Returns:
+            tuple: the response status, headers and content (bytes).
+        """
+        if self.latency:
+            sleep(self.latency)
+        path = urlsplit(uri).path
+        with self._lock:
+            failure = self._pop_failure()
+        if failure is not None:
+            status, retry_after = failure
+            headers = {"retry-after": str(retry_after)} if retry_after else {}
+            return self._respond(status, _error(status, "Injected error"), headers)
+        if path.endswith("/rest"):
+            return self._respond(200, self._get_discovery())
+        prefix = "/_ah/api/" + self.discovery.get("servicePath", "")
+        if not path.startswith(prefix):
+            return self._respond(404, _error(404, "Unknown path " + path))
+        api_method = path[len(prefix) :]
+        params = dict(parse_qsl(urlsplit(uri).query))
+        if body:
+            if isinstance(body, bytes):
+                body = body.decode("utf-8")
+            params["body"] = json.loads(body)
+        with self._lock:
+            self.calls.append(api_method)
+            status, response = self._call(api_method, params)
+        return self._respond(status, response)
+
+    def _pop_failure(self):
+        if self._failures:
+            return self._failures.pop(0)
+        if self.error_rate and self._random.random() < self.error_rate:
+            return self._random.choice(self.error_statuses), None
+        return None
+
+    def _get_discovery(self):
+        document = dict(self.discovery)
+        document["rootUrl"] = self.base_url + "/_ah/api/"
+        document["baseUrl"] = document["rootUrl"] + document.get("servicePath", "")
+        return document
+
+    def _call(self, api_method, params):
+        # the responses are serialized right away, the data is never copied
+        if api_method in self._routes:
+            return self._routes[api_method](params)
+        if api_method in LIST_METHODS:
+            return self._list(self.data[LIST_METHODS[api_method]], params)
+        kind, _, action = api_method.partition("/")
+        if kind in self.data and action == "get":
+            return self._get(self.data[kind], params)
+        if kind in self.data and action == "save":
+            return self._save(kind, params.get("body") or {})
+        return 404, _error(404, "Unknown method " + api_method)
+
+    def _list(self, objects, params):
+        body = params.get("body") or {}
+        if body.get("instance"):
+            objects = [o for o in objects if o.get("instance") == body["instance"]]
+        if body.get("query"):
+            query = body["query"].lower()
+            objects = [o for o in objects if query in str(o.get("name")).lower()]
+        cursor = body.get("cursor", params.get("cursor"))
+        size = body.get("maxResults", params.get("maxResults")) or self.page_size
+        start = int(cursor or 0)
+        end = start + int(size)
+        response = {"items": objects[start:end], "more": end < len(objects)}
+        if response["more"]:
+            response["cursor"] = str(end)
+        return 200, response
+
+    def _get(self, objects, params):
+        for obj in objects:
+            if any(
+                params.get(key) and obj.get(key) == params[key]
+                for key in ("uid", "email")
+            ):
+                return 200, obj
+        return 404, _error(404, "Not found")
+
+    def _save(self, kind, obj):
+        objects = self.data[kind]
+        for i, existing in enumerate(objects):
+            if obj.get("uid") and existing.get("uid") == obj["uid"]:
+                objects[i] = dict(existing, **obj)
+                return 200, objects[i]
+        obj["uid"] = obj.get("uid") or "{}-{}".format(kind, len(objects))
+        obj["id"] = obj.get("id") or obj["uid"]
+        objects.append(obj)
+        return 200, obj
+
+    def _respond(self, status, obj, headers=None):
+        headers = dict(headers or {}, **{"content-type": "application/json"})
+        content = b"" if obj is None else json.dumps(obj).encode("utf-8")
+        return status, headers, content
+
+
+def _error(status, message):
+    return {"error": {"code": status, "message": message}}
+
+
+class _Handler(BaseHTTPRequestHandler):
+    def _handle(self):
+        length = int(self.headers.get("content-length") or 0)
+        body = self.rfile.read(length) if length else None
+        status, headers, content = self.server.lumapps.handle(
+            self.command, self.path, body
+        )
+        self.send_response(status)
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.send_header("content-length", str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+
+    do_GET = do_POST = do_PUT = do_DELETE = _handle
+
+    def log_message(self, *args):
+        pass
+
+
+class _ThreadingHTTPServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+
+class MockLumAppsServer(object):
+    """Serve a MockLumApps on a local port, in a background thread.
+
+    Example:
+            >>> with MockLumAppsServer(MockLumApps(discovery_path)) as server:
+            ...     api = server.client(thread_safe=True)
+            ...     users = list(api.iter_call("user", "list", stream=True))
+    """
+
+    def __init__(self, lumapps, host="127.0.0.1", port=0):
+        self.lumapps = lumapps
+        self._server = _ThreadingHTTPServer((host, port), _Handler)
+        self._server.lumapps = lumapps
+        self._thread = None
+        lumapps.base_url = "http://{}:{}".format(*self._server.server_address[:2])
+
+    @property
+    def base_url(self):
+        return self.lumapps.base_url
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever)
+        self._thread.daemon = True
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+        self._thread.join()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def client(self, **kwargs):
+        """Return an ApiClient sending its requests to the server."""
+        kwargs.setdefault("http", httplib2.Http())
+        return self.lumapps.client(**kwargs)
+
+
+class RecordingTransport(object):
+    """Wrap an http transport and record its responses, to replay them later
+    with a ReplayTransport. The request headers (credentials) are not
+    recorded.
+
+    Example:
+            >>> recorder = RecordingTransport(httplib2.Http())
+            >>> api = ApiClient(auth_info, http=recorder)
+            >>> users = api.get_call("user", "list")
+            >>> recorder.save("users.json")
+    """
+
+    def __init__(self, http):
+        self.http = http
+        self.records = []
+        self._lock = threading.Lock()
+
+    @property
+    def timeout(self):
+        return getattr(self.http, "timeout", None)
+
+    def request(self, uri, method="GET", body=None, headers=None, **kwargs):
+        resp, content = self.http.request(
+            uri, method=method, body=body, headers=headers, **kwargs
+        )
+        record = {
+            "method": method,
+            "uri": uri,
+            "body": _text(body),
+            "status": resp.status,
+            "headers": {
+                k: v for k, v in resp.items() if k not in ("status", "content-location")
+            },
+            "content": _text(content),
+        }
+        with self._lock:
+            self.records.append(record)
+        return resp, content
+
+    def save(self, path):
+        with open(path, "wt") as fh:
+            json.dump(self.records, fh, indent=4)
+
+
+class ReplayTransport(object):
+    """Serve the responses recorded by a RecordingTransport. A request gets
+    the first unused response recorded for the same method, uri and body.
+
+    Args:
+        records (list or str): The records, or the json file they were saved
+            to.
+        latency (float): Seconds waited before answering each request.
+    """
+
+    def __init__(self, records, latency=0):
+        if not isinstance(records, list):
+            with open(records) as fh:
+                records = json.load(fh)
+        self.records = records
+        self.latency = latency
+        self.timeout = None
+        self._used = set()
+        self._lock = threading.Lock()
+
+    def request(self, uri, method="GET", body=None, headers=None, **kwargs):
+        if self.latency:
+            sleep(self.latency)
+        key = (method, uri, _normalize(_text(body)))
+        with self._lock:
+            for i, record in enumerate(self.records):
+                if i in self._used:
+                    continue
+                if key == (record["method"], record["uri"], _normalize(record["body"])):
+                    if not record["uri"].endswith("/rest"):
+                        # the discovery document can be fetched any number of times
+                        self._used.add(i)
+                    break
+            else:
+                raise ValueError("No recorded response for {} {}".format(method, uri))
+        info = dict(record["headers"], status=record["status"])
+        content = record["content"]
+        return httplib2.Response(info), content.encode("utf-8")
+
+
+def _text(content):
+    if isinstance(content, bytes):
+        return content.decode("utf-8")
+    return content
+
+
+def _normalize(body):
+    """Make json bodies comparable whatever the order of their keys."""
+    if not body:
+        return None
+    try:
+        return json.dumps(json.loads(body), sort_keys=True)
+    except ValueError:
+        return body
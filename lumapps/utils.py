@@ -1,6 +1,16 @@
 import os
 import json
+import tempfile
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
 from datetime import datetime, timedelta
+from time import mktime, time
+
+try:
+    import queue
+except ImportError:
+    import Queue as queue
 
 GOOGLE_APIS = ("drive", "admin", "groupssettings")
 FILTERS = {
@@ -50,13 +60,369 @@ FILTERS = {
 def pop_matches(dpath, d):
     if not dpath:
         return
-    for pth_part in dpath.split("/")[:-1]:
+    pop_path(dpath.split("/"), d)
+
+
+def pop_path(path_parts, d):
+    """Like pop_matches, with an already split path."""
+    for pth_part in path_parts[:-1]:
         if not isinstance(d, dict):
             return
         d = d.get(pth_part)
     if not isinstance(d, dict):
         return
-    d.pop(dpath.rpartition("/")[2], None)
+    d.pop(path_parts[-1], None)
+
+
+class PruneFilters(object):
+    """Filters compiled for fast pruning: method patterns and paths are split
+    once, patterns are grouped by number of parts and the paths matching a
+    method are resolved once per method.
+
+    Args:
+        filters (dict): method pattern -> list of paths, like FILTERS.
+    """
+
+    def __init__(self, filters=None):
+        self._patterns = {}  # number of parts -> [(pattern parts, paths)]
+        self._resolved = {}  # method parts -> paths
+        for method, paths in (filters or {}).items():
+            self.register(method, paths)
+
+    def register(self, method, paths):
+        """Add paths to prune from the responses of a method pattern, e.g.
+        ``register("content/*", ["lastRevision"])``.
+        """
+        parts = tuple(method.split("/"))
+        split_paths = tuple(tuple(pth.split("/")) for pth in paths if pth)
+        self._patterns.setdefault(len(parts), []).append((parts, split_paths))
+        self._resolved = {}
+
+    def resolve(self, method_parts):
+        """Return the split paths to prune from the responses of a method."""
+        method_parts = tuple(method_parts)
+        paths = self._resolved.get(method_parts)
+        if paths is None:
+            paths = []
+            for pattern, pattern_paths in self._patterns.get(len(method_parts), ()):
+                if all(p in ("*", part) for p, part in zip(pattern, method_parts)):
+                    paths.extend(pattern_paths)
+            paths = self._resolved[method_parts] = tuple(paths)
+        return paths
+
+    def prune(self, method_parts, content):
+        paths = self.resolve(method_parts)
+        if not paths:
+            return content
+        for obj in content if isinstance(content, list) else (content,):
+            for pth in paths:
+                pop_path(pth, obj)
+        return content
+
+
+PRUNE_FILTERS = PruneFilters(FILTERS)
+
+
+def build_fields_mask(paths):
+    """Build a partial response mask from the paths of the fields to include,
+    e.g. ``["cursor", "items/uid", "items/title"]`` gives
+    ``"cursor,items(uid,title)"``.
+    """
+    tree = OrderedDict()
+    for pth in paths:
+        node = tree
+        for part in pth.split("/"):
+            node = node.setdefault(part, OrderedDict())
+
+    def mask(node):
+        return ",".join(
+            "{}({})".format(name, mask(sub)) if sub else name
+            for name, sub in node.items()
+        )
+
+    return mask(tree)
+
+
+def build_exclusion_mask(schema, paths, schemas):
+    """Build a partial response mask selecting every property of a discovery
+    schema but the excluded paths.
+
+    Args:
+        schema (dict): The discovery schema of the response.
+        paths (list[tuple]): The split paths to exclude.
+        schemas (dict): The discovery schemas, to resolve the $ref.
+
+    Returns:
+        str: the mask, None if the schema has no properties.
+    """
+    if "$ref" in schema:
+        schema = schemas.get(schema["$ref"], {})
+    properties = schema.get("properties")
+    if not properties:
+        return None
+    excluded = {}
+    for pth in paths:
+        if len(pth) == 1:
+            excluded[pth[0]] = None
+        elif excluded.get(pth[0], ()) is not None:
+            excluded.setdefault(pth[0], []).append(pth[1:])
+    fields = []
+    for name in sorted(properties):
+        if name not in excluded:
+            fields.append(name)
+        elif excluded[name] is not None:
+            sub_mask = build_exclusion_mask(properties[name], excluded[name], schemas)
+            if sub_mask is None:
+                fields.append(name)  # cannot be expressed, pruned client side
+            elif sub_mask:
+                fields.append("{}({})".format(name, sub_mask))
+    return ",".join(fields)
+
+
+def register_filter(method, paths):
+    """Add custom paths to prune from the responses of a method pattern.
+
+    Args:
+        method (str): A method pattern like the FILTERS keys, e.g.
+            "user/*" or "user/list".
+        paths (list[str]): The paths to prune, e.g. ["properties/secret"].
+    """
+    FILTERS.setdefault(method, []).extend(paths)
+    PRUNE_FILTERS.register(method, paths)
+
+
+_PREFETCH_ITEM, _PREFETCH_ERROR, _PREFETCH_DONE = range(3)
+
+
+def _put(buf, element, stop):
+    """Put ``element`` in the bounded queue ``buf``, unless ``stop`` is set
+    before there is room for it.
+    """
+    while not stop.is_set():
+        try:
+            buf.put(element, timeout=0.1)
+            return True
+        except queue.Full:
+            continue
+    return False
+
+
+def prefetch_iter(iterable, size):
+    """Consume ``iterable`` in a background thread, keeping at most ``size``
+    elements buffered ahead of the caller.
+
+    Exceptions raised while producing elements are re-raised in the caller.
+    Closing the returned generator (e.g. on an early ``break``) stops the
+    background thread.
+    """
+    buf = queue.Queue(maxsize=size)
+    stop = threading.Event()
+
+    def produce():
+        try:
+            for element in iterable:
+                if not _put(buf, (_PREFETCH_ITEM, element), stop):
+                    return
+        except Exception as err:
+            _put(buf, (_PREFETCH_ERROR, err), stop)
+        else:
+            _put(buf, (_PREFETCH_DONE, None), stop)
+        finally:
+            close = getattr(iterable, "close", None)
+            if close is not None:
+                close()
+
+    producer = threading.Thread(target=produce)
+    producer.daemon = True
+    producer.start()
+    try:
+        while True:
+            kind, element = buf.get()
+            if kind == _PREFETCH_DONE:
+                return
+            if kind == _PREFETCH_ERROR:
+                raise element
+            yield element
+    finally:
+        stop.set()
+
+
+def parallel_imap(func, iterable, workers=4, ordered=True, buffer_size=None):
+    """Call ``func`` on the elements of ``iterable`` from ``workers`` threads.
+
+    At most ``buffer_size`` (defaults to 4 * workers) elements are read from
+    ``iterable`` ahead of the caller. Exceptions raised while producing
+    elements are re-raised in the caller. Closing the returned generator
+    stops the threads.
+
+    Yields:
+        (index, result, error) tuples, error being the exception raised by
+        ``func`` for the element at ``index`` of ``iterable`` (result is then
+        None). They come in the order of ``iterable`` if ``ordered``,
+        otherwise as soon as they are computed.
+    """
+    buffer_size = buffer_size or 4 * workers
+    tasks = queue.Queue()
+    results = queue.Queue()
+    slots = queue.Queue(maxsize=buffer_size)
+    stop = threading.Event()
+
+    def feed():
+        count = 0
+        try:
+            for element in iterable:
+                if not _put(slots, None, stop):
+                    return
+                tasks.put((count, element))
+                count += 1
+        except Exception as err:
+            results.put((_PREFETCH_ERROR, err))
+        else:
+            results.put((_PREFETCH_DONE, count))
+        finally:
+            for _ in range(workers):
+                tasks.put(None)
+
+    def work():
+        while not stop.is_set():
+            task = tasks.get()
+            if task is None:
+                return
+            idx, element = task
+            try:
+                result, error = func(element), None
+            except Exception as err:
+                result, error = None, err
+            results.put((_PREFETCH_ITEM, (idx, result, error)))
+
+    threads = [threading.Thread(target=feed)]
+    threads.extend(threading.Thread(target=work) for _ in range(workers))
+    for thread in threads:
+        thread.daemon = True
+        thread.start()
+    pending = {}
+    next_idx = 0
+    count = None
+    try:
+        while count is None or next_idx < count:
+            kind, value = results.get()
+            if kind == _PREFETCH_ERROR:
+                raise value
+            if kind == _PREFETCH_DONE:
+                count = value
+                continue
+            # unordered results take the next position as soon as they come
+            pending[value[0] if ordered else next_idx] = value
+            while next_idx in pending:
+                slots.get_nowait()
+                yield pending.pop(next_idx)
+                next_idx += 1
+    finally:
+        stop.set()
+
+
+def api_workers(api, concurrency):
+    """Return the number of threads the calls of ``api`` can be sent from:
+    ``concurrency`` for a ``thread_safe`` client, 1 otherwise.
+    """
+    return max(1, concurrency) if getattr(api, "thread_safe", False) else 1
+
+
+class HttpPool(object):
+    """A bounded pool of http transports.
+
+    httplib2.Http objects are not thread-safe but keep their connections
+    alive, so each thread borrows one for the duration of a request and gives
+    it back afterwards for the next request to reuse its connections.
+
+    Args:
+        factory (callable): Creates a new transport.
+        size (int): Maximum number of transports. Defaults to 10.
+    """
+
+    def __init__(self, factory, size=10):
+        self._factory = factory
+        self._size = size
+        self._idle = queue.LifoQueue()
+        self._created = 0
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+        with self._lock:
+            if self._created < self._size:
+                self._created += 1
+                return self._factory()
+        return self._idle.get()
+
+    def release(self, http):
+        self._idle.put(http)
+
+    @contextmanager
+    def connection(self):
+        http = self.acquire()
+        try:
+            yield http
+        finally:
+            self.release(http)
+
+
+class SpooledList(object):
+    """A sequence of json objects kept in memory up to ``threshold`` items,
+    then spilled to a temporary NDJSON file and read back lazily.
+
+    Args:
+        threshold (int): Maximum number of items kept in memory.
+    """
+
+    def __init__(self, threshold):
+        self.threshold = threshold
+        self._items = []
+        self._file = None
+        self._len = 0
+
+    @property
+    def spilled(self):
+        return self._file is not None
+
+    def extend(self, items):
+        if self._file is None:
+            self._items.extend(items)
+            self._len = len(self._items)
+            if self._len > self.threshold:
+                self._file = tempfile.TemporaryFile(mode="w+t")
+                items, self._items = self._items, []
+                self._len = 0
+            else:
+                return
+        for item in items:
+            self._file.write(json.dumps(item))
+            self._file.write("\n")
+            self._len += 1
+
+    def __len__(self):
+        return self._len
+
+    def __iter__(self):
+        if self._file is None:
+            for item in self._items:
+                yield item
+            return
+        self._file.flush()
+        self._file.seek(0)
+        for line in self._file:
+            yield json.loads(line)
+        self._file.seek(0, os.SEEK_END)
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+        self._items = []
+        self._len = 0
 
 
 def get_conf_file():
@@ -96,25 +462,91 @@ class ApiCallError(Exception):
 
 
 class DiscoveryCache(object):
+    """Discovery documents cache used when building the api services.
+
+    Documents are kept in a process-wide in-memory LRU, in front of the
+    cache stored in the configuration file, so building another client in
+    the same process does not read the configuration file again. Their
+    parsed version is kept until the same expiry, so it is not parsed again
+    either.
+    """
+
     _max_age = 60 * 60 * 24  # 1 day
+    _max_entries = 16
+    _memory = OrderedDict()  # url -> (expiry timestamp, content)
+    _documents = {}  # url -> (expiry timestamp, parsed document)
+    _lock = threading.Lock()
+
+    @classmethod
+    def _remember(cls, url, content, expiry):
+        with cls._lock:
+            cls._memory.pop(url, None)
+            cls._memory[url] = (expiry, content)
+            while len(cls._memory) > cls._max_entries:
+                cls._memory.popitem(last=False)
 
-    @staticmethod
-    def get(url):
+    @classmethod
+    def get(cls, url):
+        with cls._lock:
+            cached = cls._memory.pop(url, None)
+            if cached and cached[0] > time():
+                cls._memory[url] = cached
+                return cached[1]
         cached = get_conf()["cache"].get(url)
         if not cached:
             return None
         expiry_dt = datetime.strptime(cached["expiry"][:19], "%Y-%m-%dT%H:%M:%S")
         if expiry_dt < datetime.now():
             return None
+        cls._remember(url, cached["content"], mktime(expiry_dt.timetuple()))
         return cached["content"]
 
-    @staticmethod
-    def set(url, content):
+    @classmethod
+    def set(cls, url, content):
+        expiry_dt = datetime.now() + timedelta(seconds=cls._max_age)
+        cls._remember(url, content, mktime(expiry_dt.timetuple()))
         conf = get_conf()
-        conf["cache"][url] = {
-            "expiry": (
-                datetime.now() + timedelta(seconds=DiscoveryCache._max_age)
-            ).isoformat()[:19],
-            "content": content,
-        }
+        conf["cache"][url] = {"expiry": expiry_dt.isoformat()[:19], "content": content}
         set_conf(conf)
+
+    @classmethod
+    def get_document(cls, url):
+        """Return the parsed document of ``url``, None if it expired."""
+        with cls._lock:
+            cached = cls._documents.get(url)
+            if cached and cached[0] > time():
+                return cached[1]
+            cls._documents.pop(url, None)
+        return None
+
+    @classmethod
+    def set_document(cls, url, document):
+        """Keep the parsed document of ``url`` until its content expires."""
+        with cls._lock:
+            cached = cls._memory.get(url)
+            expiry = cached[0] if cached else time() + cls._max_age
+            cls._documents[url] = (expiry, document)
+
+    @classmethod
+    def invalidate(cls, url=None, persistent=False):
+        """Drop a cached discovery document, or all of them if no url is given.
+
+        Args:
+            url (str): The discovery url of the document to drop.
+            persistent (bool): Whether to drop the documents from the
+                configuration file too. Defaults to False.
+        """
+        with cls._lock:
+            if url is None:
+                cls._memory.clear()
+                cls._documents.clear()
+            else:
+                cls._memory.pop(url, None)
+                cls._documents.pop(url, None)
+        if persistent:
+            conf = get_conf()
+            if url is None:
+                conf["cache"] = {}
+            else:
+                conf["cache"].pop(url, None)
+            set_conf(conf)
@@ -24,6 +24,7 @@ setup(
     long_description=readme,
     long_description_content_type="text/x-rst",
     install_requires=install_requires,
+    extras_require={"async": ["aiohttp"], "tracing": ["opentelemetry-api"]},
     python_requires=">=2.7,!=3.0.*,!=3.1.*,!=3.2.*,!=3.3.*,!=3.4.*,!=3.5.*",
     keywords="lumapps sdk",
     classifiers=[
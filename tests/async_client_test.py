@@ -0,0 +1,124 @@
+import asyncio
+import json
+
+import mock
+import pytest
+
+from apiclient.http import HttpMock
+from apiclient.discovery import build
+from googleapiclient.errors import HttpError
+
+aiohttp = pytest.importorskip("aiohttp")
+
+from lumapps.async_client import AsyncApiClient  # noqa
+from lumapps.checkpoint import CursorStore  # noqa
+from lumapps.utils import ApiCallError  # noqa
+
+
+class FakeResponse(object):
+    def __init__(self, status, payload):
+        self.status = status
+        self.headers = {"content-type": "application/json"}
+        self._content = json.dumps(payload).encode("utf-8")
+
+    async def read(self):
+        return self._content
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        return False
+
+
+class FakeSession(object):
+    def __init__(self, responses):
+        self.responses = list(responses)
+        self.requests = []
+
+    def request(self, method, uri, data=None, headers=None):
+        self.requests.append((method, uri, headers))
+        return FakeResponse(*self.responses.pop(0))
+
+
+def make_client(responses):
+    session = FakeSession(responses)
+    client = AsyncApiClient(token="bvazbduioanpdo2", session=session)
+    http = HttpMock("test_data/lumapps_discovery.json", {"status": "200"})
+    client._service = build("lumapps", "v1", http=http, developerKey="no")
+    client._check_access_token = mock.Mock()
+    return client, session
+
+
+def run(coroutine):
+    loop = asyncio.new_event_loop()
+    try:
+        return loop.run_until_complete(coroutine)
+    finally:
+        loop.close()
+
+
+def collect(items):
+    async def consume():
+        return [item async for item in items]
+
+    return run(consume())
+
+
+PAGES = [
+    (200, {"items": [{"uid": 1}, {"uid": 2}], "more": True, "cursor": "c1"}),
+    (200, {"items": [{"uid": 3}], "more": False}),
+]
+
+
+def test_get_call():
+    client, session = make_client(PAGES)
+    users = run(client.get_call("user", "list"))
+    assert [u["uid"] for u in users] == [1, 2, 3]
+    assert "cursor=c1" in session.requests[1][1]
+    assert session.requests[0][2]["authorization"] == "Bearer bvazbduioanpdo2"
+
+
+def test_get_call_start_cursor():
+    client, session = make_client(PAGES[1:])
+    users = run(client.get_call("user", "list", start_cursor="c1"))
+    assert [u["uid"] for u in users] == [3]
+    assert "cursor=c1" in session.requests[0][1]
+
+
+def test_iter_call():
+    client, _ = make_client(PAGES)
+    users = collect(client.iter_call("user", "list"))
+    assert [u["uid"] for u in users] == [1, 2, 3]
+
+    with pytest.raises(ApiCallError):
+        collect(client.iter_call("user", "list", prefetch=2))
+    with pytest.raises(NotImplementedError):
+        client.batch_call([(("user", "get"), {"email": "a@b.c"})])
+
+
+def test_iter_call_checkpoint(tmpdir):
+    client, session = make_client(PAGES)
+    cursors = []
+    collect(client.iter_call("user", "list", checkpoint=cursors.append))
+    assert cursors == ["c1", None]
+
+    # the job dies on its second page, then is resumed
+    store = CursorStore(str(tmpdir.join("cursors.json")))
+    session.responses = [PAGES[0], (400, {"error": {}})]
+    with pytest.raises(HttpError):
+        collect(client.iter_call("user", "list", checkpoint=store, job_id="users"))
+    assert store.get("users")["cursor"] == "c1"
+
+    session.responses = PAGES[1:]
+    assert [u["uid"] for u in collect(client.resume("users", store))] == [3]
+    assert "cursor=c1" in session.requests[-1][1]
+    assert store.get("users")["done"]
+    assert collect(client.resume("users", store)) == []
+
+
+def test_get_call_error():
+    client, _ = make_client([(404, {"error": {"message": "not found"}})])
+    client.num_retries = 0
+    with pytest.raises(HttpError):
+        run(client.get_call("user", "get", email="a@b.c"))
@@ -1,9 +1,88 @@
-from lumapps.cli import load_config
+import json
+import os
+import subprocess
+import sys
+
+import mock
+
+from lumapps.cli import load_config, print_response, run_batch
+from lumapps.utils import SpooledList
 import pytest
 
+try:
+    from StringIO import StringIO
+except ImportError:
+    from io import StringIO
+
 
 def test_load_config():
     with pytest.raises(SystemExit):
         api_info, auth_info, user = load_config(
             None, None, "ivo@managemybudget.net", "mmb"
         )
+
+
+def test_print_response(capsys):
+    items = [{"uid": 1, "name": "a"}, {"uid": 2}]
+    print_response(items)
+    expected = capsys.readouterr().out
+
+    spooled = SpooledList(1)
+    spooled.extend(items)
+    assert spooled.spilled
+    print_response(spooled)
+    assert capsys.readouterr().out == expected
+
+    print_response(SpooledList(1))
+    assert capsys.readouterr().out == "[]\n"
+
+
+def run_lac(args, tmpdir):
+    """Run lac in a new interpreter, return the google modules it imported."""
+    script = (
+        "import sys; from lumapps.cli import main; main(); "
+        "print(sorted(m for m in sys.modules if m.split('.')[0] in "
+        "('google', 'googleapiclient', 'google_auth_httplib2', 'httplib2')))"
+    )
+    env = dict(os.environ, XDG_CONFIG_HOME=str(tmpdir))
+    env.pop("APPDATA", None)
+    env["PYTHONPATH"] = os.pathsep.join(
+        [os.path.dirname(os.path.dirname(os.path.abspath(__file__)))]
+        + env.get("PYTHONPATH", "").split(os.pathsep)
+    )
+    output = subprocess.check_output(
+        [sys.executable, "-c", script] + args, env=env, universal_newlines=True
+    )
+    return output.strip().split("\n")[-1]
+
+
+def test_lac_lazy_imports(tmpdir):
+    assert run_lac(["--config"], tmpdir) == "[]"
+    assert run_lac(["--help"], tmpdir) == "[]"
+
+
+def test_run_batch():
+    api = mock.Mock()
+    api.get_call.side_effect = lambda *parts, **params: (
+        {"uid": params["uid"]} if params["uid"] != "2" else 1 / 0
+    )
+    lines = [
+        '{"method": ["user", "get"], "params": {"uid": "1"}}\n',
+        "\n",
+        '{"method": "user get", "params": {"uid": "2"}}\n',
+        "not json\n",
+        '{"method": ["user", "get"], "params": {"uid": "5"}}\n',
+    ]
+    out = StringIO()
+    assert run_batch(api, lines, concurrency=3, out=out) == 2
+    records = [json.loads(line) for line in out.getvalue().splitlines()]
+    assert [r["line"] for r in records] == [1, 3, 4, 5]
+    assert records[0]["result"] == {"uid": "1"}
+    assert records[1]["error"].startswith("ZeroDivisionError")
+    assert "error" in records[2] and records[3]["result"] == {"uid": "5"}
+    api.get_call.assert_any_call("user", "get", uid="2")
+
+    out = StringIO()
+    assert run_batch(api, lines, concurrency=3, ordered=False, out=out) == 2
+    records = [json.loads(line) for line in out.getvalue().splitlines()]
+    assert sorted(r["line"] for r in records) == [1, 3, 4, 5]
@@ -0,0 +1,4 @@
+import sys
+
+# the asyncio client and its tests are python 3 only
+collect_ignore = ["async_client_test.py"] if sys.version_info < (3, 6) else []
@@ -0,0 +1,57 @@
+import json
+import threading
+
+import mock
+import pytest
+
+from lumapps.cli import parse_args, shell
+from lumapps.daemon import LacDaemon, connect, forward
+from lumapps.testing import MockLumApps, MockLumAppsServer
+
+try:
+    from StringIO import StringIO
+except ImportError:
+    from io import StringIO
+
+
+@pytest.fixture
+def api_file(tmpdir, monkeypatch):
+    monkeypatch.setenv("XDG_CONFIG_HOME", str(tmpdir))
+    monkeypatch.delenv("APPDATA", raising=False)
+    with MockLumAppsServer(MockLumApps("test_data/lumapps_discovery.json")) as server:
+        path = tmpdir.join("api.json")
+        path.write(json.dumps({"base_url": server.base_url}))
+        yield str(path)
+
+
+def test_daemon(tmpdir, api_file):
+    socket_path = str(tmpdir.join("lac.sock"))
+    assert connect(socket_path) is None
+    daemon = LacDaemon(socket_path)
+    thread = threading.Thread(target=daemon.serve_forever)
+    thread.start()
+    try:
+        argv = ["--api", api_file, "--token", "t", "feed", "search", "body={}"]
+        out = StringIO()
+        assert forward(connect(socket_path), parse_args(argv)[1], out) == 0
+        assert len(json.loads(out.getvalue())) == 10
+
+        argv = ["--api", api_file, "--token", "t", "feed", "unknown"]
+        assert forward(connect(socket_path), parse_args(argv)[1], StringIO())
+        assert len(daemon.clients) == 1
+    finally:
+        daemon.shutdown()
+        daemon.server_close()
+        thread.join()
+    assert connect(socket_path) is None
+
+
+def test_shell(api_file, capsys):
+    lines = iter(["feed search body={}", "user list maxResults=5", "exit"])
+    with mock.patch(
+        "lumapps.cli.input", create=True, side_effect=lambda p: next(lines)
+    ):
+        shell(["--api", api_file, "--token", "t", "shell"])
+    out = capsys.readouterr().out
+    assert out.count('"uid": "feed-') == 10
+    assert out.count('"uid": "user-') == 100
@@ -1,12 +1,28 @@
 import unittest
 import types
 import mock
+import pytest
+from time import time
 
 from apiclient.http import HttpMock
 from apiclient.discovery import build
 
 from lumapps.client import ApiClient
-from lumapps.helpers.group import build_batch, list_groups
+from lumapps.helpers.exceptions import NotFoundException
+from lumapps.helpers.group import (
+    Group,
+    GroupIndex,
+    MembershipPlanner,
+    build_batch,
+    delete,
+    get_index,
+    list_groups,
+    list_sync,
+    plan_groups,
+    save,
+)
+from lumapps.helpers.user import User
+from lumapps.testing import MockLumApps
 
 
 class GroupTests(unittest.TestCase):
@@ -34,3 +50,114 @@ class GroupTests(unittest.TestCase):
         groups = self.client.iter_call("feed", "search")
         batch = build_batch(self.client, groups)
         self.assertIsInstance(batch, types.GeneratorType)
+
+
+def test_membership_planner():
+    mock_api = MockLumApps("test_data/lumapps_discovery.json")
+    bodies = []
+    mock_api.add_route(
+        "feed/subscribers/save",
+        lambda params: bodies.append(params["body"]) or (200, None),
+    )
+    api = mock_api.client(thread_safe=True)
+    api.customer = api.customerId = "customer"
+    groups = [Group(api, uid="group-{}".format(i)) for i in range(3)]
+    users = [
+        User(
+            api,
+            uid="u{}".format(i),
+            email="{}@example.com".format(i),
+        )
+        for i in range(5)
+    ]
+    for user in users:
+        user._groups["to_add"] = groups[:2]
+    users[0]._groups["to_remove"] = groups[2:]
+
+    planner = MembershipPlanner(batch_size=2)
+    for user in users:
+        planner.collect(user)
+    assert len(planner) == 3
+    updates = planner.flush(concurrency=2)
+    assert len(planner) == 0
+    assert all(update.success for update in updates)
+    # 5 users in batches of 2 for the first two groups, 1 call for the last
+    assert [len(u.users_to_add) for u in updates] == [2, 2, 1, 2, 2, 1, 0]
+    assert mock_api.calls.count("feed/subscribers/save") == 7
+    assert {"feed": "group-2", "addedUsers": [], "removedUsers": ["u0"]} in bodies
+
+    mock_api.fail(400)
+    planner.add(groups[0], users[0])
+    planner.remove(groups[1], users[1])
+    updates = planner.flush(concurrency=1)
+    assert [update.success for update in updates] == [False, True]
+
+
+def test_plan_groups():
+    mock_api = MockLumApps("test_data/lumapps_discovery.json", feeds=3)
+    api = mock_api.client()
+    api.customer = api.customerId = "customer"
+
+    groups = [
+        Group(api, name="Feed 0", feed_type="feedtype-1"),
+        Group(api, name="Feed 1", feed_type="feedtype-2"),
+        Group(api, name="Feed 9", feed_type="feedtype-1"),
+    ]
+    plan = plan_groups(api, groups)
+    assert str(plan) == "1 create, 1 update, 0 deactivate, 1 unchanged"
+    changes = {change.action: change for change in plan}
+    assert changes["update"].diff == {"type": ("feedtype-1", "feedtype-2")}
+    assert changes["create"].key == ("", "Feed 9")
+
+    assert all(change.success for change in plan.apply())
+    assert mock_api.data["feed"][1]["type"] == "feedtype-2"
+    assert mock_api.data["feed"][1]["uid"] == "feed-1"
+    assert mock_api.data["feed"][3]["name"] == "Feed 9"
+    assert (
+        str(plan_groups(api, groups)) == "0 create, 0 update, 0 deactivate, 3 unchanged"
+    )
+
+
+def test_group_index():
+    mock_api = MockLumApps("test_data/lumapps_discovery.json", feeds=5)
+    mock_api.add_route("feed/delete", lambda params: (200, None))
+    api = mock_api.client()
+    api.customer = api.customerId = "customer"
+    assert get_index(api) is None
+    body = {"query": "Feed"}
+    list_sync(api, instance="instance", body=body)
+    assert body == {"query": "Feed"}
+
+    del mock_api.calls[:]
+    api.group_index = GroupIndex(api)
+    for _ in range(3):
+        assert Group.new(api, name="Feed 1", fetch_by_name=True).uid == "feed-1"
+    with pytest.raises(NotFoundException):
+        Group.new(api, name="Unknown", fetch_by_name=True)
+    assert mock_api.calls == ["feed/search"] * 2
+
+    api = mock_api.client()
+    api.customer = api.customerId = "customer"
+    index = api.group_index = GroupIndex(api)
+    assert get_index(api) is index
+    assert index.warm_up() == 5
+    for i in range(10):
+        user = User(api, email="user{}@example.com".format(i))
+        user.set_attribute("groups", "Feed 0;Feed 1")
+        assert [g.uid for g in user.get_groups(with_status=True)["to_add"]] == [
+            "feed-0",
+            "feed-1",
+        ]
+        # a name matching no group is not sent as a group uid
+        with pytest.raises(NotFoundException):
+            user.set_attribute("groups", "Unknown")
+    assert mock_api.calls[2:] == ["feed/search"]  # the warm up
+
+    saved = save(api, Group(api, name="Feed 9", feed_type="feedtype-1"))
+    assert index.find("Feed 9") == [saved]
+    delete(api, Group(api, uid=saved["uid"]))
+    assert index.get(saved["uid"]) is None and index.find("Feed 9") == []
+
+    index._time = lambda: time() + GroupIndex.TTL + 1
+    assert index.find("Feed 0") is None
+    assert index.get("feed-0") is None
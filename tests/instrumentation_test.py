@@ -0,0 +1,114 @@
+import mock
+import pytest
+
+from googleapiclient.errors import HttpError
+
+from lumapps.instrumentation import (
+    Histogram,
+    Instrumentation,
+    OpenTelemetryTracer,
+    PrometheusMetrics,
+)
+from lumapps.retry import RetryPolicy
+from lumapps.testing import MockLumApps
+
+DISCOVERY = "test_data/lumapps_discovery.json"
+
+
+class Recorder(Instrumentation):
+    def __init__(self):
+        self.events = []
+        self.prunes = []
+
+    def after_call(self, event):
+        self.events.append(event)
+
+    def on_prune(self, method_parts, seconds):
+        self.prunes.append(method_parts)
+
+
+def test_call_events():
+    recorder = Recorder()
+    mock_api = MockLumApps(DISCOVERY, users=45)
+    api = mock_api.client(instrumentation=recorder, prune=True)
+    assert len(api.get_call("user", "list")) == 45
+    assert [(e.method, e.page, e.cursor, e.status) for e in recorder.events] == [
+        ("user/list", 0, None, 200),
+        ("user/list", 1, "30", 200),
+    ]
+    assert all(e.bytes > 0 and e.latency >= 0 for e in recorder.events)
+    assert recorder.prunes == [("user", "list")] * 2  # once per page
+
+    with pytest.raises(HttpError):
+        api.get_call("user", "get", email="unknown@example.com")
+    event = recorder.events[-1]
+    assert event.status == 404 and isinstance(event.error, HttpError)
+
+
+def test_call_event_retries():
+    recorder = Recorder()
+    mock_api = MockLumApps(DISCOVERY)
+    mock_api.fail(503, count=2)
+    api = mock_api.client(instrumentation=[recorder], num_retries=2)
+    with mock.patch("time.sleep"):
+        api.get_call("feed", "search", body={})
+    assert recorder.events[0].retries == 2
+
+    mock_api.fail(503)
+    api = mock_api.client(
+        instrumentation=recorder, retry_policy=RetryPolicy(base_delay=0)
+    )
+    api.retry_policy._sleep = lambda delay: None
+    api.get_call("feed", "search", body={})
+    assert recorder.events[-1].retries == 1
+
+
+def test_histogram():
+    histogram = Histogram(buckets=(1, 10))
+    for value in (0.5, 5, 50):
+        histogram.observe(value, method="user/list")
+    assert histogram.get(method="user/list") == {
+        "buckets": {1: 1, 10: 2, float("inf"): 3},
+        "sum": 55.5,
+        "count": 3,
+    }
+    assert histogram.get(method="user/get") is None
+    assert histogram.render("calls").split("\n") == [
+        "# TYPE calls histogram",
+        'calls_bucket{method="user/list",le="1.0"} 1',
+        'calls_bucket{method="user/list",le="10.0"} 2',
+        'calls_bucket{method="user/list",le="+Inf"} 3',
+        'calls_sum{method="user/list"} 55.5',
+        'calls_count{method="user/list"} 3',
+    ]
+
+
+def test_prometheus_metrics():
+    metrics = PrometheusMetrics()
+    api = MockLumApps(DISCOVERY, users=45).client(instrumentation=metrics)
+    api.get_call("user", "list")
+    assert metrics.latency.get(method="user/list", status=200)["count"] == 2
+    assert metrics.retries.get(method="user/list", status=200)["sum"] == 0
+    assert (
+        'lumapps_response_bytes_count{method="user/list",status="200"} 2'
+        in metrics.render()
+    )
+
+    # the streamed pages are reported as well
+    metrics = PrometheusMetrics()
+    api = MockLumApps(DISCOVERY, users=45).client(instrumentation=metrics)
+    assert len(list(api.iter_call("user", "list", stream=True))) == 45
+    assert metrics.latency.get(method="user/list", status=200)["count"] == 2
+
+
+def test_opentelemetry_tracer():
+    tracer = mock.Mock()
+    span = tracer.start_span.return_value
+    api = MockLumApps(DISCOVERY).client(instrumentation=OpenTelemetryTracer(tracer))
+    api.get_call("feed", "search", body={})
+    tracer.start_span.assert_called_once_with(
+        "lumapps feed/search",
+        attributes={"lumapps.method": "feed/search", "lumapps.page": 0},
+    )
+    span.set_attribute.assert_any_call("http.status_code", 200)
+    span.end.assert_called_once_with()
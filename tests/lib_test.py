@@ -1,7 +1,27 @@
 import pytest
+import mock
+import threading
+import time
 
 from copy import deepcopy
+from datetime import datetime, timedelta
+from apiclient.http import HttpMock, HttpMockSequence
+from apiclient.discovery import build
+from googleapiclient.errors import HttpError
+
+from lumapps.checkpoint import CursorStore
 from lumapps.client import pop_matches, ApiClient
+from lumapps.utils import (
+    prefetch_iter,
+    parallel_imap,
+    api_workers,
+    ApiCallError,
+    HttpPool,
+    DiscoveryCache,
+    SpooledList,
+    PruneFilters,
+    build_fields_mask,
+)
 
 
 def test_pop_matches():
@@ -33,3 +53,382 @@ def test_api_client_token_setter():
     client = ApiClient(token=token)
     assert client.creds is not None
     assert client.creds.token == token
+
+
+def _paginated_client(pages, thread_safe=False):
+    client = ApiClient(token="bvazbduioanpdo2", thread_safe=thread_safe)
+    responses = iter(pages)
+
+    def get_api_call(method_parts, params):
+        response = next(responses)
+        if isinstance(response, Exception):
+            raise response
+        return mock.Mock(execute=mock.Mock(return_value=response))
+
+    client._get_api_call = get_api_call
+    return client
+
+
+PAGES = [
+    {"items": [{"uid": 1}, {"uid": 2}], "more": True, "cursor": "c1"},
+    {"items": [{"uid": 3}], "more": True, "cursor": "c2"},
+    {"items": [{"uid": 4}], "more": False},
+]
+
+
+def test_prefetch_iter():
+    assert list(prefetch_iter(iter(range(10)), 2)) == list(range(10))
+
+    def failing():
+        yield 1
+        raise ValueError("boom")
+
+    it = prefetch_iter(failing(), 1)
+    assert next(it) == 1
+    with pytest.raises(ValueError):
+        next(it)
+
+
+def test_parallel_imap():
+    def invert(x):
+        time.sleep(0.001 * (x % 3))
+        return 1.0 / x
+
+    results = list(parallel_imap(invert, range(20), workers=4, buffer_size=3))
+    assert [r[0] for r in results] == list(range(20))
+    assert isinstance(results[0][2], ZeroDivisionError) and results[0][1] is None
+    assert results[4][1:] == (0.25, None)
+
+    results = list(parallel_imap(invert, range(1, 20), workers=4, ordered=False))
+    assert sorted(r[1] for r in results) == sorted(1.0 / x for x in range(1, 20))
+
+    def failing():
+        yield 1
+        raise ValueError("boom")
+
+    with pytest.raises(ValueError):
+        list(parallel_imap(invert, failing()))
+
+    assert api_workers(ApiClient(token="token"), 4) == 1
+    assert api_workers(ApiClient(token="token", thread_safe=True), 4) == 4
+
+
+def test_iter_call_prefetch(tmpdir):
+    client = _paginated_client(deepcopy(PAGES))
+    with pytest.raises(ApiCallError):
+        next(client.iter_call("user", "list", prefetch=1))
+    # an invalid call does not register its job
+    store = CursorStore(str(tmpdir.join("cursors.json")))
+    users = client.iter_call("user", "list", prefetch=1, checkpoint=store, job_id="j")
+    with pytest.raises(ApiCallError):
+        next(users)
+    assert store.get("j") is None
+
+    client = _paginated_client(deepcopy(PAGES), thread_safe=True)
+    uids = [u["uid"] for u in client.iter_call("user", "list", prefetch=1)]
+    assert uids == [1, 2, 3, 4]
+
+    client = _paginated_client(deepcopy(PAGES), thread_safe=True)
+    for user in client.iter_call("user", "list", prefetch=1):
+        break
+    assert user == {"uid": 1}
+
+    client = _paginated_client([PAGES[0], ApiCallError("boom")], thread_safe=True)
+    with pytest.raises(ApiCallError):
+        list(client.iter_call("user", "list", prefetch=1))
+
+
+def test_http_pool():
+    created = []
+
+    def factory():
+        created.append(object())
+        return created[-1]
+
+    pool = HttpPool(factory, size=2)
+    first, second = pool.acquire(), pool.acquire()
+    assert first is not second
+    pool.release(first)
+    with pool.connection() as http:
+        assert http is first
+    assert len(created) == 2
+
+
+def test_api_client_thread_safe():
+    client = ApiClient(token="bvazbduioanpdo2", thread_safe=True, pool_size=2)
+    request = mock.Mock(execute=mock.Mock(return_value={"uid": 1}))
+    assert client._execute(request) == {"uid": 1}
+    http = request.execute.call_args[1]["http"]
+    assert http.credentials is client.creds
+    client._execute(request)
+    assert request.execute.call_args[1]["http"] is http
+
+
+def test_token_swap_is_locked():
+    client = ApiClient(token="token-1", thread_safe=True)
+    client._service = service = object()
+    with client._service_lock:
+        setter = threading.Thread(target=setattr, args=(client, "token", "token-2"))
+        setter.start()
+        setter.join(0.05)
+        assert setter.is_alive() and client._service is service
+    setter.join()
+    assert client._service is None and client.creds.token == "token-2"
+
+
+def test_http_pool_transports():
+    shared = mock.Mock()
+    client = ApiClient(token="token", http=shared, thread_safe=True, pool_size=2)
+    first, second = client.http_pool.acquire(), client.http_pool.acquire()
+    assert first.http is not second.http
+    assert shared not in (first.http, second.http)
+
+    created = []
+    client = ApiClient(
+        token="token",
+        http=shared,
+        http_factory=lambda: created.append(mock.Mock()) or created[-1],
+        thread_safe=True,
+    )
+    assert client.http_pool.acquire().http is created[0]
+
+
+BATCH_RESPONSE = """--batch_foobarbaz
+Content-Type: application/http
+Content-Transfer-Encoding: binary
+Content-ID: <response-abc + {failed}>
+
+HTTP/1.1 404 Not Found
+Content-Type: application/json
+
+{{"error": {{"message": "not found"}}}}
+--batch_foobarbaz
+Content-Type: application/http
+Content-Transfer-Encoding: binary
+Content-ID: <response-abc + {ok}>
+
+HTTP/1.1 200 OK
+Content-Type: application/json
+
+{{"uid": "1", "lastRevision": "r"}}
+--batch_foobarbaz--""".replace(
+    "\n", "\r\n"
+)
+
+
+def test_batch_call():
+    with open("test_data/lumapps_discovery.json") as fh:
+        discovery = fh.read()
+    batch_headers = {
+        "status": "200",
+        "content-type": "multipart/mixed; boundary=batch_foobarbaz",
+    }
+    http = HttpMockSequence(
+        [
+            ({"status": "200"}, discovery),
+            (batch_headers, BATCH_RESPONSE.format(ok=0, failed=1)),
+            (batch_headers, BATCH_RESPONSE.format(ok=2, failed=3)),
+        ]
+    )
+    instrumentation = mock.Mock()
+    client = ApiClient(
+        token="bvazbduioanpdo2", prune=True, instrumentation=instrumentation
+    )
+    client._service = build("lumapps", "v1", http=http, developerKey="no")
+    calls = [(["content", "get"], {"uid": str(i)}) for i in range(4)]
+    results = client.batch_call(calls, batch_size=2)
+    assert results[0] == ({"uid": "1"}, None)
+    assert results[1][0] is None
+    assert isinstance(results[1][1], HttpError)
+    assert results[2] == results[0]
+    # every call of the batches is reported with the status of its part
+    events = [c[0][0] for c in instrumentation.after_call.call_args_list]
+    assert sorted((e.method, e.status, e.attempts) for e in events) == [
+        ("content/get", 200, 1),
+        ("content/get", 200, 1),
+        ("content/get", 404, 1),
+        ("content/get", 404, 1),
+    ]
+    assert all(e.bytes > 0 and e.latency >= 0 for e in events)
+
+
+def test_discovery_cache():
+    DiscoveryCache.invalidate()
+    conf = {"configs": {}, "cache": {}}
+    with mock.patch("lumapps.utils.get_conf", return_value=conf) as get_conf:
+        with mock.patch("lumapps.utils.set_conf"):
+            assert DiscoveryCache.get("http://discovery") is None
+            DiscoveryCache.set("http://discovery", "{}")
+            get_conf.reset_mock()
+            assert DiscoveryCache.get("http://discovery") == "{}"
+            assert not get_conf.called
+
+            DiscoveryCache.invalidate("http://discovery")
+            assert DiscoveryCache.get("http://discovery") == "{}"
+            assert get_conf.called
+
+            DiscoveryCache.invalidate(persistent=True)
+            assert DiscoveryCache.get("http://discovery") is None
+
+
+def test_shared_discovery_document():
+    with open("test_data/lumapps_discovery.json") as fh:
+        discovery = fh.read()
+    url = "https://discovery.test/_ah/api/discovery/v1/apis/lumsites/v1/rest"
+    api_info = {"base_url": "https://discovery.test"}
+    with mock.patch.object(DiscoveryCache, "get", return_value=discovery) as get:
+        first = ApiClient(token="bvazbduioanpdo2", api_info=api_info)
+        second = ApiClient(token="a8z7e9a8ze7", api_info=api_info)
+        assert first.service is not second.service
+        assert first.service._rootDesc is second.service._rootDesc
+        get.assert_called_once_with(url)
+
+        DiscoveryCache.invalidate(url)
+        third = ApiClient(token="a8z7e9a8ze7", api_info=api_info)
+        assert third.service._rootDesc is not first.service._rootDesc
+        assert get.call_count == 2
+
+    request = first._get_api_call(("user", "list"), {})
+    assert request.uri.startswith("https://lumsites.appspot.com/")
+    assert first._get_resource(("user",)) is first._get_resource(("user",))
+
+
+def test_new_client_as():
+    limiter, policy = mock.Mock(), mock.Mock()
+    client = ApiClient(
+        credentials=mock.Mock(),
+        prune=True,
+        num_retries=3,
+        thread_safe=True,
+        retry_policy=policy,
+        rate_limiter=limiter,
+    )
+    other = client.get_new_client_as("a@test.com")
+    assert other.creds is client.creds.with_subject.return_value
+    assert other.email == "a@test.com"
+    assert other.rate_limiter is limiter and other.retry_policy is policy
+    assert other.prune and other.thread_safe and other.num_retries == 3
+
+
+def test_impersonation_pool():
+    client = ApiClient(token="bvazbduioanpdo2", impersonation_pool_size=2)
+
+    def new_client_as(user):
+        creds = mock.Mock(token="tok", expiry=datetime.utcnow() + timedelta(hours=1))
+        return mock.Mock(email=user, creds=creds)
+
+    client._new_client_as = new_client_as
+    pool = client.impersonation_pool
+    first = client.get_new_client_as("a@test.com")
+    assert client.get_new_client_as("a@test.com") is first
+    client.get_new_client_as("b@test.com")
+    client.get_new_client_as("c@test.com")
+    assert len(pool) == 2
+    assert client.get_new_client_as("a@test.com") is not first
+    assert pool.metrics == {"hits": 1, "misses": 4, "evictions": 2, "refreshes": 0}
+
+    first.creds.expiry = datetime.utcnow() + timedelta(seconds=60)
+    pool._ensure_token(first)
+    assert first.creds.refresh.call_args[0][0].http is first._refresh_http()
+    assert pool.metrics["refreshes"] == 1
+
+    shared = mock.Mock()
+    assert ApiClient(token="token", http=shared)._refresh_http() is shared
+    client = ApiClient(token="token", http=shared, thread_safe=True)
+    assert client._refresh_http() is not shared
+    client = ApiClient(token="token", http_factory=lambda: shared, thread_safe=True)
+    assert client._refresh_http() is shared
+
+
+def test_iter_call_checkpoint(tmpdir):
+    store = CursorStore(str(tmpdir.join("cursors.json")))
+    client = _paginated_client(deepcopy(PAGES))
+    users = client.iter_call("user", "list", checkpoint=store, job_id="export")
+    assert [next(users)["uid"] for _ in range(3)] == [1, 2, 3]
+    assert store.get("export") == {
+        "method": ["user", "list"],
+        "params": {},
+        "cursor": "c1",
+        "done": False,
+    }
+    users.close()  # the export dies before the end of the second page
+
+    client = _paginated_client(deepcopy(PAGES[1:]))
+    client._iter_pages = mock.Mock(wraps=client._iter_pages)
+    assert [u["uid"] for u in client.resume("export", store)] == [3, 4]
+    assert client._iter_pages.call_args[0][2] == "c1"
+    assert store.get("export")["done"]
+    assert list(client.resume("export", store)) == []
+
+    cursors = []
+    client = _paginated_client(deepcopy(PAGES))
+    list(client.iter_call("user", "list", checkpoint=cursors.append))
+    assert cursors == ["c1", "c2", None]
+
+
+def test_get_call_spill():
+    client = _paginated_client(deepcopy(PAGES))
+    users = client.get_call("user", "list", spill_threshold=10)
+    assert users == [{"uid": 1}, {"uid": 2}, {"uid": 3}, {"uid": 4}]
+
+    client = _paginated_client(deepcopy(PAGES))
+    users = client.get_call("user", "list", spill_threshold=2)
+    assert isinstance(users, SpooledList) and users.spilled
+    assert len(users) == 4
+    assert list(users) == [{"uid": 1}, {"uid": 2}, {"uid": 3}, {"uid": 4}]
+    assert list(users) == list(users)
+    users.close()
+
+
+def test_prune_filters():
+    filters = PruneFilters({"content/*": ["lastRevision"], "content/list": ["a/b"]})
+    assert filters.resolve(("content", "get")) == (("lastRevision",),)
+    assert filters.resolve(["content", "get"]) == (("lastRevision",),)
+    assert len(filters.resolve(("content", "list"))) == 2
+    assert filters.resolve(("content", "list", "x")) == ()
+    filters.register("content/get", ["authorDetails"])
+    assert len(filters.resolve(("content", "get"))) == 2
+
+    items = [{"lastRevision": 1, "a": {"b": 1, "c": 2}}, {"uid": 2}]
+    assert filters.prune(("content", "list"), items) == [{"a": {"c": 2}}, {"uid": 2}]
+
+
+def test_api_client_prune():
+    client = ApiClient(token="bvazbduioanpdo2", prune=True)
+    content = {"uid": "1", "lastRevision": {}, "properties": {"duplicateContent": 1}}
+    assert client._prune(("content", "get"), deepcopy(content)) == {
+        "uid": "1",
+        "properties": {"duplicateContent": 1},
+    }
+    assert client._prune(("template", "get"), deepcopy(content)) == {
+        "uid": "1",
+        "lastRevision": {},
+        "properties": {},
+    }
+
+
+def test_build_fields_mask():
+    assert build_fields_mask(["cursor", "items/uid", "items/title/en"]) == (
+        "cursor,items(uid,title(en))"
+    )
+
+
+def test_fields_projection():
+    http = HttpMock("test_data/lumapps_discovery.json", {"status": "200"})
+    client = ApiClient(token="bvazbduioanpdo2", prune=True, project_fields=True)
+    client._service = build("lumapps", "v1", http=http, developerKey="no")
+
+    mask = client.get_fields_mask(("community", "list"))
+    assert mask.startswith("callId,cursor,errors,more,items(adminKeys,")
+    assert "usersDetails" not in mask and "lastRevision" not in mask
+    mask = client.get_fields_mask(("content", "get"))
+    assert "lastRevision" not in mask and "uid" in mask
+    assert client.get_fields_mask(["content", "get"]) == mask
+    assert client.get_fields_mask(("user", "list")) is None
+
+    request = client._get_api_call(("content", "get"), {"uid": "1"})
+    assert "fields=" in request.uri
+    request = client._get_api_call(("content", "get"), {"uid": "1", "fields": "uid"})
+    assert "fields=uid&" in request.uri
+    request = client._get_api_call(("user", "list"), {"fields": ["items/uid"]})
+    assert "fields=items%28uid%29" in request.uri
@@ -0,0 +1,127 @@
+import mock
+import pytest
+
+from googleapiclient.errors import HttpError
+
+from lumapps.helpers import group, user
+from lumapps.mirror import Mirror
+from lumapps.testing import MockLumApps, make_user
+
+DISCOVERY = "test_data/lumapps_discovery.json"
+
+
+def make_subscribed_user(i):
+    return dict(make_user(i), feeds=["feed-{}".format(i % 2)])
+
+
+def test_mirror_refresh(tmpdir):
+    users = [make_subscribed_user(i) for i in range(45)]
+    mock_api = MockLumApps(DISCOVERY, users=users, feeds=5)
+    path = str(tmpdir.join("mirror.db"))
+    mirror = Mirror(mock_api.client(), path)
+    assert mirror.refresh() == {"users": 45, "feeds": 5, "feedtypes": 3}
+    assert mirror.checkpoint("users") == "30"  # the cursor of the last page
+
+    assert mirror.get_user(email="USER3@example.com")["uid"] == "user-3"
+    assert mirror.get_user(uid="user-50") is None
+    assert [f["uid"] for f in mirror.find_feeds("Feed 2")] == ["feed-2"]
+    assert [t["uid"] for t in mirror.find_feedtypes("Feed type 1")] == ["feedtype-1"]
+    assert mirror.get_subscriptions("user-3") == ["feed-1"]
+    assert len(mirror.get_subscribers("feed-0")) == 23
+
+    # an incremental refresh lists the last page again, then the new ones
+    mock_api.data["user"].extend(make_subscribed_user(i) for i in range(45, 70))
+    mock_api.data["user"][0]["firstName"] = "Changed"
+    del mock_api.calls[:]
+    mirror.close()
+    mirror = Mirror(mock_api.client(), path)
+    assert mirror.refresh(["users"]) == {"users": 40}
+    assert mock_api.calls == ["user/list"] * 2
+    assert mirror.count("users") == 70
+    assert mirror.checkpoint("users") == "60"
+    assert mirror.get_user(uid="user-0")["firstName"] == "First0"
+
+    del mock_api.data["user"][60:]
+    assert mirror.refresh(["users"], full=True) == {"users": 60}
+    assert mirror.count("users") == 60
+    assert mirror.get_user(uid="user-0")["firstName"] == "Changed"
+    assert mirror.get_subscribers("feed-0") == [
+        "user-{}".format(i) for i in range(0, 60, 2)
+    ]
+
+
+def test_helpers_read_through():
+    mock_api = MockLumApps(DISCOVERY, users=10, feeds=5)
+    api = mock_api.client()
+    api.mirror = Mirror(api)
+    api.mirror.refresh()
+    del mock_api.calls[:]
+
+    assert user.get_by_email(api, "user2@example.com")["uid"] == "user-2"
+    assert user.get_by_uid(api, "user-3")["email"] == "user3@example.com"
+    assert group.get_by_name(api, "Feed 1")[0]["uid"] == "feed-1"
+    assert group.get_by_uid(api, "feed-4")["name"] == "Feed 4"
+    assert mock_api.calls == []
+
+    # a miss is read from the API
+    mock_api.data["user"].append(make_user(10))
+    assert user.get_by_email(api, "user10@example.com")["uid"] == "user-10"
+    assert mock_api.calls == ["user/get"]
+
+
+def test_helpers_write_through():
+    users = [make_subscribed_user(i) for i in range(3)]
+    mock_api = MockLumApps(DISCOVERY, users=users, feeds=2)
+    mock_api.add_route("feed/delete", lambda params: (200, None))
+    api = mock_api.client()
+    api.customer = api.customerId = "customer"
+    api.mirror = Mirror(api)
+    api.mirror.refresh()
+
+    saved = user.User(api, uid="user-1", email="user1@example.com")
+    saved.set_attribute("firstName", "Saved")
+    user.save_or_update(api, saved)
+    assert api.mirror.get_user(uid="user-1")["firstName"] == "Saved"
+    assert api.mirror.get_subscriptions("user-1") == ["feed-1"]
+    # a resource not listing its subscriptions keeps the mirrored ones
+    api.mirror.put_user({"uid": "user-1", "email": "user1@example.com"})
+    assert api.mirror.get_subscriptions("user-1") == ["feed-1"]
+
+    feed = group.Group(api, name="Feed 9", feed_type="feedtype-1")
+    assert feed.save() == (True, None)
+    assert [f["uid"] for f in api.mirror.find_feeds("Feed 9")] == ["feed-2"]
+
+    # the membership changes are written through as well
+    mock_api.add_route("feed/subscribers/save", lambda params: (200, None))
+    feed_1 = group.Group(api, uid="feed-1")
+    planner = group.MembershipPlanner()
+    planner.add(feed_1, user.User(api, email="User0@example.com"))
+    planner.remove(feed_1, user.User(api, uid="user-1", email="user1@example.com"))
+    assert all(update.success for update in planner.flush())
+    assert api.mirror.get_subscribers("feed-1") == ["user-0"]
+    assert sorted(api.mirror.get_subscriptions("user-0")) == ["feed-0", "feed-1"]
+    planner.add(feed_1, user.User(api, uid="user-1", email="user1@example.com"))
+    mock_api.add_route("feed/subscribers/save", lambda params: (400, None))
+    assert not planner.flush()[0].success
+    assert api.mirror.get_subscribers("feed-1") == ["user-0"]
+
+    # a feed that could not be deleted stays mirrored
+    mock_api.add_route("feed/delete", lambda params: (404, None))
+    with pytest.raises(HttpError):
+        group.delete(api, feed_1)
+    assert api.mirror.get_feed("feed-1") is not None
+    mock_api.add_route("feed/delete", lambda params: (200, None))
+    group.delete(api, feed_1)
+    assert api.mirror.get_feed("feed-1") is None
+    assert api.mirror.get_subscriptions("user-1") == []
+
+    # a refresh reads the subscriptions from the API, not from the mirror
+    api.mirror.put_user(make_subscribed_user(1))
+    del mock_api.calls[:]
+    subscriptions = [{"id": "feed-0"}]
+    with mock.patch.object(api, "get_call", return_value=subscriptions) as get:
+        saved.get_groups(refresh=True)
+    assert get.call_args_list[0] == mock.call(
+        "user", "subscription", "list", userId="user-1"
+    )
+    assert get.call_args_list[1] == mock.call("feed", "getMulti", uid=["feed-0"])
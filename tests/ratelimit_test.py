@@ -0,0 +1,69 @@
+import mock
+import pytest
+
+from lumapps.client import ApiClient
+from lumapps.ratelimit import RateLimiter, SqliteTokenBucket, TokenBucket
+
+
+class Clock(object):
+    def __init__(self):
+        self.now = 1000.0
+
+    def time(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.now += seconds
+
+
+def with_clock(bucket, clock):
+    bucket._time, bucket._sleep = clock.time, clock.sleep
+    return bucket
+
+
+def test_token_bucket():
+    clock = Clock()
+    bucket = with_clock(TokenBucket(rate=2, capacity=2), clock)
+    assert bucket.acquire() == 0
+    assert bucket.acquire() == 0
+    assert bucket.acquire() == 0.5
+    clock.now += 10
+    assert bucket.acquire() == 0  # refilled up to the capacity only
+    assert bucket.acquire() == 0
+    assert bucket.acquire() == 0.5
+
+
+def test_sqlite_token_bucket(tmpdir):
+    clock = Clock()
+    path = str(tmpdir.join("buckets.db"))
+    first = with_clock(SqliteTokenBucket(path, "customer:user", rate=1), clock)
+    second = with_clock(SqliteTokenBucket(path, "customer:user", rate=1), clock)
+    other = with_clock(SqliteTokenBucket(path, "customer:feed", rate=1), clock)
+    assert first.acquire() == 0
+    assert second.acquire() == 1
+    assert other.acquire() == 0
+
+
+def test_api_client_rate_limiter():
+    limiter = RateLimiter(5, customer="1234")
+    limiter.acquire = mock.Mock()
+    client = ApiClient(token="bvazbduioanpdo2", rate_limiter=limiter)
+
+    def execute(http, num_retries):
+        for _ in range(num_retries + 1):  # a failed attempt, then a retry
+            http.request("https://lumapps.test")
+
+    request = mock.Mock(methodId="lumsites.user.list", execute=execute)
+    client._execute(request)
+    assert limiter.acquire.call_args_list == [mock.call(("user", "list"))] * 2
+    assert request.http.request.call_count == 2
+    assert limiter.get_bucket("user") is limiter.get_bucket("user")
+
+
+def test_token_bucket_capacity():
+    with pytest.raises(ValueError):
+        TokenBucket(rate=2, capacity=2).acquire(3)
+    # a bucket slower than a token per second still holds one
+    bucket = TokenBucket(rate=0.5)
+    assert bucket.capacity == 1 and bucket.acquire() == 0
+    RateLimiter(0.5).acquire(("user", "list"))
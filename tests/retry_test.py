@@ -0,0 +1,74 @@
+import httplib2
+import mock
+import pytest
+
+from googleapiclient.errors import HttpError
+
+from lumapps.client import ApiClient
+from lumapps.retry import RetryPolicy, parse_retry_after
+
+
+def http_error(status, headers=None):
+    info = {"status": status}
+    info.update(headers or {})
+    return HttpError(httplib2.Response(info), b"{}", uri="https://test")
+
+
+def make_policy(**kwargs):
+    policy = RetryPolicy(**kwargs)
+    policy._sleep = mock.Mock()
+    return policy
+
+
+def test_parse_retry_after():
+    assert parse_retry_after("12") == 12
+    assert parse_retry_after(None) is None
+    assert parse_retry_after("Wed, 21 Oct 2015 07:28:00 GMT") == 0
+    assert parse_retry_after("soon") is None
+
+
+def test_retry_policy_backoff():
+    policy = make_policy(base_delay=1, max_delay=10)
+    for attempt in range(10):
+        assert 0 <= policy.get_delay(attempt) <= min(10, 2 ** attempt)
+    assert policy.get_delay(3, retry_after=4) == 4
+    assert policy.get_delay(3, retry_after=400) == 10
+
+
+def test_retry_policy_call():
+    policy = make_policy(statuses={503: 2})
+    func = mock.Mock(side_effect=[http_error(503, {"retry-after": "3"}), "ok"])
+    assert policy.call(func) == "ok"
+    policy._sleep.assert_called_once_with(3)
+
+    func = mock.Mock(side_effect=http_error(503))
+    with pytest.raises(HttpError):
+        policy.call(func)
+    assert func.call_count == 3
+
+    func = mock.Mock(side_effect=http_error(404))
+    with pytest.raises(HttpError):
+        policy.call(func)
+    assert func.call_count == 1
+
+
+def test_retry_policy_budget():
+    policy = make_policy(budget=1)
+    func = mock.Mock(side_effect=http_error(429))
+    with pytest.raises(HttpError):
+        policy.call(func)
+    assert func.call_count == 2
+
+
+def test_retry_per_page():
+    policy = make_policy()
+    client = ApiClient(token="bvazbduioanpdo2", retry_policy=policy)
+    pages = [
+        {"items": [{"uid": 1}], "more": True, "cursor": "c1"},
+        http_error(503),
+        {"items": [{"uid": 2}], "more": False},
+    ]
+    request = mock.Mock(execute=mock.Mock(side_effect=pages))
+    client._get_api_call = mock.Mock(return_value=request)
+    assert client.get_call("user", "list") == [{"uid": 1}, {"uid": 2}]
+    assert client._get_api_call.call_count == 2
@@ -0,0 +1,155 @@
+import json
+import threading
+
+import httplib2
+import mock
+import pytest
+
+from googleapiclient.errors import HttpError
+
+from lumapps.client import ApiClient
+from lumapps.streaming import iter_items
+from lumapps.testing import MockLumApps
+
+PAGE = {
+    "cursor": "c1",
+    "items": [{"uid": i, "title": {"en": "é" * i}} for i in range(20)],
+    "more": True,
+    "count": 20,
+}
+
+
+def chunked(data, size):
+    return [data[i : i + size] for i in range(0, len(data), size)]
+
+
+def test_iter_items():
+    data = json.dumps(PAGE, indent=2).encode("utf-8")
+    for size in (1, 7, len(data)):
+        page = {}
+        assert list(iter_items(chunked(data, size), page)) == PAGE["items"]
+        assert page == {"cursor": "c1", "more": True, "count": 20}
+
+    page = {}
+    assert list(iter_items([b'{"uid": "1", "items": []}'], page)) == []
+    assert page == {"uid": "1"}
+
+    with pytest.raises(ValueError):
+        list(iter_items([b'{"items": [{"uid": 1}, '], {}))
+
+
+def test_iter_items_is_incremental():
+    def chunks():
+        yield b'{"items": [{"uid": 1}, '
+        raise AssertionError("read too far")
+
+    assert next(iter_items(chunks(), {})) == {"uid": 1}
+
+
+def test_iter_items_decodes_items_once():
+    items = [
+        {"uid": 1, "tags": ['"{[', "\\", ']}\\"'] * 50, "nested": [{"a": [1]}]},
+        "a string",
+        12345,
+        True,
+    ]
+    data = json.dumps({"items": items, "more": False}).encode("utf-8")
+    for size in (1, 3, 64):
+        with mock.patch(
+            "lumapps.streaming._DECODER.raw_decode",
+            side_effect=json.JSONDecoder().raw_decode,
+        ) as decode:
+            page = {}
+            assert list(iter_items(chunked(data, size), page)) == items
+            assert page == {"more": False}
+        # an item spanning many chunks is decoded once it is complete
+        assert decode.call_count < 40
+
+
+class FakeResponse(object):
+    def __init__(self, status_code, payload):
+        self.status_code = status_code
+        self.headers = {"content-type": "application/json"}
+        self.content = json.dumps(payload).encode("utf-8")
+        self.close = mock.Mock()
+
+    def iter_content(self, chunk_size):
+        return chunked(self.content, 5)
+
+
+def test_iter_call_stream():
+    responses = [
+        FakeResponse(200, {"items": [{"uid": 1}], "more": True, "cursor": "c1"}),
+        FakeResponse(200, {"items": [{"uid": 2}], "more": False}),
+    ]
+    session = mock.Mock(request=mock.Mock(side_effect=responses))
+    client = ApiClient(token="bvazbduioanpdo2")
+    client.get_authed_session = mock.Mock(return_value=session)
+    client._get_api_call = mock.Mock()
+    cursors = []
+    users = client.iter_call("user", "list", stream=True, checkpoint=cursors.append)
+    assert list(users) == [{"uid": 1}, {"uid": 2}]
+    assert cursors == ["c1", None]
+    assert session.request.call_args[1]["stream"]
+    assert all(r.close.called for r in responses)
+
+    # an unpaginated listing yields its items only
+    session.request.side_effect = [FakeResponse(200, {"items": [{"uid": 3}]})]
+    assert list(client.iter_call("user", "list", stream=True)) == [{"uid": 3}]
+
+    session.request.side_effect = [FakeResponse(200, {"uid": 4, "name": "x"})]
+    assert list(client.iter_call("user", "get", stream=True)) == [
+        {"uid": 4, "name": "x"}
+    ]
+
+    session.request.side_effect = [FakeResponse(404, {"error": {}})]
+    with pytest.raises(HttpError):
+        list(client.iter_call("user", "list", stream=True))
+
+
+def test_iter_call_stream_retries():
+    responses = [
+        FakeResponse(503, {"error": {}}),
+        FakeResponse(200, {"items": [{"uid": 1}], "more": False}),
+    ]
+    session = mock.Mock(request=mock.Mock(side_effect=responses))
+    client = ApiClient(token="bvazbduioanpdo2", num_retries=1)
+    client.get_authed_session = mock.Mock(return_value=session)
+    client._get_api_call = mock.Mock()
+    with mock.patch("lumapps.retry.sleep") as sleep:
+        assert list(client.iter_call("user", "list", stream=True)) == [{"uid": 1}]
+    assert session.request.call_count == 2 and sleep.call_count == 1
+
+
+def test_stream_transport():
+    proxy = httplib2.ProxyInfo(3, "proxy", 8080, proxy_user="u", proxy_pass="p")
+    http = httplib2.Http(
+        timeout=5, proxy_info=proxy, disable_ssl_certificate_validation=True
+    )
+    client = ApiClient(token="bvazbduioanpdo2", http=http)
+    assert client._can_stream()
+    assert client._stream_options() == {
+        "timeout": 5,
+        "verify": False,
+        "proxies": {"http": "http://u:p@proxy:8080", "https": "http://u:p@proxy:8080"},
+    }
+
+    # the other transports are not streamed from, but still used
+    mock_api = MockLumApps("test_data/lumapps_discovery.json", users=45)
+    api = mock_api.client(thread_safe=True)
+    assert not api._can_stream()
+    assert len(list(api.iter_call("user", "list", stream=True))) == 45
+    assert mock_api.calls == ["user/list"] * 2
+
+    # a session per thread in thread safe mode
+    client = ApiClient(token="bvazbduioanpdo2", thread_safe=True)
+    sessions = []
+    threads = [
+        threading.Thread(target=lambda: sessions.append(client.get_authed_session()))
+        for _ in range(2)
+    ]
+    for thread in threads:
+        thread.start()
+        thread.join()
+    assert sessions[0] is not sessions[1]
+    assert client.get_authed_session() is client.get_authed_session()
@@ -0,0 +1,83 @@
+import pytest
+
+from googleapiclient.errors import HttpError
+
+from lumapps.retry import RetryPolicy
+from lumapps.testing import (
+    MockLumApps,
+    MockLumAppsServer,
+    RecordingTransport,
+    ReplayTransport,
+)
+
+DISCOVERY = "test_data/lumapps_discovery.json"
+
+
+def test_mock_lumapps_pagination():
+    mock = MockLumApps(DISCOVERY, users=95, communities=3, page_size=30)
+    api = mock.client()
+    users = api.get_call("user", "list")
+    assert [u["email"] for u in users] == [
+        "user{}@example.com".format(i) for i in range(95)
+    ]
+    assert mock.calls == ["user/list"] * 4
+    assert len(list(api.iter_call("user", "list", maxResults=50))) == 95
+    assert len(api.get_call("community", "list", body={"maxResults": 2})) == 3
+    assert len(api.get_call("feed", "search", body={})) == 10
+    assert len(api.get_call("media", "list", lang="en")) == 20
+    assert api.get_call("user", "get", email="user3@example.com")["uid"] == "user-3"
+
+    saved = api.get_call("user", "save", body={"email": "new@example.com"})
+    assert api.get_call("user", "get", uid=saved["uid"])["email"] == "new@example.com"
+    with pytest.raises(HttpError):
+        api.get_call("user", "get", email="unknown@example.com")
+
+
+def test_mock_lumapps_errors():
+    mock = MockLumApps(DISCOVERY)
+    api = mock.client(retry_policy=RetryPolicy(base_delay=0))
+    api.retry_policy._sleep = lambda delay: None
+    mock.fail(503, count=2)
+    mock.fail(429, retry_after=1)
+    assert len(api.get_call("feed", "search", body={})) == 10
+    assert mock.calls == ["feed/search"]
+
+    mock.fail(500, count=10)
+    with pytest.raises(HttpError):
+        api.get_call("feed", "search", body={})
+
+    api = MockLumApps(DISCOVERY, error_rate=1, error_statuses=(502,)).client()
+    with pytest.raises(HttpError):
+        api.get_call("feed", "search", body={})
+
+
+def test_mock_lumapps_route():
+    mock = MockLumApps(DISCOVERY)
+    mock.add_route("feedtype/list", lambda params: (200, {"items": [], "more": False}))
+    assert mock.client().get_call("feedtype", "list") == []
+
+
+def test_mock_lumapps_server():
+    with MockLumAppsServer(MockLumApps(DISCOVERY, users=45)) as server:
+        assert server.base_url.startswith("http://127.0.0.1:")
+        api = server.client(thread_safe=True)
+        assert len(api.get_call("user", "list")) == 45
+        assert len(list(api.iter_call("user", "list", stream=True))) == 45
+
+
+def test_record_replay(tmpdir):
+    mock = MockLumApps(DISCOVERY, users=45)
+    recorder = RecordingTransport(mock)
+    users = mock.client(http=recorder).get_call("user", "list")
+    communities = mock.client(http=recorder).get_call(
+        "community", "list", body={"lang": "en"}
+    )
+    path = str(tmpdir.join("records.json"))
+    recorder.save(path)
+
+    replay = ReplayTransport(path)
+    api = mock.client(http=replay)
+    assert api.get_call("user", "list") == users
+    assert api.get_call("community", "list", body={"lang": "en"}) == communities
+    with pytest.raises(ValueError):
+        api.get_call("user", "list")
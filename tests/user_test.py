@@ -6,7 +6,17 @@ from apiclient.http import HttpMock
 from apiclient.discovery import build
 
 from lumapps.client import ApiClient
-from lumapps.helpers.user import build_batch, get_by_email, list_users
+from lumapps.helpers.exceptions import BadRequestException
+from lumapps.helpers.group import Group
+from lumapps.helpers.user import (
+    User,
+    build_batch,
+    get_by_email,
+    list_users,
+    plan_users,
+    sync_users,
+)
+from lumapps.testing import MockLumApps
 
 
 class UserTests(unittest.TestCase):
@@ -31,3 +41,78 @@ class UserTests(unittest.TestCase):
     def test_list_users(self):
         users = list_users(self.client)
         self.assertIsInstance(users, types.GeneratorType)
+
+
+def test_sync_users():
+    mock_api = MockLumApps("test_data/lumapps_discovery.json", users=0)
+    subscribers = []
+    mock_api.add_route(
+        "feed/subscribers/save",
+        lambda params: subscribers.append(params["body"]) or (200, None),
+    )
+    api = mock_api.client(thread_safe=True)
+    api.customer = api.customerId = "customer"
+    groups = [Group(api, uid="group-{}".format(i)) for i in range(2)]
+
+    users = [User(api, email="user{}@example.com".format(i)) for i in range(5)]
+    users.append(User(api))  # no email: cannot be saved
+    for user in users:
+        user._groups["to_add"] = list(groups)
+    users[0]._groups["to_remove"] = [Group(api, uid="group-old")]
+
+    results = sync_users(api, users, concurrency=3)
+
+    assert [r.user for r in results] == users
+    assert [r.success for r in results] == [True] * 5 + [False]
+    assert isinstance(results[-1].error, BadRequestException)
+    assert results[0].groups_added == groups
+    assert [g.uid for g in results[0].groups_removed] == ["group-old"]
+    assert users[0].uid and users[0]._groups["to_add"] == []
+    # one call per group, not per membership
+    assert mock_api.calls.count("feed/subscribers/save") == 3
+    added = {b["feed"]: sorted(b["addedUsers"]) for b in subscribers}
+    assert added["group-0"] == ["user{}@example.com".format(i) for i in range(5)]
+    removed = [b["removedUsers"] for b in subscribers if b["feed"] == "group-old"]
+    assert removed == [[users[0].uid]]
+
+    mock_api.add_route("feed/subscribers/save", lambda params: (500, {}))
+    users[1]._groups["to_add"] = list(groups)
+    results = sync_users(api, users[1:2])
+    assert results[0].saved and not results[0].success
+    assert users[1]._groups["to_add"] == groups
+
+
+def test_plan_users():
+    mock_api = MockLumApps("test_data/lumapps_discovery.json", users=4)
+    api = mock_api.client(thread_safe=True)
+    api.customer = api.customerId = "customer"
+
+    users = []
+    for i, first_name in enumerate(["First0", "Changed", "First2", "New"]):
+        user = User(api, email="user{}@example.com".format(i if i < 3 else 9))
+        user.set_attribute("firstName", first_name)
+        user.set_attribute("status", "LIVE")
+        users.append(user)
+
+    plan = plan_users(api, users, deactivate_missing=True)
+    assert dict(plan.counts()) == {
+        "create": 1,
+        "update": 1,
+        "deactivate": 1,
+        "unchanged": 2,
+    }
+    assert str(plan) == "1 create, 1 update, 1 deactivate, 2 unchanged"
+    changes = {change.action: change for change in plan}
+    assert changes["update"].diff == {"firstName": ("First1", "Changed")}
+    assert changes["deactivate"].key == "user3@example.com"
+    assert mock_api.calls == ["user/list"]  # a dry run
+
+    assert all(change.success for change in plan.apply(concurrency=2))
+    assert sorted(mock_api.calls[1:]) == ["user/save"] * 3
+    saved = mock_api.data["user"]
+    assert saved[1]["firstName"] == "Changed" and saved[1]["lastName"] == "Last1"
+    assert saved[3]["status"] == "DISABLE"
+    assert saved[4]["email"] == "user9@example.com"
+
+    plan = plan_users(api, users, deactivate_missing=True)
+    assert str(plan) == "0 create, 0 update, 0 deactivate, 4 unchanged"